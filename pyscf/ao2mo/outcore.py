@@ -2,8 +2,12 @@
 # $Id$
 # -*- coding: utf-8
 
+import os
 import time
+import hashlib
 import tempfile
+import shutil
+from collections import OrderedDict
 import numpy
 import h5py
 from pyscf import lib
@@ -16,10 +20,13 @@ from pyscf.ao2mo import incore
 IOBUF_WORDS_PREFER = 1e8 # 800 MB
 IOBLK_SIZE = 256  # MB
 IOBUF_ROW_MIN = 160
+# Max number of the half-transformed integrals kept by AO2MOSession
+SESSION_CACHE_SIZE = 4
 
 def full(mol, mo_coeff, erifile, dataname='eri_mo', tmpdir=None,
          intor='int2e_sph', aosym='s4', comp=1,
-         max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=logger.WARN, compact=True):
+         max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=logger.WARN, compact=True,
+         session=None):
     r'''Transfer arbitrary spherical AO integrals to MO integrals for given orbitals
 
     Args:
@@ -71,6 +78,11 @@ def full(mol, mo_coeff, erifile, dataname='eri_mo', tmpdir=None,
             returned MO integrals has (up to 4-fold) permutation symmetry.
             If it's False, the function will abandon any permutation symmetry,
             and return the "plain" MO integrals
+        session : :class:`AO2MOSession` object
+            If given, the half-transformed integrals of the first two sets of
+            orbitals are taken from (or saved in) the cache of the session.
+            The first transformation step is skipped if the session has the
+            half-transformed integrals of the same orbitals.
 
     Returns:
         None
@@ -100,12 +112,14 @@ def full(mol, mo_coeff, erifile, dataname='eri_mo', tmpdir=None,
     dataset ['eri_mo', 'new'], shape (3, 100, 55)
     '''
     general(mol, (mo_coeff,)*4, erifile, dataname, tmpdir,
-            intor, aosym, comp, max_memory, ioblk_size, verbose, compact)
+            intor, aosym, comp, max_memory, ioblk_size, verbose, compact,
+            session)
     return erifile
 
 def general(mol, mo_coeffs, erifile, dataname='eri_mo', tmpdir=None,
             intor='int2e_sph', aosym='s4', comp=1,
-            max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=logger.WARN, compact=True):
+            max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=logger.WARN, compact=True,
+            session=None):
     r'''For the given four sets of orbitals, transfer arbitrary spherical AO
     integrals to MO integrals on the fly.
 
@@ -256,12 +270,16 @@ def general(mol, mo_coeffs, erifile, dataname='eri_mo', tmpdir=None,
               float(nij_pair)*nkl_pair*comp, nij_pair*nkl_pair*comp*8/1e6)
 
 # transform e1
-    if tmpdir is None:
-        tmpdir = lib.param.TMPDIR
-    swapfile = tempfile.NamedTemporaryFile(dir=tmpdir)
-    fswap = h5py.File(swapfile.name, 'w')
-    half_e1(mol, mo_coeffs, fswap, intor, aosym, comp, max_memory, ioblk_size,
-            log, compact)
+    if session is not None:
+        fswap = session.load_half_e1(mo_coeffs, intor, aosym, comp, max_memory,
+                                     ioblk_size, log, compact)
+    else:
+        if tmpdir is None:
+            tmpdir = lib.param.TMPDIR
+        swapfile = tempfile.NamedTemporaryFile(dir=tmpdir)
+        fswap = h5py.File(swapfile.name, 'w')
+        half_e1(mol, mo_coeffs, fswap, intor, aosym, comp, max_memory, ioblk_size,
+                log, compact)
 
     time_1pass = log.timer('AO->MO transformation for %s 1 pass'%intor,
                            *time_0pass)
@@ -483,6 +501,137 @@ def _transpose_to_h5g(h5group, key, dat, blksize, chunks=None):
     for col0, col1 in prange(0, ncol, blksize):
         dset[col0:col1] = lib.transpose(dat[:,col0:col1])
 
+class AO2MOSession(object):
+    '''Cache the half-transformed integrals (ij|kl) on disk, so that the
+    transformations which share the first two sets of orbitals only run the
+    second half transformation.  The cached integrals are identified by the
+    content of the first two sets of orbitals, the integral type and the
+    molecule.
+
+    Attributes:
+        dirname : str
+            The directory to store the half-transformed integrals.  If it is
+            specified by the caller, the cache files are kept when the session
+            is closed and they can be reused by other sessions.  By default, a
+            temporary directory is created in lib.param.TMPDIR and removed
+            by :func:`close`.
+        max_cached : int
+            Max number of the half-transformed integrals in the cache.  The
+            least recently used ones are removed first.
+
+    Examples:
+
+    >>> mol = gto.M(atom='O 0 0 0; H 0 1 0; H 0 0 1', basis='ccpvdz')
+    >>> mf = scf.RHF(mol).run()
+    >>> co = mf.mo_coeff[:,:5]
+    >>> cv = mf.mo_coeff[:,5:]
+    >>> with ao2mo.outcore.AO2MOSession(mol) as session:
+    ...     session.general((co,cv,co,cv), 'ovov.h5')
+    ...     session.general((co,cv,cv,cv), 'ovvv.h5')  # half_e1 is skipped
+    '''
+    def __init__(self, mol, dirname=None, max_cached=SESSION_CACHE_SIZE):
+        self.mol = mol
+        self.verbose = mol.verbose
+        self.stdout = mol.stdout
+        self.max_cached = max_cached
+        if dirname is None:
+            self.dirname = tempfile.mkdtemp(prefix='ao2mo', dir=lib.param.TMPDIR)
+            self._own_dir = True
+        else:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            self.dirname = dirname
+            self._own_dir = False
+        self._cached = OrderedDict()
+
+    def __enter__(self):
+        return self
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def key(self, mo_coeffs, intor='int2e_sph', aosym='s4', comp=1, compact=True):
+        '''Content key of the half-transformed integrals of mo_coeffs[0] and
+        mo_coeffs[1]'''
+        mol = self.mol
+        aosym = _stand_sym_code(aosym)
+        compact = (compact and aosym in ('s4', 's2ij') and
+                   iden_coeffs(mo_coeffs[0], mo_coeffs[1]))
+        h = hashlib.sha1()
+        h.update(repr((intor, aosym, comp, compact, mol.cart)).encode())
+        for x in (mol._atm, mol._bas, mol._env, mo_coeffs[0], mo_coeffs[1]):
+            x = numpy.asarray(x)
+            h.update(repr(x.shape).encode())
+            h.update(numpy.ascontiguousarray(x).tobytes())
+        return h.hexdigest()
+
+    def load_half_e1(self, mo_coeffs, intor='int2e_sph', aosym='s4', comp=1,
+                     max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=None,
+                     compact=True):
+        '''The half-transformed integrals in the format of :func:`half_e1`.
+        They are generated by :func:`half_e1` if they are not in the cache.
+
+        Returns:
+            A read-only h5py File object.  The caller should close it.
+        '''
+        if verbose is None:
+            verbose = self.verbose
+        log = logger.new_logger(self, verbose)
+        key = self.key(mo_coeffs, intor, aosym, comp, compact)
+        filename = os.path.join(self.dirname, key + '.h5')
+        if key in self._cached or os.path.isfile(filename):
+            log.debug('Load half-transformed integrals %s from %s', intor, filename)
+            self._cached.pop(key, None)
+        else:
+            # The integrals are saved in a tmp file then renamed.  An
+            # interrupted transformation does not leave a broken cache file
+            ftmp = tempfile.NamedTemporaryFile(dir=self.dirname, delete=False)
+            ftmp.close()
+            try:
+                half_e1(self.mol, mo_coeffs, ftmp.name, intor, aosym, comp,
+                        max_memory, ioblk_size, log, compact)
+                os.rename(ftmp.name, filename)
+            except:
+                if os.path.isfile(ftmp.name):
+                    os.remove(ftmp.name)
+                raise
+            log.debug('Half-transformed integrals %s are saved in %s',
+                      intor, filename)
+        self._cached[key] = filename
+
+        while len(self._cached) > max(self.max_cached, 1):
+            filename_lru = self._cached.popitem(last=False)[1]
+            if os.path.isfile(filename_lru):
+                os.remove(filename_lru)
+        return h5py.File(filename, 'r')
+
+    def general(self, mo_coeffs, erifile, dataname='eri_mo',
+                intor='int2e_sph', aosym='s4', comp=1,
+                max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=None,
+                compact=True):
+        '''See :func:`general`.  The half-transformed integrals of
+        mo_coeffs[0] and mo_coeffs[1] are reused if possible.'''
+        if verbose is None:
+            verbose = self.verbose
+        return general(self.mol, mo_coeffs, erifile, dataname, None,
+                       intor, aosym, comp, max_memory, ioblk_size, verbose,
+                       compact, self)
+
+    def full(self, mo_coeff, erifile, dataname='eri_mo',
+             intor='int2e_sph', aosym='s4', comp=1,
+             max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=None,
+             compact=True):
+        '''See :func:`full`'''
+        return self.general((mo_coeff,)*4, erifile, dataname, intor, aosym,
+                            comp, max_memory, ioblk_size, verbose, compact)
+
+    def close(self):
+        '''Remove the cache files, except the ones in the directory given by
+        the caller'''
+        if self._own_dir:
+            shutil.rmtree(self.dirname, ignore_errors=True)
+        self._cached.clear()
+
+
 def full_iofree(mol, mo_coeff, intor='int2e_sph', aosym='s4', comp=1,
                 max_memory=2000, ioblk_size=IOBLK_SIZE, verbose=logger.WARN, compact=True):
     r'''Transfer arbitrary spherical AO integrals to MO integrals for given orbitals
@@ -116,6 +116,22 @@ class KnownValues(unittest.TestCase):
         eri1 = eri1.reshape(nao,nao,nao,nao)
         self.assertTrue(numpy.allclose(eri1, eriref))
 
+    def test_session(self):
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        erifile = ftmp.name
+        mo1 = mo[:,:4]
+        mo2 = mo[:,4:9]
+        mo3 = mo[:,9:15]
+        session = ao2mo.outcore.AO2MOSession(mol)
+        for mos in ((mo1,mo2,mo3,mo3), (mo1,mo2,mo2,mo1), (mo2,mo2,mo3,mo1)):
+            ref = ao2mo.general(mol, mos, compact=False)
+            session.general(mos, erifile, max_memory=10, ioblk_size=5,
+                            compact=False)
+            with h5py.File(erifile, 'r') as feri:
+                self.assertTrue(numpy.allclose(feri['eri_mo'], ref))
+        self.assertEqual(len(session._cached), 2)
+        session.close()
+
     def test_group_segs(self):
         numpy.random.seed(1)
         segs = numpy.asarray(numpy.random.random(40)*50, dtype=int)
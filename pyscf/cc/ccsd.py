@@ -9,10 +9,12 @@ RCCSD for real integrals
 (ij|kl) = (ji|kl) = (kl|ij) = ...
 '''
 
+import os
 import time
 import ctypes
 from functools import reduce
 import numpy
+import h5py
 from pyscf import gto
 from pyscf import lib
 from pyscf.lib import logger
@@ -23,46 +25,165 @@ from pyscf.mp import mp2
 
 BLKMIN = 4
 
+# Files in CCSD.restart_dir
+RESTART_ERIS = 'ccsd_eris.h5'
+RESTART_AMPS = 'ccsd_amps.h5'
+RESTART_DIIS = 'ccsd_diis.h5'
+
 # t1: ia
 # t2: ijab
 def kernel(mycc, eris, t1=None, t2=None, max_cycle=50, tol=1e-8, tolnormt=1e-6,
            verbose=logger.INFO):
     log = logger.new_logger(mycc, verbose)
 
+    cycle0 = 0
+    eold = 0
+    eccsd = 0
+    conv = False
+    restart_dir = mycc.restart_dir
+    if restart_dir is not None and t1 is None and t2 is None:
+        restart = _load_restart_amps(mycc)
+        if restart is not None:
+            cycle0, eccsd, eold, t1, t2, conv = restart
+            log.info('Restart CCSD from cycle %d  E(CCSD) = %.15g',
+                     cycle0, eccsd)
+            if conv:
+                log.info('CCSD amplitudes in the restart file are converged')
+                return conv, eccsd, t1, t2
+
     if t1 is None and t2 is None:
         t1, t2 = mycc.get_init_guess(eris)
     elif t2 is None:
         t2 = mycc.get_init_guess(eris)[1]
 
     cput1 = cput0 = (time.clock(), time.time())
-    eold = 0
     vec_old = 0
-    eccsd = 0
     if mycc.diis:
         adiis = lib.diis.DIIS(mycc, mycc.diis_file)
         adiis.space = mycc.diis_space
+        if restart_dir is not None:
+            _load_restart_diis(mycc, adiis, cycle0)
     else:
         adiis = None
 
-    conv = False
-    for istep in range(max_cycle):
-        t1new, t2new = mycc.update_amps(t1, t2, eris)
-        normt = numpy.linalg.norm(mycc.amplitudes_to_vector(t1new, t2new) -
-                                  mycc.amplitudes_to_vector(t1, t2))
-        t1, t2 = t1new, t2new
-        t1new = t2new = None
-        if mycc.diis:
-            t1, t2 = mycc.diis(t1, t2, istep, normt, eccsd-eold, adiis)
-        eold, eccsd = eccsd, mycc.energy(t1, t2, eris)
-        log.info('cycle = %d  E(CCSD) = %.15g  dE = %.9g  norm(t1,t2) = %.6g',
-                 istep+1, eccsd, eccsd - eold, normt)
-        cput1 = log.timer('CCSD iter', *cput1)
-        if abs(eccsd-eold) < tol and normt < tolnormt:
-            conv = True
-            break
+    def dump_restart(istep, eccsd, eold, t1, t2, conv, diis_snapshot):
+        # The DIIS subspace is saved before the amplitudes of the same cycle.
+        # It is ignored on restart if the amplitudes of this cycle were not
+        # saved.
+        if diis_snapshot is not None:
+            _dump_restart_diis(mycc, diis_snapshot, istep)
+        _dump_restart_amps(mycc, istep, eccsd, eold, t1, t2, conv)
+
+    with lib.call_in_background(dump_restart) as async_dump:
+        for istep in range(cycle0, max_cycle):
+            t1new, t2new = mycc.update_amps(t1, t2, eris)
+            normt = numpy.linalg.norm(mycc.amplitudes_to_vector(t1new, t2new) -
+                                      mycc.amplitudes_to_vector(t1, t2))
+            t1, t2 = t1new, t2new
+            t1new = t2new = None
+            if mycc.diis:
+                t1, t2 = mycc.diis(t1, t2, istep, normt, eccsd-eold, adiis)
+            eold, eccsd = eccsd, mycc.energy(t1, t2, eris)
+            log.info('cycle = %d  E(CCSD) = %.15g  dE = %.9g  norm(t1,t2) = %.6g',
+                     istep+1, eccsd, eccsd - eold, normt)
+            cput1 = log.timer('CCSD iter', *cput1)
+            if abs(eccsd-eold) < tol and normt < tolnormt:
+                conv = True
+            if restart_dir is not None and (conv or istep+1 == max_cycle or
+                                            (istep+1) % mycc.restart_interval == 0):
+                if adiis is not None:
+                    # Only the DIIS vectors of the last few cycles are copied
+                    diis_snapshot = adiis.snapshot()
+                else:
+                    diis_snapshot = None
+                # t1 and t2 are not modified in place by the next iteration.  They
+                # can be written in the background
+                async_dump(istep+1, eccsd, eold, t1, t2, conv, diis_snapshot)
+            if conv:
+                break
     log.timer('CCSD', *cput0)
     return conv, eccsd, t1, t2
 
+def _dump_restart_amps(mycc, cycle, eccsd, eold, t1, t2, conv=False):
+    '''Save the amplitudes of the given cycle in CCSD.restart_dir'''
+    fname = os.path.join(mycc.restart_dir, RESTART_AMPS)
+    # Write to a new file then rename it, to keep the old restart file intact
+    # if the program is terminated during the writing
+    with h5py.File(fname+'.tmp', 'w') as f:
+        f['cycle'] = cycle
+        f['e_corr'] = eccsd
+        f['e_old'] = eold
+        f['converged'] = conv
+        f['mo_coeff'] = _mo_without_core(mycc, mycc.mo_coeff)
+        f['amplitudes'] = mycc.amplitudes_to_vector(t1, t2)
+    os.rename(fname+'.tmp', fname)
+
+def _load_restart_amps(mycc):
+    '''Read the amplitudes from CCSD.restart_dir.  Return None if the
+    restart file does not exist or it is generated with different orbitals.
+    '''
+    fname = os.path.join(mycc.restart_dir, RESTART_AMPS)
+    if not os.path.isfile(fname):
+        return None
+    with h5py.File(fname, 'r') as f:
+        if not _same_orbitals(mycc, f['mo_coeff'][:]):
+            logger.warn(mycc, 'Orbitals in restart file %s are different to '
+                        'the orbitals of CCSD.  It is ignored.', fname)
+            return None
+        t1, t2 = mycc.vector_to_amplitudes(f['amplitudes'][:])
+        conv = 'converged' in f and bool(f['converged'][()])
+        return (int(f['cycle'][()]), float(f['e_corr'][()]),
+                float(f['e_old'][()]), t1, t2, conv)
+
+def _dump_restart_diis(mycc, diis_snapshot, cycle):
+    '''Add the DIIS vectors of the snapshot (see lib.diis.DIIS.snapshot) to
+    the DIIS restart file in CCSD.restart_dir'''
+    fname = os.path.join(mycc.restart_dir, RESTART_DIIS)
+    with h5py.File(fname, 'a') as f:
+        # The file is invalid until the cycle is written in the end
+        if 'cycle' in f:
+            del(f['cycle'])
+            f.flush()
+        for key, val in diis_snapshot.items():
+            if key in f and f[key].shape == val.shape:
+                f[key][:] = val
+            else:
+                if key in f:
+                    del(f[key])
+                f[key] = val
+        f['cycle'] = cycle
+
+def _load_restart_diis(mycc, adiis, cycle):
+    '''Restore the DIIS subspace from CCSD.restart_dir if it was saved in
+    the same cycle as the restored amplitudes.  Otherwise the DIIS restart
+    file is removed, and the new DIIS vectors are saved in a new file.
+    '''
+    fname = os.path.join(mycc.restart_dir, RESTART_DIIS)
+    if not os.path.isfile(fname):
+        return adiis
+    diis_cycle = None
+    if cycle > 0:
+        try:
+            with h5py.File(fname, 'r') as f:
+                if 'cycle' in f:
+                    diis_cycle = int(f['cycle'][()])
+        except (IOError, KeyError):
+            pass
+        if diis_cycle != cycle:
+            logger.warn(mycc, 'DIIS subspace in %s (cycle %s) does not match '
+                        'the amplitudes (cycle %d).  It is ignored.',
+                        fname, diis_cycle, cycle)
+    if diis_cycle == cycle:
+        return adiis.restore(fname, inplace=False)
+    else:
+        os.remove(fname)
+        return adiis
+
+def _same_orbitals(mycc, mo_coeff):
+    mo_ref = _mo_without_core(mycc, mycc.mo_coeff)
+    return (mo_coeff.shape == mo_ref.shape and
+            abs(mo_coeff - mo_ref).max() < 1e-9)
+
 
 def update_amps(mycc, t1, t2, eris):
     if mycc.cc2:
@@ -691,6 +812,10 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
         self.diis_start_energy_diff = 1e9
         self.direct = False
         self.cc2 = False
+# Directory to save the integrals, the amplitudes and the DIIS vectors.  If
+# the restart files exist, CCSD continues from the last saved cycle.
+        self.restart_dir = None
+        self.restart_interval = 1
 
         self.frozen = frozen
 
@@ -754,6 +879,9 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
         #log.info('diis_file = %s', self.diis_file)
         log.info('diis_start_cycle = %d', self.diis_start_cycle)
         log.info('diis_start_energy_diff = %g', self.diis_start_energy_diff)
+        if self.restart_dir is not None:
+            log.info('restart_dir = %s', self.restart_dir)
+            log.info('restart_interval = %d', self.restart_interval)
         log.info('max_memory %d MB (current use %d MB)',
                  self.max_memory, lib.current_memory()[0])
         return self
@@ -796,6 +924,8 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
             self.check_sanity()
         self.dump_flags()
 
+        if self.restart_dir is not None and not os.path.isdir(self.restart_dir):
+            os.makedirs(self.restart_dir)
         if eris is None:
             eris = self.ao2mo(self.mo_coeff)
         self.converged, self.e_corr, self.t1, self.t2 = \
@@ -894,6 +1024,11 @@ http://sunqm.net/pyscf/code-rule.html#api-rules for the details of API conventio
         # eris.fock = numpy.diag(self._scf.mo_energy)
         # return eris
 
+        if self.restart_dir is not None:
+            eris = _load_restart_eris(self, mo_coeff)
+            if eris is not None:
+                return eris
+
         nmo = self.nmo
         nao = self.mo_coeff.shape[0]
         nmo_pair = nmo * (nmo+1) // 2
@@ -1067,7 +1202,7 @@ def _make_eris_outcore(mycc, mo_coeff=None):
     orbo = mo_coeff[:,:nocc]
     orbv = mo_coeff[:,nocc:]
     nvpair = nvir * (nvir+1) // 2
-    eris.feri1 = lib.H5TmpFile()
+    eris.feri1 = _new_eris_file(mycc)
     eris.oooo = eris.feri1.create_dataset('oooo', (nocc,nocc,nocc,nocc), 'f8')
     eris.oovv = eris.feri1.create_dataset('oovv', (nocc,nocc,nvir,nvir), 'f8', chunks=(nocc,nocc,1,nvir))
     eris.ovoo = eris.feri1.create_dataset('ovoo', (nocc,nvir,nocc,nocc), 'f8', chunks=(nocc,1,nocc,nocc))
@@ -1090,9 +1225,14 @@ def _make_eris_outcore(mycc, mo_coeff=None):
     cput1 = time.clock(), time.time()
     if not mycc.direct:
         max_memory = max(2000, mycc.max_memory-lib.current_memory()[0])
-        eris.feri2 = lib.H5TmpFile()
-        ao2mo.full(mol, orbv, eris.feri2, max_memory=max_memory, verbose=log)
-        eris.vvvv = eris.feri2['eri_mo']
+        if mycc.restart_dir is None:
+            eris.feri2 = lib.H5TmpFile()
+            ao2mo.full(mol, orbv, eris.feri2, max_memory=max_memory, verbose=log)
+            eris.vvvv = eris.feri2['eri_mo']
+        else:
+            ao2mo.full(mol, orbv, eris.feri1, 'vvvv', max_memory=max_memory,
+                       verbose=log)
+            eris.vvvv = eris.feri1['vvvv']
         cput1 = log.timer_debug1('transforming vvvv', *cput1)
 
     fswap = lib.H5TmpFile()
@@ -1135,6 +1275,7 @@ def _make_eris_outcore(mycc, mo_coeff=None):
             save_vir_frac(p0, p1, dat)
 
     cput1 = log.timer_debug1('transforming oppp', *cput1)
+    _finalize_eris_file(mycc, eris)
     log.timer('CCSD integral transformation', *cput0)
     return eris
 
@@ -1178,7 +1319,7 @@ def _make_df_eris_outcore(mycc, mo_coeff=None):
     Lov = Lov.reshape(naux,nocc*nvir)
     Lvo = Lvo.reshape(naux,nocc*nvir)
 
-    eris.feri1 = lib.H5TmpFile()
+    eris.feri1 = _new_eris_file(mycc)
     eris.oooo = eris.feri1.create_dataset('oooo', (nocc,nocc,nocc,nocc), 'f8')
     eris.oovv = eris.feri1.create_dataset('oovv', (nocc,nocc,nvir,nvir), 'f8', chunks=(nocc,nocc,1,nvir))
     eris.ovoo = eris.feri1.create_dataset('ovoo', (nocc,nvir,nocc,nocc), 'f8', chunks=(nocc,1,nocc,nocc))
@@ -1191,9 +1332,58 @@ def _make_df_eris_outcore(mycc, mo_coeff=None):
     eris.ovvo[:] = lib.ddot(Lov.T, Lvo).reshape(nocc,nvir,nvir,nocc)
     eris.ovvv[:] = lib.ddot(Lov.T, Lvv).reshape(nocc,nvir,nvir_pair)
     eris.vvvv[:] = lib.ddot(Lvv.T, Lvv)
+    _finalize_eris_file(mycc, eris)
     log.timer('CCSD integral transformation', *cput0)
     return eris
 
+def _new_eris_file(mycc):
+    if mycc.restart_dir is None:
+        return lib.H5TmpFile()
+    else:
+        return h5py.File(os.path.join(mycc.restart_dir, RESTART_ERIS), 'w')
+
+def _finalize_eris_file(mycc, eris):
+    '''Label the integral file in CCSD.restart_dir as complete'''
+    if mycc.restart_dir is not None:
+        eris.feri1['mo_coeff'] = eris.mo_coeff
+        eris.feri1['fock'] = eris.fock
+        eris.feri1.flush()
+
+def _load_restart_eris(mycc, mo_coeff=None):
+    '''Read the MO integrals from CCSD.restart_dir.  Return None if the
+    integral file is incomplete or generated with different orbitals.
+    '''
+    fname = os.path.join(mycc.restart_dir, RESTART_ERIS)
+    if not (os.path.isfile(fname) and h5py.is_hdf5(fname)):
+        return None
+    if mo_coeff is None:
+        mo_coeff = mycc.mo_coeff
+    mo_coeff = _mo_without_core(mycc, mo_coeff)
+
+    feri1 = h5py.File(fname, 'r')
+    if ('fock' not in feri1 or
+        ('vvvv' not in feri1 and not mycc.direct) or
+        feri1['mo_coeff'].shape != mo_coeff.shape or
+        abs(feri1['mo_coeff'][:] - mo_coeff).max() > 1e-9):
+        feri1.close()
+        return None
+
+    logger.info(mycc, 'Read CCSD integrals from %s', fname)
+    eris = _ChemistsERIs()
+    eris.mol = mycc.mol
+    eris.mo_coeff = mo_coeff
+    eris.nocc = mycc.nocc
+    eris.fock = feri1['fock'][:]
+    eris.feri1 = feri1
+    eris.oooo = feri1['oooo']
+    eris.oovv = feri1['oovv']
+    eris.ovoo = feri1['ovoo']
+    eris.ovvo = feri1['ovvo']
+    eris.ovvv = feri1['ovvv']
+    if 'vvvv' in feri1:
+        eris.vvvv = feri1['vvvv']
+    return eris
+
 def _fp(nocc, nvir):
     '''Total float points'''
     return (nocc**3*nvir**2*2 + nocc**2*nvir**3*2 +     # Ftilde
@@ -7,10 +7,16 @@
 RHF-CCSD(T) for real integrals
 '''
 
+import os
+import sys
 import gc
 import time
+import shutil
+import socket
 import ctypes
+import threading
 import numpy
+import h5py
 from pyscf import lib
 from pyscf import symm
 from pyscf.lib import logger
@@ -18,8 +24,28 @@ from pyscf.cc import _ccsd
 
 # t3 as ijkabc
 
+# Files in CCSD.restart_dir
+RESTART_T = 'ccsd_t.h5'           # the sorted integrals and amplitudes
+RESTART_T_TASKS = 'ccsd_t_tasks'  # the records of the (a,b) block tasks
+# Seconds between the checks of the tasks which are executed by other workers
+TASK_POLL_INTERVAL = 10
+# Seconds between the updates of the lock files of the running tasks
+TASK_HEARTBEAT = 60
+# A lock file which is not updated in TASK_LOCK_TIMEOUT seconds is considered
+# to be held by a terminated worker
+TASK_LOCK_TIMEOUT = 600
+
 # JCP, 94, 442.  Error in Eq (1), should be [ia] >= [jb] >= [kc]
 def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
+    '''CCSD(T) correction
+
+    The (a,b) virtual blocks are the tasks of the calculation.  If
+    CCSD.restart_dir is set, the sorted integrals and the tasks are saved in
+    restart_dir and the energy of each finished task is recorded.  An
+    interrupted calculation resumes from the unfinished tasks.  Other
+    processes (e.g. on different nodes sharing the file system) can
+    join the calculation with :func:`run_worker`.
+    '''
     cpu1 = cpu0 = (time.clock(), time.time())
     log = logger.new_logger(mycc, verbose)
     if t1 is None: t1 = mycc.t1
@@ -27,19 +53,139 @@ def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
     if numpy.iscomplexobj(t2):
         raise NotImplementedError('Complex integrals are not supported in CCSD(T)')
 
+    restart_dir = getattr(mycc, 'restart_dir', None)
+    t2_sorted = False
+    if restart_dir is None:
+        feri = lib.H5TmpFile()
+        data = _make_t3_data(mycc, eris, t1, t2, feri, log)
+        t2_sorted = True
+        tasks = _TaskRecords(len(data['tasks']))
+    else:
+        if not os.path.isdir(restart_dir):
+            os.makedirs(restart_dir)
+        filename = os.path.join(restart_dir, RESTART_T)
+        taskdir = os.path.join(restart_dir, RESTART_T_TASKS)
+        if _match_t3_data(filename, t1, t2):
+            log.info('Restore CCSD(T) intermediates from %s', filename)
+            feri = h5py.File(filename, 'r')
+            data = _load_t3_data(feri)
+        else:
+            if os.path.isfile(filename):
+                os.remove(filename)
+            shutil.rmtree(taskdir, ignore_errors=True)
+            # Write to a temporary file.  The workers can only see the
+            # complete file.
+            with h5py.File(filename+'.tmp', 'w') as f:
+                data = _make_t3_data(mycc, eris, t1, t2, f, log)
+                for key in ('mo_energy', 't1T', 't2T', 'vooo', 'fovT',
+                            'orbsym', 'tasks'):
+                    f[key] = data[key]
+            os.rename(filename+'.tmp', filename)
+            feri = h5py.File(filename, 'r')
+            t2_sorted = True
+        tasks = _TaskJournal(taskdir, len(data['tasks']))
+        # Unfinished tasks of the terminated workers of the previous run
+        tasks.release()
+        log.info('%d of %d CCSD(T) tasks finished',
+                 tasks.count_done(), len(data['tasks']))
+    cpu1 = log.timer_debug1('CCSD(T) sort_eri', *cpu1)
+
+    et = None
+    while et is None:
+        _contract_tasks(data, feri['vvop'], tasks, log)
+        et = tasks.wait(log)
+    if t2_sorted:
+        t2[:] = feri['t2']
+    feri.close()
+
+    et = et * 2
+    log.timer('CCSD(T)', *cpu0)
+    log.note('CCSD(T) correction = %.15g', et)
+    return et
+
+def run_worker(restart_dir, verbose=logger.NOTE, stdout=sys.stdout):
+    '''Execute the unfinished (T) tasks of the CCSD(T) calculation which
+    saves its intermediates in restart_dir.  It returns when no task is
+    available.
+
+    Examples:
+
+    On the other nodes, after the main calculation ccsd_t.kernel started
+
+    >>> from pyscf.cc import ccsd_t
+    >>> ccsd_t.run_worker('/shared/path/of/restart_dir')
+    '''
+    log = logger.Logger(stdout, verbose)
+    filename = os.path.join(restart_dir, RESTART_T)
+    if not os.path.isfile(filename):
+        log.warn('CCSD(T) intermediates %s not found', filename)
+        return 0
+    with h5py.File(filename, 'r') as feri:
+        data = _load_t3_data(feri)
+        tasks = _TaskJournal(os.path.join(restart_dir, RESTART_T_TASKS),
+                             len(data['tasks']))
+        return _contract_tasks(data, feri['vvop'], tasks, log)
+
+def _make_t3_data(mycc, eris, t1, t2, feri, log):
+    '''Sort the integrals and amplitudes for CCsd_t_contract.  vvop is
+    saved in feri.  t2 is overwritten by t2T.  The original t2 is saved in
+    feri['t2'].'''
     nocc, nvir = t1.shape
     nmo = nocc + nvir
 
-    ftmp = lib.H5TmpFile()
-    eris_vvop = ftmp.create_dataset('vvop', (nvir,nvir,nocc,nmo), 'f8')
+    eris_vvop = feri.create_dataset('vvop', (nvir,nvir,nocc,nmo), 'f8')
+    feri['fingerprint'] = _t3_fingerprint(t1, t2)
     orbsym = _sort_eri(mycc, eris, nocc, nvir, eris_vvop, log)
 
-    ftmp['t2'] = t2  # read back late.  Cache t2T in t2 to reduce memory footprint
+    feri['t2'] = t2  # read back late.  Cache t2T in t2 to reduce memory footprint
     mo_energy, t1T, t2T, vooo, fovT = \
             _sort_t2_vooo_(mycc, orbsym, t1, t2, eris)
-    cpu1 = log.timer_debug1('CCSD(T) sort_eri', *cpu1)
 
-    cpu2 = list(cpu1)
+    # The rest 20% memory for cache b
+    mem_now = lib.current_memory()[0]
+    max_memory = max(2000, mycc.max_memory - mem_now)
+    bufsize = max(1, (max_memory*1e6/8-nocc**3*100)*.7/(nocc*nmo))
+    log.debug('max_memory %d MB (%d MB in use)', max_memory, mem_now)
+    tasks = []
+    for a0, a1 in reversed(list(lib.prange_tril(0, nvir, bufsize))):
+        tasks.append((a0, a1, a0, a1))
+        for b0, b1 in lib.prange_tril(0, a0, bufsize/6):
+            tasks.append((a0, a1, b0, b1))
+
+    return {'mo_energy': mo_energy, 't1T': t1T, 't2T': t2T, 'vooo': vooo,
+            'fovT': fovT, 'orbsym': orbsym,
+            'tasks': numpy.asarray(tasks, dtype=numpy.int32).reshape(-1,4)}
+
+def _load_t3_data(feri):
+    data = {}
+    for key in ('mo_energy', 't1T', 't2T', 'vooo', 'fovT', 'orbsym', 'tasks'):
+        data[key] = numpy.asarray(feri[key])
+    return data
+
+def _t3_fingerprint(t1, t2):
+    return numpy.array([t1.shape[0], t1.shape[1], lib.finger(t1), lib.finger(t2)])
+
+def _match_t3_data(filename, t1, t2):
+    '''Whether the file holds the intermediates of the given amplitudes'''
+    if not os.path.isfile(filename):
+        return False
+    with h5py.File(filename, 'r') as f:
+        if 'fingerprint' not in f:
+            return False
+        fp = f['fingerprint'][:]
+    return abs(fp - _t3_fingerprint(t1, t2)).max() < 1e-9
+
+def _contract_tasks(data, eris_vvop, tasks, log):
+    '''Execute the tasks (a0,a1,b0,b1) which are not finished or claimed by
+    other workers.  Returns the number of executed tasks.'''
+    mo_energy = numpy.asarray(data['mo_energy'], order='C')
+    t1T = data['t1T']
+    t2T = data['t2T']
+    vooo = data['vooo']
+    fovT = data['fovT']
+    nvir, nocc = t1T.shape
+
+    orbsym = data['orbsym']
     orbsym = numpy.hstack((numpy.sort(orbsym[:nocc]),numpy.sort(orbsym[nocc:])))
     o_ir_loc = numpy.append(0, numpy.cumsum(numpy.bincount(orbsym[:nocc], minlength=8)))
     v_ir_loc = numpy.append(0, numpy.cumsum(numpy.bincount(orbsym[nocc:], minlength=8)))
@@ -52,8 +198,8 @@ def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
     o_ir_loc = o_ir_loc.astype(numpy.int32)
     v_ir_loc = v_ir_loc.astype(numpy.int32)
     oo_ir_loc = oo_ir_loc.astype(numpy.int32)
-    et_sum = [0]
-    def contract(a0, a1, b0, b1, cache):
+    cpu2 = [time.clock(), time.time()]
+    def contract(task_id, a0, a1, b0, b1, cache):
         cache_row_a, cache_col_a, cache_row_b, cache_col_b = cache
         drv = _ccsd.libcc.CCsd_t_contract
         drv.restype = ctypes.c_double
@@ -74,41 +220,202 @@ def kernel(mycc, eris, t1=None, t2=None, verbose=logger.NOTE):
                  cache_col_a.ctypes.data_as(ctypes.c_void_p),
                  cache_row_b.ctypes.data_as(ctypes.c_void_p),
                  cache_col_b.ctypes.data_as(ctypes.c_void_p))
+        tasks.record(task_id, et)
         cpu2[:] = log.timer_debug1('contract %d:%d,%d:%d'%(a0,a1,b0,b1), *cpu2)
-        et_sum[0] += et
         return et
 
-    # The rest 20% memory for cache b
-    mem_now = lib.current_memory()[0]
-    max_memory = max(2000, mycc.max_memory - mem_now)
-    bufsize = max(1, (max_memory*1e6/8-nocc**3*100)*.7/(nocc*nmo))
-    log.debug('max_memory %d MB (%d MB in use)', max_memory, mem_now)
-    for a0, a1 in reversed(list(lib.prange_tril(0, nvir, bufsize))):
-        with lib.call_in_background(contract) as async_contract:
-            cache_row_a = numpy.asarray(eris_vvop[a0:a1,:a1], order='C')
-            if a0 == 0:
-                cache_col_a = cache_row_a
+    def load_cache(p0, p1):
+        cache_row = numpy.asarray(eris_vvop[p0:p1,:p1], order='C')
+        if p0 == 0:
+            cache_col = cache_row
+        else:
+            cache_col = numpy.asarray(eris_vvop[:p0,p0:p1], order='C')
+        return cache_row, cache_col
+
+    count = 0
+    a_block = cache_a = None
+    with lib.call_in_background(contract) as async_contract:
+        for task_id, (a0, a1, b0, b1) in enumerate(data['tasks']):
+            if not tasks.claim(task_id):
+                continue
+            # cache a is reused by the consecutive tasks of the same a-block
+            if a_block != (a0, a1):
+                a_block = (a0, a1)
+                cache_a = None
+                cache_a = load_cache(a0, a1)
+            if (b0, b1) == (a0, a1):
+                cache_b = cache_a
             else:
-                cache_col_a = numpy.asarray(eris_vvop[:a0,a0:a1], order='C')
-            async_contract(a0, a1, a0, a1, (cache_row_a,cache_col_a,
-                                            cache_row_a,cache_col_a))
-
-            for b0, b1 in lib.prange_tril(0, a0, bufsize/6):
-                cache_row_b = numpy.asarray(eris_vvop[b0:b1,:b1], order='C')
-                if b0 == 0:
-                    cache_col_b = cache_row_b
-                else:
-                    cache_col_b = numpy.asarray(eris_vvop[:b0,b0:b1], order='C')
-                async_contract(a0, a1, b0, b1, (cache_row_a,cache_col_a,
-                                                cache_row_b,cache_col_b))
-                cache_row_b = cache_col_b = None
-            cache_row_a = cache_col_a = None
-
-    t2[:] = ftmp['t2']
-    et = et_sum[0] * 2
-    log.timer('CCSD(T)', *cpu0)
-    log.note('CCSD(T) correction = %.15g', et)
-    return et
+                cache_b = load_cache(b0, b1)
+            async_contract(task_id, a0, a1, b0, b1, cache_a + cache_b)
+            cache_b = None
+            count += 1
+    return count
+
+
+class _TaskRecords(object):
+    '''Energies of the (T) tasks held in memory'''
+    def __init__(self, ntasks):
+        self.et = numpy.zeros(ntasks)
+
+    def claim(self, task_id):
+        return True
+
+    def record(self, task_id, et):
+        self.et[task_id] = et
+
+    def wait(self, log):
+        return self.et.sum()
+
+class _TaskJournal(object):
+    '''Records of the (T) tasks in a directory shared by the workers.
+
+    A task is claimed by a worker by creating its lock file exclusively.
+    While the task is executed, the worker touches the lock file every
+    TASK_HEARTBEAT seconds.  The energy of a finished task is saved in its
+    own file.  A lock file is considered dead if its worker was terminated
+    (for workers on the same host) or if it has not been touched for
+    TASK_LOCK_TIMEOUT seconds (for workers on any host).  The dead locks are
+    removed by :func:`release` and :func:`wait` so that the tasks can be
+    claimed again.
+    '''
+    def __init__(self, taskdir, ntasks):
+        self.taskdir = taskdir
+        self.ntasks = ntasks
+        if not os.path.isdir(taskdir):
+            try:
+                os.makedirs(taskdir)
+            except OSError:  # created by other workers
+                pass
+        self._owner = '%s %d' % (socket.gethostname(), os.getpid())
+        self._owned = set()
+        self._lock = threading.Lock()
+        self._heartbeat = None
+
+    def _lockfile(self, task_id):
+        return os.path.join(self.taskdir, '%d.lock' % task_id)
+
+    def _etfile(self, task_id):
+        return os.path.join(self.taskdir, '%d.et' % task_id)
+
+    def done(self, task_id):
+        return os.path.isfile(self._etfile(task_id))
+
+    def count_done(self):
+        return sum(self.done(i) for i in range(self.ntasks))
+
+    def claim(self, task_id):
+        if self.done(task_id):
+            return False
+        try:
+            fd = os.open(self._lockfile(task_id),
+                         os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError:
+            return False
+        os.write(fd, self._owner.encode())
+        os.close(fd)
+        with self._lock:
+            self._owned.add(task_id)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._touch_locks)
+                self._heartbeat.daemon = True
+                self._heartbeat.start()
+        return True
+
+    def _touch_locks(self):
+        '''Heartbeat of the tasks of this process.  It stops when this
+        process does not hold any task.'''
+        while True:
+            time.sleep(TASK_HEARTBEAT)
+            with self._lock:
+                if not self._owned:
+                    self._heartbeat = None
+                    return
+                owned = list(self._owned)
+            for task_id in owned:
+                try:
+                    os.utime(self._lockfile(task_id), None)
+                except OSError:  # released by other processes
+                    pass
+
+    def record(self, task_id, et):
+        etfile = self._etfile(task_id)
+        with open(etfile+'.tmp', 'w') as f:
+            f.write('%.17g' % et)
+        os.rename(etfile+'.tmp', etfile)
+        with self._lock:
+            self._owned.discard(task_id)
+        # The lock may have been released by other processes and claimed by
+        # another worker.
+        if self._lock_owner(task_id) == self._owner:
+            try:
+                os.remove(self._lockfile(task_id))
+            except OSError:
+                pass
+
+    def _lock_owner(self, task_id):
+        try:
+            with open(self._lockfile(task_id), 'r') as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def _dead_lock(self, task_id):
+        '''Whether the task is locked by a terminated process of this host or
+        its lock file is not touched in TASK_LOCK_TIMEOUT seconds'''
+        owner = self._lock_owner(task_id)
+        if owner is None:
+            return False
+        try:
+            host, pid = owner.split()
+            if host == socket.gethostname():
+                os.kill(int(pid), 0)
+        except ValueError:  # incomplete lock file
+            pass
+        except OSError:
+            return True
+        try:
+            mtime = os.path.getmtime(self._lockfile(task_id))
+        except OSError:
+            return False
+        return time.time() - mtime > TASK_LOCK_TIMEOUT
+
+    def _release(self, task_id):
+        try:
+            os.remove(self._lockfile(task_id))
+        except OSError:
+            pass
+
+    def release(self):
+        '''Remove the dead locks of the unfinished tasks'''
+        for task_id in range(self.ntasks):
+            if not self.done(task_id) and self._dead_lock(task_id):
+                self._release(task_id)
+
+    def wait(self, log):
+        '''Wait for the tasks executed by other workers.  Returns the sum of
+        the energies of all tasks, or None if some tasks were released because
+        their workers were terminated or stopped responding.'''
+        pending = [i for i in range(self.ntasks) if not self.done(i)]
+        while pending:
+            released = False
+            for i in pending:
+                if self._dead_lock(i) and not self.done(i):
+                    log.warn('CCSD(T) task %d was not finished by its worker', i)
+                    self._release(i)
+                    released = True
+            if released:
+                return None
+            log.debug('Waiting for %d CCSD(T) tasks of other workers',
+                      len(pending))
+            time.sleep(TASK_POLL_INTERVAL)
+            pending = [i for i in pending if not self.done(i)]
+
+        et = 0
+        for i in range(self.ntasks):
+            with open(self._etfile(i), 'r') as f:
+                et += float(f.read())
+        return et
 
 def _sort_eri(mycc, eris, nocc, nvir, vvop, log):
     cpu1 = (time.clock(), time.time())
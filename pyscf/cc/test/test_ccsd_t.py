@@ -1,4 +1,7 @@
 #!/usr/bin/env python
+import os
+import shutil
+import tempfile
 import unittest
 import numpy
 from pyscf import gto, scf, lib, symm
@@ -42,6 +45,62 @@ class KnownValues(unittest.TestCase):
         e = ccsd_t.kernel(mycc, eris, t1, t2)
         self.assertAlmostEqual(e, -8.501010390740708, 9)
 
+    def test_ccsd_t_restart(self):
+        mol = gto.M()
+        numpy.random.seed(12)
+        nocc, nvir = 5, 12
+        eris = cc.ccsd._ChemistsERIs()
+        eris.ovvv = numpy.random.random((nocc,nvir,nvir*(nvir+1)//2)) * .1
+        eris.ovoo = numpy.random.random((nocc,nvir,nocc,nocc)) * .1
+        eris.ovvo = numpy.random.random((nocc,nvir,nvir,nocc)) * .1
+        t1 = numpy.random.random((nocc,nvir)) * .1
+        t2 = numpy.random.random((nocc,nocc,nvir,nvir)) * .1
+        t2 = t2 + t2.transpose(1,0,3,2)
+        mf = scf.RHF(mol)
+        mycc = cc.CCSD(mf)
+        mycc.mo_energy = mycc._scf.mo_energy = numpy.arange(0., nocc+nvir)
+        eris.fock = numpy.diag(mycc.mo_energy)
+        mycc.restart_dir = tempfile.mkdtemp(dir=lib.param.TMPDIR)
+        t2ref = t2.copy()
+        e = ccsd_t.kernel(mycc, eris, t1, t2)
+        self.assertAlmostEqual(e, -8.501010390740708, 9)
+        self.assertAlmostEqual(abs(t2-t2ref).max(), 0, 14)
+
+        # Restore the energies of the finished tasks
+        os.remove(os.path.join(mycc.restart_dir, ccsd_t.RESTART_T_TASKS, '0.et'))
+        e = ccsd_t.kernel(mycc, eris, t1, t2)
+        self.assertAlmostEqual(e, -8.501010390740708, 9)
+        self.assertEqual(ccsd_t.run_worker(mycc.restart_dir), 0)
+        shutil.rmtree(mycc.restart_dir)
+
+    def test_task_journal(self):
+        taskdir = tempfile.mkdtemp(dir=lib.param.TMPDIR)
+        log = lib.logger.Logger(mcc.stdout, mcc.verbose)
+        tasks = ccsd_t._TaskJournal(taskdir, 3)
+        self.assertTrue(tasks.claim(0))
+        self.assertFalse(tasks.claim(0))
+        tasks.record(0, 1.5)
+        # tasks held by a live worker of another host
+        for i in (1, 2):
+            with open(tasks._lockfile(i), 'w') as f:
+                f.write('remote-host 1')
+        tasks.release()
+        self.assertTrue(os.path.isfile(tasks._lockfile(1)))
+        # the worker of task 2 stops responding
+        mtime = os.path.getmtime(tasks._lockfile(2)) - ccsd_t.TASK_LOCK_TIMEOUT - 1
+        os.utime(tasks._lockfile(2), (mtime, mtime))
+        tasks.release()
+        self.assertTrue(os.path.isfile(tasks._lockfile(1)))
+        self.assertFalse(os.path.isfile(tasks._lockfile(2)))
+        self.assertTrue(tasks.claim(2))
+        tasks.record(2, .5)
+        # the lock of task 1 is released while the worker is running
+        os.utime(tasks._lockfile(1), (mtime, mtime))
+        self.assertTrue(tasks.wait(log) is None)
+        tasks.record(1, 1.)
+        self.assertAlmostEqual(tasks.wait(log), 3., 12)
+        shutil.rmtree(taskdir)
+
     def test_ccsd_t_symm(self):
         e3a = ccsd_t.kernel(mcc, mcc.ao2mo())
         self.assertAlmostEqual(e3a, -0.003060022611584471, 9)
@@ -143,6 +143,36 @@ class KnownValues(unittest.TestCase):
         self.assertAlmostEqual(cc_scanner(mol), -76.240108935038691, 7)
         self.assertAlmostEqual(cc_scanner(mol1), -76.228972886940639, 7)
 
+    def test_restart(self):
+        import os, shutil, tempfile
+        restart_dir = tempfile.mkdtemp(dir=lib.param.TMPDIR)
+        mcc = cc.ccsd.CCSD(mf)
+        mcc.max_memory = 1
+        mcc.conv_tol = 1e-10
+        mcc.restart_dir = restart_dir
+        mcc.max_cycle = 5
+        mcc.kernel()
+        self.assertFalse(mcc.converged)
+        self.assertTrue(os.path.isfile(os.path.join(restart_dir, 'ccsd_eris.h5')))
+
+        mcc = cc.ccsd.CCSD(mf)
+        mcc.max_memory = 1
+        mcc.conv_tol = 1e-10
+        mcc.restart_dir = restart_dir
+        mcc.kernel()
+        self.assertTrue(mcc.converged)
+        self.assertAlmostEqual(mcc.e_corr, -0.2133432312951, 8)
+
+        # restart from the converged amplitudes
+        mcc = cc.ccsd.CCSD(mf)
+        mcc.max_memory = 1
+        mcc.restart_dir = restart_dir
+        mcc.max_cycle = 0
+        mcc.kernel()
+        self.assertTrue(mcc.converged)
+        self.assertAlmostEqual(mcc.e_corr, -0.2133432312951, 8)
+        shutil.rmtree(restart_dir)
+
     def test_init(self):
         from pyscf.cc import ccsd
         from pyscf.cc import uccsd
@@ -55,10 +55,22 @@ class load(ao2mo.load):
 
     with load(cderifile) as eri:
         print(eri.shape)
+
+    If the file is a .npy file, a read-only memory-mapped array is returned.
     '''
     def __init__(self, eri, dataname='j3c'):
         ao2mo.load.__init__(self, eri, dataname)
 
+    def __enter__(self):
+        if isinstance(self.eri, str) and self.eri.endswith('.npy'):
+            return numpy.load(self.eri, mmap_mode='r')
+        else:
+            return ao2mo.load.__enter__(self)
+
+    def __exit__(self, type, value, traceback):
+        if not (isinstance(self.eri, str) and self.eri.endswith('.npy')):
+            ao2mo.load.__exit__(self, type, value, traceback)
+
 
 def aug_etb_for_dfbasis(mol, dfbasis='weigend', beta=2.3, start_at='Rb'):
     '''augment weigend basis with even-tempered gaussian basis
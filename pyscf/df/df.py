@@ -7,8 +7,10 @@
 J-metric density fitting
 '''
 
+import os
 import time
 import tempfile
+import hashlib
 import numpy
 import h5py
 from pyscf import lib
@@ -55,6 +57,27 @@ class DF(lib.StreamObject):
         blockdim : int
             When reading DF integrals from disk the chunk size to load.  It is
             used to improve the IO performance.
+        cache_dir : str
+            Directory of the persistent DF integral cache.  The DF tensor is
+            saved in this directory, indexed by the hash of the molecule and
+            the auxiliary basis.  A later DF.build for the same molecule and
+            auxbasis (in the same or another process) loads the tensor from
+            the cache instead of recomputing it.  Default is
+            lib.param.DF_CACHE_DIR (environment variable PYSCF_DF_CACHE_DIR).
+            The cache is not used if cache_dir is None or _cderi_to_save is
+            assigned to a file.
+        cache_size : int
+            Max size (in MB) of the cache directory.  The least recently used
+            tensors are removed when the limit is exceeded.
+        memmap : bool
+            If the DF tensor does not fit in memory, whether to store it in a
+            raw binary (.npy) file which is accessed through numpy.memmap.
+            The blocks generated by :func:`DF.loop` are then views of the
+            mapped file without the HDF5 read and copy.  _cderi can also be
+            assigned to a .npy file to use a memory-mapped tensor.
+        prefetch : bool
+            For memory-mapped tensor, whether to load the next block in a
+            background thread during :func:`DF.loop`.
     '''
     def __init__(self, mol):
         self.mol = mol
@@ -72,6 +95,11 @@ class DF(lib.StreamObject):
         self._cderi = None
         self._call_count = 0
         self.blockdim = 240
+        self.cache_dir = lib.param.DF_CACHE_DIR
+        self.cache_size = lib.param.DF_CACHE_SIZE
+        self.memmap = False
+        self.prefetch = True
+        self._memmap_file = None
         self._keys = set(self.__dict__.keys())
 
     @property
@@ -99,6 +127,9 @@ class DF(lib.StreamObject):
             log.info('_cderi_to_save = %s', self._cderi_to_save)
         else:
             log.info('_cderi_to_save = %s', self._cderi_to_save.name)
+        if self.cache_dir:
+            log.info('cache_dir = %s  cache_size = %s MB',
+                     self.cache_dir, self.cache_size)
         return self
 
     def build(self):
@@ -117,12 +148,31 @@ class DF(lib.StreamObject):
         max_memory = (self.max_memory - lib.current_memory()[0]) * .8
         int3c = mol._add_suffix('int3c2e')
         int2c = mol._add_suffix('int2c2e')
-        if (nao_pair*naux*3*8/1e6 < max_memory and
-            not isinstance(self._cderi_to_save, str)):
+
+        use_cache = (self.cache_dir and
+                     not isinstance(self._cderi_to_save, str))
+        cderi = None
+        if use_cache:
+            key = _cache_key(mol, auxmol, int3c, int2c)
+            cderi = _cache_load(self.cache_dir, key,
+                                nao_pair*naux*8/1e6 < max_memory)
+            if cderi is not None:
+                log.info('DF integrals are loaded from cache %s',
+                         _cache_path(self.cache_dir, key))
+                self._cderi = cderi
+
+        if cderi is not None:
+            pass
+        elif (nao_pair*naux*3*8/1e6 < max_memory and
+              not isinstance(self._cderi_to_save, str)):
             self._cderi = incore.cholesky_eri(mol, int3c=int3c, int2c=int2c,
                                               auxmol=auxmol, verbose=log)
+            if use_cache:
+                _cache_save(self.cache_dir, key, self._cderi, self.cache_size, log)
         else:
-            if isinstance(self._cderi_to_save, str):
+            if use_cache:
+                cderi = _cache_tmpfile(self.cache_dir, key)
+            elif isinstance(self._cderi_to_save, str):
                 cderi = self._cderi_to_save
             else:
                 cderi = self._cderi_to_save.name
@@ -132,11 +182,32 @@ class DF(lib.StreamObject):
             outcore.cholesky_eri(mol, cderi, dataname='j3c',
                                  int3c=int3c, int2c=int2c, auxmol=auxmol,
                                  max_memory=max_memory, verbose=log)
-            if nao_pair*naux*8/1e6 < max_memory:
+            if use_cache:
+                # Keep the file open, so that the tensor stays readable when
+                # the cache entry is evicted by other processes
+                feri = h5py.File(cderi, 'r')
+                _cache_save(self.cache_dir, key, cderi, self.cache_size, log)
+                if nao_pair*naux*8/1e6 < max_memory:
+                    self._cderi = numpy.asarray(feri['j3c'])
+                    feri.close()
+                else:
+                    self._cderi = feri['j3c']
+            elif nao_pair*naux*8/1e6 < max_memory:
                 with addons.load(cderi, 'j3c') as feri:
                     cderi = numpy.asarray(feri)
-            self._cderi = cderi
+                self._cderi = cderi
+            else:
+                self._cderi = cderi
             log.timer_debug1('Generate density fitting integrals', *t0)
+
+        if self.memmap and not isinstance(self._cderi, numpy.ndarray):
+            self._memmap_file = tempfile.NamedTemporaryFile(
+                dir=lib.param.TMPDIR, suffix='.npy')
+            self._cderi = _cderi_to_memmap(self._cderi, self._memmap_file.name,
+                                           max_memory)
+            log.debug('DF integrals are mapped from file %s',
+                      self._memmap_file.name)
+            log.timer_debug1('Save DF integrals in raw binary file', *t0)
         return self
 
     def kernel(self, *args, **kwargs):
@@ -149,9 +220,26 @@ class DF(lib.StreamObject):
             blksize = self.blockdim
         with addons.load(self._cderi, 'j3c') as feri:
             naoaux = feri.shape[0]
-            for b0, b1 in self.prange(0, naoaux, blksize):
-                eri1 = numpy.asarray(feri[b0:b1], order='C')
-                yield eri1
+            if isinstance(feri, numpy.memmap):
+# The blocks of memory-mapped tensor are returned without copying.  The pages
+# of the next block are loaded in the background while the current block is
+# being processed.
+                blocks = list(self.prange(0, naoaux, blksize))
+                handler = None
+                for i, (b0, b1) in enumerate(blocks):
+                    if handler is not None:
+                        handler.join()
+                        handler = None
+                    if self.prefetch and i+1 < len(blocks):
+                        handler = lib.background_thread(_touch_pages,
+                                                        feri[slice(*blocks[i+1])])
+                    yield numpy.asarray(feri[b0:b1])
+                if handler is not None:
+                    handler.join()
+            else:
+                for b0, b1 in self.prange(0, naoaux, blksize):
+                    eri1 = numpy.asarray(feri[b0:b1], order='C')
+                    yield eri1
 
     def prange(self, start, end, step):
         self._call_count += 1
@@ -215,6 +303,108 @@ class DF(lib.StreamObject):
         pass
 
 
+def _cderi_to_memmap(cderi, npyfile, max_memory=2000):
+    '''Copy the DF tensor (HDF5 file or dataset) to a raw binary .npy file
+    and return the memory-mapped tensor'''
+    with addons.load(cderi, 'j3c') as feri:
+        naux, nao_pair = feri.shape
+        out = numpy.lib.format.open_memmap(npyfile, mode='w+', dtype=feri.dtype,
+                                           shape=(naux,nao_pair))
+        blksize = max(1, min(naux, int(max_memory*.5e6/8/nao_pair)))
+        for b0, b1 in lib.prange(0, naux, blksize):
+            out[b0:b1] = feri[b0:b1]
+        out.flush()
+    return numpy.load(npyfile, mmap_mode='r')
+
+def _touch_pages(a):
+    '''Read one element of each memory page to load the pages of the mapped
+    array'''
+    a = a.reshape(-1)
+    return a[::4096//a.itemsize].sum()
+
+def _cache_key(mol, auxmol, int3c, int2c):
+    '''Hash of the molecule, the auxiliary basis and the integrals'''
+    sha = hashlib.sha1()
+    sha.update(('%s %s %d' % (int3c, int2c, mol.cart)).encode())
+    for m in (mol, auxmol):
+        sha.update(numpy.asarray(m._atm, dtype=numpy.int32).tobytes())
+        sha.update(numpy.asarray(m._bas, dtype=numpy.int32).tobytes())
+        sha.update(numpy.asarray(m._env, dtype=numpy.double).tobytes())
+    return sha.hexdigest()
+
+def _cache_path(cache_dir, key):
+    return os.path.join(cache_dir, 'j3c-%s.h5' % key)
+
+def _cache_tmpfile(cache_dir, key):
+    '''A private file in cache_dir.  It is renamed to the cache entry when
+    the tensor is completely written, so that other processes never see a
+    partially written tensor.'''
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:  # created by another process
+            pass
+    fd, path = tempfile.mkstemp(prefix='j3c-%s.' % key, suffix='.tmp',
+                                dir=cache_dir)
+    os.close(fd)
+    return path
+
+def _cache_load(cache_dir, key, incore=True):
+    '''Read the DF tensor from cache.  Returns None if the tensor is not
+    cached.  If incore is False, an h5py dataset is returned.  The dataset
+    keeps the file open so the tensor stays readable even if the entry is
+    evicted by other processes.'''
+    path = _cache_path(cache_dir, key)
+    try:
+        feri = h5py.File(path, 'r')
+        os.utime(path, None)  # LRU
+        if incore:
+            cderi = numpy.asarray(feri['j3c'])
+            feri.close()
+        else:
+            cderi = feri['j3c']
+    except (IOError, OSError, KeyError):
+        return None
+    return cderi
+
+def _cache_save(cache_dir, key, cderi, max_size, log):
+    '''Move the DF tensor into the cache and evict the least recently used
+    entries.  cderi can be an array or the filename returned by
+    _cache_tmpfile.  Returns the filename of the cache entry.'''
+    if isinstance(cderi, str):
+        tmpfile = cderi
+    else:
+        tmpfile = _cache_tmpfile(cache_dir, key)
+        with h5py.File(tmpfile, 'w') as f:
+            f['j3c'] = cderi
+    path = _cache_path(cache_dir, key)
+    os.rename(tmpfile, path)  # atomic in POSIX
+    log.debug('DF integrals are saved in cache %s', path)
+
+    entries = []
+    for f in os.listdir(cache_dir):
+        if f.startswith('j3c-') and f.endswith('.h5'):
+            fpath = os.path.join(cache_dir, f)
+            try:
+                stat = os.stat(fpath)
+            except OSError:  # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fpath))
+    entries.sort()
+    size = sum(x[1] for x in entries) / 1e6
+    for mtime, fsize, fpath in entries:
+        if size <= max_size:
+            break
+        if fpath != path:
+            try:
+                os.remove(fpath)
+                log.debug1('Remove DF cache %s', fpath)
+            except OSError:
+                pass
+            size -= fsize / 1e6
+    return path
+
+
 class DF4C(DF):
     '''Relativistic 4-component'''
     def build(self):
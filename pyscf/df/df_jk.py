@@ -196,6 +196,7 @@ def get_jk(dfobj, dm, hermi=1, vhfopt=None, with_j=True, with_k=True):
 
         dmtril = []
         orbo = []
+        orbn = []
         for k in range(nset):
             if with_j:
                 dmtril.append(lib.pack_tril(dms[k]+dms[k].T))
@@ -205,8 +206,26 @@ def get_jk(dfobj, dm, hermi=1, vhfopt=None, with_j=True, with_k=True):
             c = numpy.einsum('pi,i->pi', mo_coeff[k][:,mo_occ[k]>0],
                              numpy.sqrt(mo_occ[k][mo_occ[k]>0]))
             orbo.append(numpy.asarray(c, order='F'))
+# Negative occupancies come from the eigen-decomposition of the change of
+# density matrix (see scf.hf._incremental_jk)
+            c = numpy.einsum('pi,i->pi', mo_coeff[k][:,mo_occ[k]<0],
+                             numpy.sqrt(-mo_occ[k][mo_occ[k]<0]))
+            orbn.append(numpy.asarray(c, order='F'))
 
         buf = numpy.empty((dfobj.blockdim*nao,nao))
+        def contract_k(eri1, orb):
+            naux = eri1.shape[0]
+            nocc = orb.shape[1]
+            buf1 = buf[:naux*nocc]
+            fdrv(ftrans, fmmm,
+                 buf1.ctypes.data_as(ctypes.c_void_p),
+                 eri1.ctypes.data_as(ctypes.c_void_p),
+                 orb.ctypes.data_as(ctypes.c_void_p),
+                 ctypes.c_int(naux), ctypes.c_int(nao),
+                 (ctypes.c_int*4)(0, nocc, 0, nao),
+                 null, ctypes.c_int(0))
+            return lib.dot(buf1.T, buf1)
+
         for eri1 in dfobj.loop():
             naux, nao_pair = eri1.shape
             assert(nao_pair == nao*(nao+1)//2)
@@ -215,17 +234,10 @@ def get_jk(dfobj, dm, hermi=1, vhfopt=None, with_j=True, with_k=True):
                     rho = numpy.einsum('px,x->p', eri1, dmtril[k])
                     vj[k] += numpy.einsum('p,px->x', rho, eri1)
 
-                nocc = orbo[k].shape[1]
-                if nocc > 0:
-                    buf1 = buf[:naux*nocc]
-                    fdrv(ftrans, fmmm,
-                         buf1.ctypes.data_as(ctypes.c_void_p),
-                         eri1.ctypes.data_as(ctypes.c_void_p),
-                         orbo[k].ctypes.data_as(ctypes.c_void_p),
-                         ctypes.c_int(naux), ctypes.c_int(nao),
-                         (ctypes.c_int*4)(0, nocc, 0, nao),
-                         null, ctypes.c_int(0))
-                    vk[k] += lib.dot(buf1.T, buf1)
+                if orbo[k].shape[1] > 0:
+                    vk[k] += contract_k(eri1, orbo[k])
+                if orbn[k].shape[1] > 0:
+                    vk[k] -= contract_k(eri1, orbn[k])
             t1 = log.timer_debug1('jk', *t1)
     else:
         #:vk = numpy.einsum('pij,jk->pki', cderi, dm)
@@ -236,6 +248,7 @@ def get_jk(dfobj, dm, hermi=1, vhfopt=None, with_j=True, with_k=True):
         buf = numpy.empty((2,dfobj.blockdim,nao,nao))
         for eri1 in dfobj.loop():
             naux, nao_pair = eri1.shape
+            buf2 = lib.unpack_tril(eri1, out=buf[1])
             for k in range(nset):
                 buf1 = buf[0,:naux]
                 fdrv(ftrans, fmmm,
@@ -247,7 +260,6 @@ def get_jk(dfobj, dm, hermi=1, vhfopt=None, with_j=True, with_k=True):
                     rho = numpy.einsum('kii->k', buf1)
                     vj[k] += numpy.einsum('p,px->x', rho, eri1)
 
-                buf2 = lib.unpack_tril(eri1, out=buf[1])
                 vk[k] += lib.dot(buf1.reshape(-1,nao).T,
                                  buf2.reshape(-1,nao))
             t1 = log.timer_debug1('jk', *t1)
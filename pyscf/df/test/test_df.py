@@ -208,6 +208,42 @@ class KnowValues(unittest.TestCase):
         self.assertTrue(auxbasis['O'] == 'cc-pvdz-jkfit')
         self.assertTrue(isinstance(auxbasis['He'], list))
 
+    def test_cderi_cache(self):
+        import os
+        import shutil
+        cache_dir = tempfile.mkdtemp()
+        try:
+            dfobj = df.DF(mol)
+            dfobj.cache_dir = cache_dir
+            cderi0 = dfobj.build()._cderi
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            dfobj = df.DF(mol)
+            dfobj.cache_dir = cache_dir
+            dfobj.max_memory = 0
+            dfobj.build()
+            self.assertTrue(numpy.allclose(numpy.asarray(dfobj._cderi), cderi0))
+
+            mol1 = mol.copy()
+            mol1.set_geom_('O 0 0 .1; H 0 -0.757 0.587; H 0 0.757 0.587')
+            dfobj = df.DF(mol1)
+            dfobj.cache_dir = cache_dir
+            dfobj.cache_size = 0
+            dfobj.build()
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            # Out-of-core tensor stays readable after the cache entry is
+            # evicted by another process
+            dfobj = df.DF(mol)
+            dfobj.cache_dir = cache_dir
+            dfobj.max_memory = 0
+            dfobj.build()
+            for f in os.listdir(cache_dir):
+                os.remove(os.path.join(cache_dir, f))
+            self.assertTrue(numpy.allclose(numpy.asarray(dfobj._cderi), cderi0))
+        finally:
+            shutil.rmtree(cache_dir)
+
 
 if __name__ == "__main__":
     print("Full Tests for df")
@@ -118,6 +118,24 @@ class KnowValues(unittest.TestCase):
         mf._cderi = (u[:,idx] * numpy.sqrt(w[idx])).T.copy()
         self.assertAlmostEqual(mf.kernel(), -76.026765673110447, 9)
 
+    def test_memmap_cderi(self):
+        mf = scf.density_fit(scf.RHF(mol), auxbasis='weigend')
+        mf.with_df.memmap = True
+        mf.with_df.max_memory = 0
+        mf.with_df.blockdim = 20
+        self.assertAlmostEqual(mf.scf(), -76.025936299702536, 9)
+        self.assertTrue(isinstance(mf.with_df._cderi, numpy.memmap))
+
+        nao = mol.nao_nr()
+        numpy.random.seed(1)
+        dm = numpy.random.random((2,nao,nao))
+        vj0, vk0 = mf.with_df.get_jk(dm, hermi=0)
+        mf.with_df.prefetch = False
+        mf.with_df._cderi = numpy.asarray(mf.with_df._cderi)
+        vj1, vk1 = mf.with_df.get_jk(dm, hermi=0)
+        self.assertTrue(numpy.allclose(vj0, vj1))
+        self.assertTrue(numpy.allclose(vk0, vk1))
+
 
 if __name__ == "__main__":
     print("Full Tests for df")
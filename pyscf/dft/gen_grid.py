@@ -21,6 +21,8 @@ from pyscf.dft import radi
 
 libdft = lib.load_library('libdft')
 BLKSIZE = 128  # needs to be the same to lib/gto/grid_ao_drv.c
+# Edge length (in Bohr) of the boxes used to group grids in space
+GROUP_BOX_SIZE = 1.2
 
 # ~= (L+1)**2/3
 LEBEDEV_ORDER = {
@@ -195,10 +197,10 @@ def stratmann(g):
 def original_becke(g):
     '''Becke, JCP, 88, 2547 (1988)'''
 #    This funciton has been optimized in the C code VXCgen_grid
-#    g = (3 - g**2) * g * .5
-#    g = (3 - g**2) * g * .5
-#    g = (3 - g**2) * g * .5
-#    return g
+    g = (3 - g**2) * g * .5
+    g = (3 - g**2) * g * .5
+    g = (3 - g**2) * g * .5
+    return g
 
 def gen_atomic_grids(mol, atom_grid={}, radi_method=radi.gauss_chebyshev,
                      level=3, prune=nwchem_prune, **kwargs):
@@ -298,22 +300,8 @@ def gen_partition(mol, atom_grids_tab,
                                ctypes.c_int(mol.natm), ctypes.c_int(ngrids))
             return pbecke
     else:
-        def gen_grid_partition(coords):
-            ngrids = coords.shape[0]
-            grid_dist = numpy.empty((mol.natm,ngrids))
-            for ia in range(mol.natm):
-                dc = coords - atm_coords[ia]
-                grid_dist[ia] = numpy.sqrt(numpy.einsum('ij,ij->i',dc,dc))
-            pbecke = numpy.ones((mol.natm,ngrids))
-            for i in range(mol.natm):
-                for j in range(i):
-                    g = 1/atm_dist[i,j] * (grid_dist[i]-grid_dist[j])
-                    if f_radii_adjust is not None:
-                        g = f_radii_adjust(i, j, g)
-                    g = becke_scheme(g)
-                    pbecke[i] *= .5 * (1-g)
-                    pbecke[j] *= .5 * (1+g)
-            return pbecke
+        return _gen_partition_screened(mol, atom_grids_tab, radii_adjust,
+                                       f_radii_adjust, becke_scheme)
 
     coords_all = []
     weights_all = []
@@ -326,6 +314,156 @@ def gen_partition(mol, atom_grids_tab,
         weights_all.append(weights)
     return numpy.vstack(coords_all), numpy.hstack(weights_all)
 
+# Upper bound of the Becke cell function below which an atom is excluded from
+# the partition of a grid
+CELL_FUNCTION_CUTOFF = 1e-15
+
+def _gen_partition_screened(mol, atom_grids_tab, radii_adjust, f_radii_adjust,
+                            becke_scheme=original_becke):
+    '''Becke partition for arbitrary becke_scheme and radii_adjust.
+
+    The cell function P_i(r) = \\prod_k s(nu_ik) is bounded by the factor of
+    the atom nearest to r.  P_i is evaluated only on the grids where this bound
+    is larger than CELL_FUNCTION_CUTOFF.  If the becke_scheme saturates (e.g.
+    stratmann), the factors of distant atoms are exactly 1 and the atom pairs
+    beyond the corresponding distance are skipped.  Grids of different atoms
+    are partitioned in parallel threads.
+    '''
+    natm = mol.natm
+    atm_coords = numpy.asarray(mol.atom_coords() , order='C')
+    atm_dist = gto.inter_distance(mol)
+    inv_dist = numpy.zeros_like(atm_dist)
+    inv_dist[atm_dist > 0] = 1. / atm_dist[atm_dist > 0]
+
+    if f_radii_adjust is None:
+        a = numpy.zeros((natm,natm))
+        def fadjust(i, k, g):
+            return g
+    elif (radii_adjust is radi.treutler_atomic_radii_adjust or
+          radii_adjust is radi.becke_atomic_radii_adjust):
+# Both functions are g + a[i,k] * (1-g**2)
+        a = numpy.asarray([[f_radii_adjust(i, k, 0) for k in range(natm)]
+                           for i in range(natm)])
+        def fadjust(i, k, g):
+            return g + a[i,k] * (1-g**2)
+    else:
+        a = None
+        def fadjust(i, k, g):
+            ii, kk, g = numpy.broadcast_arrays(i, k, g)
+            key = (ii * natm + kk).ravel()
+            g = g.ravel()
+            out = numpy.empty(g.size)
+            idx = numpy.argsort(key, kind='mergesort')
+            uniq, p0 = numpy.unique(key[idx], return_index=True)
+            p1 = numpy.append(p0[1:], key.size)
+            for ik, i0, i1 in zip(uniq, p0, p1):
+                sub = idx[i0:i1]
+                out[sub] = f_radii_adjust(ik//natm, ik%natm, g[sub])
+            return out.reshape(ii.shape)
+
+    def cell_factor(i, k, mu):
+        '''Factor of atom k in P_i.  Following the convention of the pair
+        loop i > k in the Becke partition, nu is computed with
+        fadjust(max(i,k), min(i,k))'''
+        lower = numpy.asarray(i > k)
+        if lower.all():
+            g = becke_scheme(fadjust(i, k, mu))
+            return .5 * (1 - numpy.asarray(g))
+        elif not lower.any():
+            g = becke_scheme(fadjust(k, i, -mu))
+            return .5 * (1 + numpy.asarray(g))
+        else:
+            ii, kk, lower = numpy.broadcast_arrays(i, k, lower)
+            upper = ~lower
+            fac = numpy.empty(lower.shape)
+            g = becke_scheme(fadjust(ii[lower], kk[lower], mu[lower]))
+            fac[lower] = .5 * (1 - numpy.asarray(g))
+            g = becke_scheme(fadjust(kk[upper], ii[upper], -mu[upper]))
+            fac[upper] = .5 * (1 + numpy.asarray(g))
+            return fac
+
+    pair_cutoff = _becke_pair_cutoff(becke_scheme, a)
+
+    def partition_blk(coords, ia):
+        ngrids = coords.shape[0]
+        grid_dist = numpy.empty((natm,ngrids))
+        for i in range(natm):
+            dc = coords - atm_coords[i]
+            grid_dist[i] = numpy.sqrt(numpy.einsum('ij,ij->i',dc,dc))
+
+        # P_i <= s(nu_ik) where k is the atom nearest to the grid
+        nearest = grid_dist.argmin(axis=0)
+        atm_idx = numpy.arange(natm).reshape(-1,1)
+        mu = (grid_dist - grid_dist[nearest,numpy.arange(ngrids)])
+        mu *= inv_dist[atm_idx,nearest]
+        mask = atm_idx != nearest
+        bound = numpy.ones((natm,ngrids))
+        ii, kk = numpy.broadcast_arrays(atm_idx, nearest)
+        bound[mask] = cell_factor(ii[mask], kk[mask], mu[mask])
+        mu = mask = ii = kk = None
+
+        pbecke = numpy.zeros((natm,ngrids))
+        for i in range(natm):
+            cols = numpy.where(bound[i] > CELL_FUNCTION_CUTOFF)[0]
+            if cols.size == 0:
+                continue
+            dist_i = grid_dist[i,cols]
+            if pair_cutoff is None:
+                ks = numpy.arange(natm)
+            else:
+                ks = numpy.where(atm_dist[i] < dist_i.max()*pair_cutoff)[0]
+            ks = ks[ks != i]
+            dist_k = grid_dist[ks[:,None],cols]
+            mu = (dist_i - dist_k) * inv_dist[i,ks].reshape(-1,1)
+            p = numpy.ones(cols.size)
+            klo = ks < i
+            if klo.any():
+                p *= cell_factor(i, ks[klo].reshape(-1,1), mu[klo]).prod(axis=0)
+            if not klo.all():
+                khi = ~klo
+                p *= cell_factor(i, ks[khi].reshape(-1,1), mu[khi]).prod(axis=0)
+            pbecke[i,cols] = p
+        return pbecke[ia] / pbecke.sum(axis=0)
+
+    blksize = max(BLKSIZE, int(2e6/max(natm,1)))
+    def partition_atom(ia):
+        coords, vol = atom_grids_tab[mol.atom_symbol(ia)]
+        coords = coords + atm_coords[ia]
+        weights = numpy.empty_like(vol)
+        for p0, p1 in prange(0, len(vol), blksize):
+            weights[p0:p1] = vol[p0:p1] * partition_blk(coords[p0:p1], ia)
+        return coords, weights
+
+    results = lib.map_with_threads(partition_atom, range(natm))
+    coords_all = [x[0] for x in results]
+    weights_all = [x[1] for x in results]
+    return numpy.vstack(coords_all), numpy.hstack(weights_all)
+
+def _becke_pair_cutoff(becke_scheme, a):
+    '''The ratio R_ik/r_i beyond which the factor of atom k in P_i is exactly 1.
+    Returns None if the becke_scheme does not saturate below |nu| = 1.
+
+    Since mu_ik <= 2r_i/R_ik - 1,  s(nu_ik) = 1 for all r_i if
+    nu(mu = 2r_i/R_ik-1) <= -nu0 where becke_scheme(nu) = -1 for nu <= -nu0.
+    '''
+    if a is None:  # unknown radii_adjust function
+        return None
+    x = numpy.linspace(0, 1, 1001)
+    saturated = numpy.where((numpy.asarray(becke_scheme(-x)) <= -1) &
+                            (numpy.asarray(becke_scheme(x)) >= 1))[0]
+    if saturated.size == 0 or saturated[0] == len(x)-1:
+        return None
+    nu0 = x[saturated[0]]
+    amax = abs(a).max()
+# nu = mu + amax*(1-mu**2) is monotonic for mu in [-1,0]
+    mu = -x
+    nu = mu + amax * (1-mu**2)
+    idx = numpy.where(nu <= -nu0)[0]
+    if idx.size == 0 or idx[0] == len(x)-1:
+        return None
+    mu_cut = x[idx[0]]
+    return 2. / (1 - mu_cut)
+
 def make_mask(mol, coords, relativity=0, shls_slice=None, verbose=None):
     '''Mask to indicate whether a shell is zero on grid
 
@@ -447,12 +585,21 @@ class Grids(lib.StreamObject):
         self.prune = nwchem_prune
         self.symmetry = mol.symmetry
         self.atom_grid = {}
+        # Sort the grids in space (in octree order) so that the grids in one
+        # block are close to each other.  It reduces the number of significant
+        # shells per block for large molecules
+        self.sort_grids = False
         self.non0tab = None
 
 ##################################################
 # don't modify the following attributes, they are not input options
         self.coords  = None
         self.weights = None
+        # Atomic grids only depend on the element and the grid settings. They
+        # are cached and reused when the molecule is changed (e.g. in geometry
+        # optimization)
+        self._atom_grids_cache = {}
+        self._partition_cache = None
         self._keys = set(self.__dict__.keys())
 
     def dump_flags(self):
@@ -461,6 +608,7 @@ class Grids(lib.StreamObject):
         logger.info(self, 'pruning grids: %s', self.prune)
         logger.info(self, 'grids dens level: %d', self.level)
         logger.info(self, 'symmetrized grids: %s', self.symmetry)
+        logger.info(self, 'spatially sorted grids: %s', self.sort_grids)
         if self.radii_adjust is not None:
             logger.info(self, 'atomic radii adjust function: %s',
                         self.radii_adjust)
@@ -476,10 +624,35 @@ class Grids(lib.StreamObject):
         atom_grids_tab = self.gen_atomic_grids(mol, self.atom_grid,
                                                self.radi_method,
                                                self.level, self.prune, **kwargs)
-        self.coords, self.weights = \
-                self.gen_partition(mol, atom_grids_tab,
-                                   self.radii_adjust, self.atomic_radii,
-                                   self.becke_scheme)
+
+        # Reuse the partition if neither the geometry nor the settings changed
+        key = (self._settings_key(self.atom_grid, self.radi_method, self.level,
+                                  self.prune, **kwargs),
+               self.radii_adjust, self.becke_scheme, self.sort_grids)
+        if self.atomic_radii is None:
+            key += (None,)
+        else:
+            key += (numpy.asarray(self.atomic_radii).tobytes(),)
+        atm_coords = mol.atom_coords()
+        charges = mol.atom_charges()
+        cache = self._partition_cache
+        if (cache is not None and cache[0] == key and
+            cache[1].shape == atm_coords.shape and
+            numpy.array_equal(cache[1], atm_coords) and
+            numpy.array_equal(cache[2], charges)):
+            self.coords, self.weights = cache[3], cache[4]
+            logger.debug(self, 'Reuse the Becke partition of last build')
+        else:
+            self.coords, self.weights = \
+                    self.gen_partition(mol, atom_grids_tab,
+                                       self.radii_adjust, self.atomic_radii,
+                                       self.becke_scheme)
+            if self.sort_grids:
+                idx = arg_group_grids(mol, self.coords)
+                self.coords = self.coords[idx]
+                self.weights = self.weights[idx]
+            self._partition_cache = (key, atm_coords, charges,
+                                     self.coords, self.weights)
         if with_non0tab:
             self.non0tab = self.make_mask(mol, self.coords)
         else:
@@ -499,7 +672,24 @@ class Grids(lib.StreamObject):
         if radi_method is None: radi_method = self.radi_method
         if level is None: level = self.level
         if prune is None: prune = self.prune
-        return gen_atomic_grids(mol, atom_grid, self.radi_method, level, prune, **kwargs)
+
+        key = self._settings_key(atom_grid, self.radi_method, level, prune,
+                                 **kwargs)
+        cached = self._atom_grids_cache.get(key, {})
+        symbs = set([mol.atom_symbol(ia) for ia in range(mol.natm)])
+        if not symbs.issubset(cached):
+            tab = gen_atomic_grids(mol, atom_grid, self.radi_method, level,
+                                   prune, **kwargs)
+            cached = dict(cached)
+            cached.update(tab)
+            self._atom_grids_cache = {key: cached}
+        return dict([(symb, cached[symb]) for symb in symbs])
+
+    def _settings_key(self, atom_grid, radi_method, level, prune, **kwargs):
+        if isinstance(atom_grid, dict):
+            atom_grid = sorted(atom_grid.items())
+        return (repr(atom_grid), radi_method, level, prune,
+                repr(sorted(kwargs.items())))
 
     @lib.with_doc(gen_partition.__doc__)
     def gen_partition(self, mol, atom_grids_tab,
@@ -517,6 +707,27 @@ class Grids(lib.StreamObject):
         return make_mask(mol, coords, relativity, shls_slice, verbose)
 
 
+def arg_group_grids(mol, coords, box_size=GROUP_BOX_SIZE):
+    '''Partition the space into boxes of size box_size and order the grids
+    box-by-box along the Z-order (Morton) curve, which is the depth-first
+    traversal order of an octree.  Grids of one block are then spatially
+    close and only a few shells are significant on them.
+
+    Returns:
+        The indices to sort the grids
+    '''
+    coords = numpy.asarray(coords)
+    if coords.shape[0] == 0:
+        return numpy.zeros(0, dtype=int)
+    ibox = numpy.asarray((coords - coords.min(axis=0)) / box_size,
+                         dtype=numpy.int64)
+    nbits = max(int(ibox.max()).bit_length(), 1)
+    code = numpy.zeros(coords.shape[0], dtype=numpy.int64)
+    for bit in range(min(nbits, 21)):
+        for x in range(3):
+            code |= ((ibox[:,x] >> bit) & 1) << (3*bit+x)
+    return numpy.argsort(code, kind='mergesort')
+
 
 def _default_rad(nuc, level=3):
     '''Number of radial grids '''
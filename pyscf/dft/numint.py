@@ -3,6 +3,7 @@
 # Author: Qiming Sun <osirpt.sun@gmail.com>
 #
 
+import copy
 import ctypes
 import numpy
 import scipy.linalg
@@ -22,6 +23,11 @@ OCCDROP = 1e-12
 # If the number of AOs in the system is less than this value, all tensors are
 # treated as dense quantities and contracted by dgemm directly.
 SWITCH_SIZE = 800
+# In the screened block loop, AO values are evaluated for the significant
+# shells only if the fraction of significant AOs of a block is below this value
+SPARSE_AO_CUTOFF = .7
+# Number of BLKSIZE blocks in one macro block of the screened block loop
+SPARSE_NBLK = 8
 
 def eval_ao(mol, coords, deriv=0, shls_slice=None,
             non0tab=None, out=None, verbose=None):
@@ -586,6 +592,21 @@ def nr_vxc(mol, grids, xc_code, dms, spin=0, relativity=0, hermi=0,
     return ni.nr_vxc(mol, grids, xc_code, dms, spin, relativity,
                      hermi, max_memory, verbose)
 
+def _shell_to_ao_index(ao_loc, shl_idx):
+    '''AO indices of the given shells'''
+    ao_loc = numpy.asarray(ao_loc)
+    nf = ao_loc[shl_idx+1] - ao_loc[shl_idx]
+    offsets = numpy.repeat(ao_loc[shl_idx] - (numpy.cumsum(nf) - nf), nf)
+    return numpy.arange(nf.sum()) + offsets
+
+def _add_sub_mat(mat, sub, ao_idx):
+    '''mat[ao_idx[:,None],ao_idx] += sub'''
+    if ao_idx is None:
+        mat += sub
+    else:
+        lib.takebak_2d(mat, sub, ao_idx, ao_idx)
+    return mat
+
 def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
            max_memory=2000, verbose=None):
     '''Calculate RKS XC functional and potential matrix on given meshgrids
@@ -640,11 +661,13 @@ def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
     aow = None
     if xctype == 'LDA':
         ao_deriv = 0
-        for ao, mask, weight, coords \
-                in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
+        for submol, ao_idx, ao, mask, weight, coords \
+                in ni.screened_block_loop(mol, grids, nao, ao_deriv, max_memory):
             aow = numpy.ndarray(ao.shape, order='F', buffer=aow)
+            sub_slice = (0, submol.nbas)
+            sub_loc = submol.ao_loc_nr()
             for idm in range(nset):
-                rho = make_rho(idm, ao, mask, 'LDA')
+                rho = make_rho(idm, ao, mask, 'LDA', submol, ao_idx)
                 exc, vxc = ni.eval_xc(xc_code, rho, 0, relativity, 1, verbose)[:2]
                 vrho = vxc[0]
                 den = rho * weight
@@ -652,16 +675,19 @@ def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
                 excsum[idm] += numpy.dot(den, exc)
                 # *.5 because vmat + vmat.T
                 aow = numpy.einsum('pi,p->pi', ao, .5*weight*vrho, out=aow)
-                vmat[idm] += _dot_ao_ao(mol, ao, aow, mask, shls_slice, ao_loc)
-                rho = exc = vxc = vrho = None
+                v = _dot_ao_ao(submol, ao, aow, mask, sub_slice, sub_loc)
+                _add_sub_mat(vmat[idm], v, ao_idx)
+                rho = exc = vxc = vrho = v = None
     elif xctype == 'GGA':
         ao_deriv = 1
-        for ao, mask, weight, coords \
-                in ni.block_loop(mol, grids, nao, ao_deriv, max_memory):
+        for submol, ao_idx, ao, mask, weight, coords \
+                in ni.screened_block_loop(mol, grids, nao, ao_deriv, max_memory):
             ngrid = weight.size
             aow = numpy.ndarray(ao[0].shape, order='F', buffer=aow)
+            sub_slice = (0, submol.nbas)
+            sub_loc = submol.ao_loc_nr()
             for idm in range(nset):
-                rho = make_rho(idm, ao, mask, 'GGA')
+                rho = make_rho(idm, ao, mask, 'GGA', submol, ao_idx)
                 exc, vxc = ni.eval_xc(xc_code, rho, 0, relativity, 1, verbose)[:2]
                 den = rho[0] * weight
                 nelec[idm] += den.sum()
@@ -669,8 +695,9 @@ def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
 # ref eval_mat function
                 wv = _rks_gga_wv0(rho, vxc, weight)
                 aow = numpy.einsum('npi,np->pi', ao, wv, out=aow)
-                vmat[idm] += _dot_ao_ao(mol, ao[0], aow, mask, shls_slice, ao_loc)
-                rho = exc = vxc = wv = None
+                v = _dot_ao_ao(submol, ao[0], aow, mask, sub_slice, sub_loc)
+                _add_sub_mat(vmat[idm], v, ao_idx)
+                rho = exc = vxc = wv = v = None
     elif xctype == 'NLC':
         nlc_pars = ni.nlc_coeff(xc_code[:-6])
         if nlc_pars == [0,0]:
@@ -750,6 +777,106 @@ def nr_rks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
         vmat = vmat.reshape(nao,nao)
     return nelec, excsum, vmat
 
+def nr_rks_incremental(ni, mol, grids, xc_code, dm, ddm=None, xc_state=None,
+                       tol=1e-8, relativity=0, max_memory=2000, verbose=None):
+    '''Incremental version of nr_rks for one density matrix.
+
+    The XC potential on the grids, the energy density and the XC matrix of
+    the last call are kept in xc_state.  A grid block is recomputed only if
+    the density matrix changes on it, i.e. the accumulated max|ddm| of the
+    shells significant on the block is larger than tol.  The XC matrix is
+    updated with the change of the potential on the recomputed blocks.
+    Without xc_state, all blocks are computed.
+
+    Returns:
+        nelec, excsum, vmat, xc_state
+    '''
+    xctype = ni._xc_type(xc_code)
+    if xctype not in ('LDA', 'GGA'):
+        nelec, excsum, vmat = ni.nr_rks(mol, grids, xc_code, dm, relativity,
+                                        1, max_memory, verbose)
+        return nelec, excsum, vmat, None
+
+    log = logger.new_logger(mol, verbose)
+    if grids.coords is None:
+        grids.build(with_non0tab=True)
+    dm = numpy.asarray(dm)
+    nao = dm.shape[-1]
+    ngrids = grids.weights.size
+    ao_deriv = 0 if xctype == 'LDA' else 1
+    blocks = list(ni._screened_blocks(mol, grids, nao, ao_deriv, max_memory))
+
+    if (xc_state is None or ddm is None or
+        xc_state['xc_code'] != xc_code or
+        xc_state['weights'] is not grids.weights or
+        xc_state['nblk'] != len(blocks)):
+        xc_state = {'xc_code': xc_code,
+                    'weights': grids.weights,
+                    'nblk'   : len(blocks),
+                    'wv'     : numpy.zeros((ao_deriv*3+1,ngrids)),
+                    'den'    : numpy.zeros(ngrids),
+                    'eden'   : numpy.zeros(ngrids),
+                    'blk_err': numpy.zeros(len(blocks)),
+                    'vmat'   : numpy.zeros((nao,nao))}
+        ddm = None
+    else:
+        # xc_state of the last call may be used again by the caller
+        xc_state = dict(xc_state)
+        for key in ('wv', 'den', 'eden', 'blk_err', 'vmat'):
+            xc_state[key] = xc_state[key].copy()
+        ddm = numpy.asarray(ddm)
+    wv_grid = xc_state['wv']
+    blk_err = xc_state['blk_err']
+    vmat = xc_state['vmat']
+
+    buf = None
+    nskip = 0
+    for ib, (ip0, ip1, submol, ao_idx, non0) in enumerate(blocks):
+        if ddm is not None:
+            if ao_idx is None:
+                blk_err[ib] += abs(ddm).max()
+            else:
+                blk_err[ib] += abs(lib.take_2d(ddm, ao_idx, ao_idx)).max()
+            if blk_err[ib] < tol:
+                nskip += 1
+                continue
+        blk_err[ib] = 0
+
+        weight = grids.weights[ip0:ip1]
+        if buf is None:
+            buf = numpy.empty((ao_deriv*3+1)*(ip1-ip0)*nao)
+        ao = ni.eval_ao(submol, grids.coords[ip0:ip1], deriv=ao_deriv,
+                        non0tab=non0, out=buf)
+        if ao_idx is None:
+            dm_sub = dm
+        else:
+            dm_sub = lib.take_2d(dm, ao_idx, ao_idx)
+        rho = ni.eval_rho(submol, ao, dm_sub, non0, xctype, hermi=1)
+        exc, vxc = ni.eval_xc(xc_code, rho, 0, relativity, 1, verbose)[:2]
+        if xctype == 'LDA':
+            den = rho * weight
+            wv = (.5 * weight * vxc[0]).reshape(1,-1)
+            ao = ao.reshape((1,)+ao.shape)
+        else:
+            den = rho[0] * weight
+            wv = _rks_gga_wv0(rho, vxc, weight)
+        xc_state['den'][ip0:ip1] = den
+        xc_state['eden'][ip0:ip1] = den * exc
+        dwv = wv - wv_grid[:,ip0:ip1]
+        wv_grid[:,ip0:ip1] = wv
+
+        aow = numpy.einsum('npi,np->pi', ao, dwv)
+        v = _dot_ao_ao(submol, ao[0], aow, non0, (0, submol.nbas),
+                       submol.ao_loc_nr())
+        _add_sub_mat(vmat, v + v.T, ao_idx)
+        rho = exc = vxc = wv = dwv = aow = v = None
+
+    log.debug('Incremental XC: %d of %d grid blocks skipped',
+              nskip, len(blocks))
+    nelec = xc_state['den'].sum()
+    excsum = xc_state['eden'].sum()
+    return nelec, excsum, vmat.copy(), xc_state
+
 def nr_uks(ni, mol, grids, xc_code, dms, relativity=0, hermi=0,
            max_memory=2000, verbose=None):
     '''Calculate UKS XC functional and potential matrix on given meshgrids
@@ -1493,6 +1620,7 @@ class _NumInt(object):
 
     nr_rks = nr_rks
     nr_uks = nr_uks
+    nr_rks_incremental = nr_rks_incremental
     nr_rks_fxc = nr_rks_fxc
     nr_uks_fxc = nr_uks_fxc
     cache_xc_kernel  = cache_xc_kernel
@@ -1544,6 +1672,64 @@ class _NumInt(object):
             ao = self.eval_ao(mol, coords, deriv=deriv, non0tab=non0, out=buf)
             yield ao, non0, weight, coords
 
+    def screened_block_loop(self, mol, grids, nao, deriv=0, max_memory=2000):
+        '''Similar to block_loop.  For each block, the shells which are
+        negligible on all grids of the block (according to grids.non0tab) are
+        removed.  AO values are evaluated for the remaining shells only.
+
+        Yields:
+            submol, ao_idx, ao, non0, weight, coords.  submol is a shallow copy
+            of mol which holds the significant shells of the block and ao_idx
+            the indices of their AOs in mol.  If most shells are significant,
+            submol is mol and ao_idx is None.
+        '''
+        if grids.coords is None:
+            grids.build(with_non0tab=True)
+        if grids.non0tab is None:
+            for ao, mask, weight, coords \
+                    in self.block_loop(mol, grids, nao, deriv, max_memory):
+                yield mol, None, ao, mask, weight, coords
+            return
+
+        comp = (deriv+1)*(deriv+2)*(deriv+3)//6
+        buf = None
+        for ip0, ip1, submol, ao_idx, non0 \
+                in self._screened_blocks(mol, grids, nao, deriv, max_memory):
+            coords = grids.coords[ip0:ip1]
+            weight = grids.weights[ip0:ip1]
+            if buf is None:
+                buf = numpy.empty(comp*(ip1-ip0)*nao)
+            ao = self.eval_ao(submol, coords, deriv=deriv, non0tab=non0,
+                              out=buf)
+            yield submol, ao_idx, ao, non0, weight, coords
+
+    def _screened_blocks(self, mol, grids, nao, deriv=0, max_memory=2000):
+        '''Grid blocks of screened_block_loop without evaluating AOs.
+        Yields ip0, ip1, submol, ao_idx, non0'''
+        ngrids = grids.weights.size
+        comp = (deriv+1)*(deriv+2)*(deriv+3)//6
+        blksize = int(max_memory*1e6/(comp*2*nao*8*BLKSIZE))
+        blksize = max(min(blksize, SPARSE_NBLK), 1) * BLKSIZE
+        non0tab = grids.non0tab
+        if non0tab is None:
+            non0tab = numpy.ones(((ngrids+BLKSIZE-1)//BLKSIZE,mol.nbas),
+                                 dtype=numpy.uint8)
+        ao_loc = mol.ao_loc_nr()
+        for ip0 in range(0, ngrids, blksize):
+            ip1 = min(ngrids, ip0+blksize)
+            non0 = non0tab[ip0//BLKSIZE:(ip1+BLKSIZE-1)//BLKSIZE]
+            shl_idx = numpy.where(non0.any(axis=0))[0]
+            if shl_idx.size == 0:
+                continue
+            ao_idx = _shell_to_ao_index(ao_loc, shl_idx)
+            if ao_idx.size > nao * SPARSE_AO_CUTOFF:
+                yield ip0, ip1, mol, None, non0
+            else:
+                submol = copy.copy(mol)
+                submol._bas = mol._bas[shl_idx]
+                non0 = numpy.asarray(non0[:,shl_idx], order='C')
+                yield ip0, ip1, submol, ao_idx, non0
+
     def _gen_rho_evaluator(self, mol, dms, hermi=0):
         if hasattr(dms, 'mo_coeff'):
 #TODO: test whether dm.mo_coeff matching dm
@@ -1554,9 +1740,13 @@ class _NumInt(object):
                 mo_occ = [mo_occ]
             nao = mo_coeff[0].shape[0]
             ndms = len(mo_occ)
-            def make_rho(idm, ao, non0tab, xctype):
-                return self.eval_rho2(mol, ao, mo_coeff[idm], mo_occ[idm],
-                                      non0tab, xctype)
+            def make_rho(idm, ao, non0tab, xctype, submol=None, ao_idx=None):
+                if ao_idx is None:
+                    return self.eval_rho2(mol, ao, mo_coeff[idm], mo_occ[idm],
+                                          non0tab, xctype)
+                else:
+                    return self.eval_rho2(submol, ao, mo_coeff[idm][ao_idx],
+                                          mo_occ[idm], non0tab, xctype)
         else:
             if isinstance(dms, numpy.ndarray) and dms.ndim == 2:
                 dms = [dms]
@@ -1565,8 +1755,14 @@ class _NumInt(object):
                 dms = [(dm+dm.conj().T)*.5 for dm in dms]
             nao = dms[0].shape[0]
             ndms = len(dms)
-            def make_rho(idm, ao, non0tab, xctype):
-                return self.eval_rho(mol, ao, dms[idm], non0tab, xctype, hermi=1)
+            def make_rho(idm, ao, non0tab, xctype, submol=None, ao_idx=None):
+                if ao_idx is None:
+                    return self.eval_rho(mol, ao, dms[idm], non0tab, xctype,
+                                         hermi=1)
+                else:
+                    dm = lib.take_2d(dms[idm], ao_idx, ao_idx)
+                    return self.eval_rho(submol, ao, dm, non0tab, xctype,
+                                         hermi=1)
         return make_rho, ndms, nao
 
 ####################
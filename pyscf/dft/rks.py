@@ -69,10 +69,19 @@ def get_veff(ks, mol=None, dm=None, dm_last=0, vhf_last=0, hermi=1):
             t0 = logger.timer(ks, 'setting up nlc grids', *t0)
 
     ni = ks._numint
+    incremental = ks.incremental_fock and ground_state and hermi == 1
+    if incremental:
+        ddm, vhf_last, tol, err = hf._incremental_fock(ks, dm, dm_last, vhf_last)
     if hermi == 2:  # because rho = 0
         n, exc, vxc = 0, 0, 0
     else:
-        n, exc, vxc = ni.nr_rks(mol, ks.grids, ks.xc, dm)
+        if incremental:
+            n, exc, vxc, xc_state = ni.nr_rks_incremental(
+                mol, ks.grids, ks.xc, dm, ddm,
+                getattr(vhf_last, 'xc_state', None), tol,
+                max_memory=ks.max_memory)
+        else:
+            n, exc, vxc = ni.nr_rks(mol, ks.grids, ks.xc, dm)
         if ks.nlc != '':
             assert('VV10' in ks.nlc.upper())
             _, enlc, vnlc = ni.nr_rks(mol, ks.nlcgrids, ks.xc+'__'+ks.nlc, dm)
@@ -84,7 +93,25 @@ def get_veff(ks, mol=None, dm=None, dm_last=0, vhf_last=0, hermi=1):
     #enabling range-separated hybrids
     omega, alpha, hyb = ni.rsh_and_hybrid_coeff(ks.xc, spin=mol.spin)
 
-    if abs(hyb) < 1e-10 and abs(alpha) < 1e-10:
+    if incremental:
+        with_k = abs(hyb) > 1e-10 or abs(alpha) > 1e-10
+        vj, vk = hf._incremental_jk(ks, mol, ddm, hermi, tol, with_k)
+        if with_k:
+            vk *= hyb
+            if abs(omega) > 1e-10:
+                vklr = _get_k_lr(mol, ddm, omega)
+                vklr *= (alpha - hyb)
+                vk += vklr
+        if getattr(vhf_last, 'vj', None) is not None:
+            vj += vhf_last.vj
+            if with_k:
+                vk += vhf_last.vk
+        vxc += vj
+        if with_k:
+            vxc -= vk * .5
+            exc -= numpy.einsum('ij,ji', dm, vk) * .5 * .5
+
+    elif abs(hyb) < 1e-10 and abs(alpha) < 1e-10:
         vk = None
         if (ks._eri is None and ks.direct_scf and
             getattr(vhf_last, 'vj', None) is not None):
@@ -124,6 +151,8 @@ def get_veff(ks, mol=None, dm=None, dm_last=0, vhf_last=0, hermi=1):
         ecoul = None
 
     vxc = lib.tag_array(vxc, ecoul=ecoul, exc=exc, vj=vj, vk=vk)
+    if incremental:
+        vxc = lib.tag_array(vxc, fock_err=err, xc_state=xc_state)
     return vxc
 
 def _get_k_lr(mol, dm, omega=0):
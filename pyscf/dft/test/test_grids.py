@@ -49,6 +49,59 @@ class KnownValues(unittest.TestCase):
         grid.build(with_non0tab=False)
         self.assertAlmostEqual(numpy.linalg.norm(grid.weights), 1712.3069450297105, 8)
 
+    def test_screened_partition(self):
+        grid = gen_grid.Grids(h2o)
+        grid.atom_grid = {"H": (20, 110), "O": (20, 110),}
+        grid.build(with_non0tab=False)
+        w0 = grid.weights
+
+        atom_grids_tab = grid.gen_atomic_grids(h2o)
+        f_radii_adjust = radi.treutler_atomic_radii_adjust(h2o, radi.BRAGG_RADII)
+        coords, w1 = gen_grid._gen_partition_screened(
+            h2o, atom_grids_tab, radi.treutler_atomic_radii_adjust,
+            f_radii_adjust, gen_grid.original_becke)
+        self.assertTrue(numpy.allclose(coords, grid.coords))
+        self.assertTrue(numpy.allclose(w0, w1))
+
+        # Custom radii_adjust function
+        grid.radii_adjust = lambda mol, atomic_radii: \
+                radi.treutler_atomic_radii_adjust(mol, atomic_radii)
+        grid.build(with_non0tab=False)
+        self.assertTrue(numpy.allclose(w0, grid.weights))
+
+        grid.becke_scheme = gen_grid.stratmann
+        grid.build(with_non0tab=False)
+        w0 = grid.weights
+        grid.radii_adjust = radi.treutler_atomic_radii_adjust
+        grid.build(with_non0tab=False)
+        self.assertTrue(numpy.allclose(w0, grid.weights))
+
+    def test_reuse_atomic_grids(self):
+        grid = gen_grid.Grids(h2o)
+        grid.atom_grid = {"H": (20, 110), "O": (20, 110),}
+        grid.build()
+        tab0 = grid.gen_atomic_grids(h2o)
+
+        mol1 = h2o.copy()
+        mol1.set_geom_('O 0 0 .1; H 0 -0.757 0.587; H 0 0.757 0.587')
+        grid.mol = mol1
+        grid.coords = None
+        grid.build()
+        tab1 = grid.gen_atomic_grids(mol1)
+        self.assertTrue(tab0['O'][0] is tab1['O'][0])
+
+        grid1 = gen_grid.Grids(mol1)
+        grid1.atom_grid = {"H": (20, 110), "O": (20, 110),}
+        grid1.build()
+        self.assertTrue(numpy.allclose(grid.coords, grid1.coords))
+        self.assertTrue(numpy.allclose(grid.weights, grid1.weights))
+
+        grid.level = 4
+        grid.atom_grid = {}
+        grid.build()
+        self.assertEqual(grid.weights.size,
+                         gen_grid.Grids(mol1).set(level=4).build().weights.size)
+
     def test_radi(self):
         grid = gen_grid.Grids(h2o)
         grid.prune = None
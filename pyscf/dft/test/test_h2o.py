@@ -74,6 +74,14 @@ class KnownValues(unittest.TestCase):
         method.xc = 'b88, vwn'
         self.assertAlmostEqual(method.scf(), -76.690247578608236, 9)
 
+    def test_nr_b88vwn_incremental(self):
+        method = dft.RKS(h2o)
+        method.grids.prune = dft.gen_grid.treutler_prune
+        method.grids.atom_grid = {"H": (50, 194), "O": (50, 194),}
+        method.xc = 'b88, vwn'
+        method.incremental_fock = True
+        self.assertAlmostEqual(method.scf(), -76.690247578608236, 8)
+
     def test_nr_xlyp(self):
         method = dft.RKS(h2o)
         method.grids.prune = dft.gen_grid.treutler_prune
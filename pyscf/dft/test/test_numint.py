@@ -178,6 +178,22 @@ class KnownValues(unittest.TestCase):
         v = mf._numint.nr_vxc(mol, mf.grids, 'B88', dms, spin=0, hermi=0)[2]
         self.assertAlmostEqual(finger(v), -0.70124686853021512, 8)
 
+    def test_rks_vxc_screened(self):
+        numpy.random.seed(10)
+        nao = mol.nao_nr()
+        dms = numpy.random.random((2,nao,nao))
+        grids = dft.gen_grid.Grids(mol)
+        grids.atom_grid = {"H": (50, 110)}
+        grids.sort_grids = True
+        grids.build(with_non0tab=True)
+        self.assertAlmostEqual(grids.weights.sum(), mf.grids.weights.sum(), 9)
+        for xc in ('LDA', 'B88'):
+            ref = mf._numint.nr_vxc(mol, mf.grids, xc, dms, spin=0, hermi=0)
+            res = mf._numint.nr_vxc(mol, grids, xc, dms, spin=0, hermi=0)
+            self.assertAlmostEqual(abs(res[0]-ref[0]).max(), 0, 7)
+            self.assertAlmostEqual(abs(res[1]-ref[1]).max(), 0, 7)
+            self.assertAlmostEqual(abs(res[2]-ref[2]).max(), 0, 7)
+
     def test_uks_vxc(self):
         numpy.random.seed(10)
         nao = mol.nao_nr()
@@ -32,6 +32,7 @@ from pyscf.fci.rdm import reorder_rdm
 from pyscf.fci.spin_op import spin_square
 from pyscf.fci.direct_spin1 import make_pspace_precond, make_diag_precond
 from pyscf.fci import direct_nosym
+from pyscf.fci import outcore
 from pyscf.fci import select_ci
 from pyscf.fci import select_ci_spin0
 from pyscf.fci import select_ci_symm
@@ -3,14 +3,21 @@
 # Author: Qiming Sun <osirpt.sun@gmail.com>
 #
 
+import os
 import sys
 import ctypes
 import math
+import threading
+import tempfile
+from collections import OrderedDict
 import numpy
 from pyscf import lib
 
 libfci = lib.load_library('libfci')
 
+# Memory budget (MB) of the link_index tables cached by gen_linkstr_index
+LINKSTR_CACHE_SIZE = 500
+
 def gen_strings4orblist(orb_list, nelec):
     '''Generate string from the given orbital list.
 
@@ -187,7 +194,17 @@ def gen_linkstr_index(orb_list, nocc, strs=None, tril=False):
     excitations, which do not change the string. The next nocc*nvir rows
     [a(:vir),i(:occ),str1,sign] are occupied-virtual exciations, starting from
     str0, annihilating i, creating a, to get str1.
+
+    If strs is not given, the table is cached in :data:`linkstr_cache`.
+    The returned table is a copy of the cached one.
     '''
+    if strs is None:
+        key = (tuple([int(i) for i in orb_list]), nocc, bool(tril))
+        return linkstr_cache.get(key, _gen_linkstr_index, orb_list, nocc,
+                                 None, tril)
+    return _gen_linkstr_index(orb_list, nocc, strs, tril)
+
+def _gen_linkstr_index(orb_list, nocc, strs=None, tril=False):
     if strs is None:
         strs = gen_strings4orblist(orb_list, nocc)
 
@@ -199,7 +216,8 @@ def gen_linkstr_index(orb_list, nocc, strs=None, tril=False):
     norb = len(orb_list)
     nvir = norb - nocc
     na = strs.shape[0]
-    link_index = numpy.empty((na,nocc*nvir+nocc,4), dtype=numpy.int32)
+    # FCIlinkstr_index does not fill column 1 for tril=True
+    link_index = numpy.zeros((na,nocc*nvir+nocc,4), dtype=numpy.int32)
     libfci.FCIlinkstr_index(link_index.ctypes.data_as(ctypes.c_void_p),
                             ctypes.c_int(norb), ctypes.c_int(na),
                             ctypes.c_int(nocc),
@@ -207,6 +225,110 @@ def gen_linkstr_index(orb_list, nocc, strs=None, tril=False):
                             ctypes.c_int(tril))
     return link_index
 
+class LinkstrCache(object):
+    '''Process-wide cache of the link_index tables.
+
+    The tables are held in memory in the smallest integer type (int16 or
+    int32) and evicted in least-recently-used order when the memory budget is
+    exceeded.  If shared_dir is set, the tables are also saved there as .npy
+    files.  Other processes (e.g. the workers of multiprocessing) which set
+    the same shared_dir map the files instead of generating the tables.
+
+    Attributes:
+        max_memory : float
+            Memory budget (in MB) for the tables held in memory.
+        shared_dir : str
+            Directory (e.g. on /dev/shm) to share the tables between
+            processes.  Default is None, not sharing the tables.
+    '''
+    def __init__(self, max_memory=LINKSTR_CACHE_SIZE, shared_dir=None):
+        self.max_memory = max_memory
+        self.shared_dir = shared_dir
+        self._tables = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, fn, *args):
+        '''Return the table of key.  fn(\*args) generates the table if it is
+        not found in the cache.'''
+        with self._lock:
+            if key in self._tables:
+                table = self._tables.pop(key)
+                self._tables[key] = table
+                return _as_int32(table)
+
+        table = self._load(key)
+        if table is None:
+            table = fn(*args)
+            self._save(key, table)
+        self._add(key, table)
+        return _as_int32(table)
+
+    def _add(self, key, table):
+        table = _compact(table)
+        with self._lock:
+            if key in self._tables:
+                self._nbytes -= self._tables.pop(key).nbytes
+            budget = self.max_memory * 1e6
+            if table.nbytes > budget:
+                return
+            while self._tables and self._nbytes + table.nbytes > budget:
+                self._nbytes -= self._tables.popitem(last=False)[1].nbytes
+            self._tables[key] = table
+            self._nbytes += table.nbytes
+
+    def _filename(self, key):
+        orb_list, nocc, tril = key
+        norb = len(orb_list)
+        if orb_list == tuple(range(norb)):
+            orbs = str(norb)
+        else:
+            orbs = '-'.join([str(i) for i in orb_list])
+        return os.path.join(self.shared_dir,
+                            'linkstr_%s_%d_%d.npy' % (orbs, nocc, tril))
+
+    def _load(self, key):
+        if self.shared_dir is None:
+            return None
+        filename = self._filename(key)
+        if os.path.isfile(filename):
+            return numpy.load(filename, mmap_mode='r')
+
+    def _save(self, key, table):
+        if self.shared_dir is None:
+            return
+        filename = self._filename(key)
+        if not os.path.isfile(filename):
+            # written to a temporary file then renamed, so that the other
+            # processes never read an incomplete table
+            fd, tmpname = tempfile.mkstemp(dir=self.shared_dir)
+            with os.fdopen(fd, 'wb') as f:
+                numpy.save(f, _compact(table))
+            os.rename(tmpname, filename)
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+            self._nbytes = 0
+
+linkstr_cache = LinkstrCache()
+
+def _compact(table):
+    if table.dtype == numpy.int16:
+        return table
+    if (table.size == 0 or
+        (table.max() < numpy.iinfo(numpy.int16).max and
+         table.min() > numpy.iinfo(numpy.int16).min)):
+        table = table.astype(numpy.int16)
+    else:
+        table = numpy.asarray(table, dtype=numpy.int32)
+    table.flags.writeable = False
+    return table
+
+def _as_int32(table):
+    # The cached tables are read-only.  Callers get a writable copy.
+    return numpy.array(table, dtype=numpy.int32)
+
 def reform_linkstr_index(link_index):
     '''Compress the (a, i) pair index in linkstr_index to a lower triangular
     index, to match the 4-fold symmetry of integrals.
@@ -111,6 +111,76 @@ def contract_2e(eri, fcivec, norb, nelec, link_index=None):
                                 link_indexb.ctypes.data_as(ctypes.c_void_p))
     return ci1
 
+def contract_2e_batch(eri, fcivecs, norb, nelec, link_index=None,
+                      max_memory=2000):
+    '''Contract the 2-electron Hamiltonian with a list of FCI vectors.  It
+    gives the same results as calling :func:`contract_2e` for each vector,
+    but the link_index and the integrals are traversed only once for all
+    vectors.
+
+    The vectors are transformed to the intermediates
+    :math:`D_{pq} = \sum_{rs} eri_{pq,rs} E_{rs} |c\rangle`
+    for a block of alpha strings, for all vectors together.  The
+    contraction with eri is one matrix multiplication per block.
+
+    Kwargs:
+        max_memory : float
+            Memory (in MB) for the intermediates of a block of alpha strings.
+
+    Returns:
+        A list of FCI vectors with the same shapes as the input vectors
+    '''
+    from scipy import sparse
+    eri = ao2mo.restore(4, eri, norb)
+    link_indexa, link_indexb = _unpack(norb, nelec, link_index)
+    na, nlinka = link_indexa.shape[:2]
+    nb, nlinkb = link_indexb.shape[:2]
+    npair = norb * (norb+1) // 2
+    nvec = len(fcivecs)
+    shapes = [numpy.shape(c) for c in fcivecs]
+    # ci0[str_alpha,str_beta,root]
+    ci0 = numpy.empty((na,nb,nvec))
+    for k, c in enumerate(fcivecs):
+        ci0[:,:,k] = numpy.reshape(c, (na,nb))
+    ci1 = numpy.zeros_like(ci0)
+
+    # E_{pq}|str0> = sign |str1> as the sparse matrices [(pq,str1), str0]
+    link_b = _link_matrix(link_indexb, nb, npair)
+    blksize = max(1, int(max_memory*1e6/8/(npair*nb*nvec*3)))
+    for p0, p1 in lib.prange(0, na, blksize):
+        nblk = p1 - p0
+        mask = (link_indexa[:,:,2] >= p0) & (link_indexa[:,:,2] < p1)
+        str0 = numpy.where(mask)[0]
+        pair, str1, sign = link_indexa[mask][:,[0,2,3]].T
+        link_a = sparse.csr_matrix((sign.astype(numpy.double),
+                                    (pair*nblk+str1-p0, str0)),
+                                   shape=(npair*nblk,na))
+
+        # t1[pq,str_alpha,str_beta,root]
+        t1 = link_a.dot(ci0.reshape(na,-1)).reshape(npair,nblk,nb,nvec)
+        tmp = ci0[p0:p1].transpose(1,0,2).reshape(nb,-1)
+        tmp = link_b.dot(tmp).reshape(npair,nb,nblk,nvec)
+        t1 += tmp.transpose(0,2,1,3)
+        tmp = None
+
+        t1 = numpy.dot(eri, t1.reshape(npair,-1))
+        ci1 += link_a.T.dot(t1.reshape(npair*nblk,-1)).reshape(na,nb,nvec)
+        t1 = t1.reshape(npair,nblk,nb,nvec).transpose(0,2,1,3)
+        tmp = link_b.T.dot(t1.reshape(npair*nb,-1))
+        ci1[p0:p1] += tmp.reshape(nb,nblk,nvec).transpose(1,0,2)
+        t1 = tmp = None
+
+    return [ci1[:,:,k].reshape(shapes[k]) for k in range(nvec)]
+
+def _link_matrix(link_index, nstr, npair):
+    '''The tril link_index as a sparse matrix [(pq,str1), str0]'''
+    from scipy import sparse
+    nlink = link_index.shape[1]
+    str0 = numpy.repeat(numpy.arange(nstr), nlink)
+    pair, str1, sign = link_index.reshape(-1,4)[:,[0,2,3]].T
+    return sparse.csr_matrix((sign.astype(numpy.double),
+                              (pair*nstr+str1, str0)), shape=(npair*nstr,nstr))
+
 def make_hdiag(h1e, eri, norb, nelec):
     '''Diagonal Hamiltonian for Davidson preconditioner
     '''
@@ -405,6 +475,14 @@ def kernel_ms1(fci, h1e, eri, norb, nelec, ci0=None, link_index=None,
     def hop(c):
         hc = fci.contract_2e(h2e, c, norb, nelec, (link_indexa,link_indexb))
         return hc.ravel()
+    if nroots > 1 and _default_contract_2e(fci):
+        # The trial vectors of all roots are contracted in one pass
+        def hop_batch(cs):
+            return [hc.ravel() for hc in
+                    contract_2e_batch(h2e, cs, norb, nelec,
+                                      (link_indexa,link_indexb),
+                                      max_memory=fci.max_memory)]
+        hop.batch = hop_batch
 
     if ci0 is None:
         if hasattr(fci, 'get_init_guess'):
@@ -601,9 +679,12 @@ class FCISolver(lib.StreamObject):
             lessio = True
         else:
             lessio = False
+        # op.batch(xs) is equivalent to [op(x) for x in xs]
+        aop = getattr(op, 'batch', None)
+        if aop is None:
+            aop = lambda xs: [op(x) for x in xs]
         self.converged, e, ci = \
-                lib.davidson1(lambda xs: [op(x) for x in xs],
-                              x0, precond, lessio=lessio, **kwargs)
+                lib.davidson1(aop, x0, precond, lessio=lessio, **kwargs)
         if kwargs['nroots'] == 1:
             self.converged = self.converged[0]
             e = e[0]
@@ -718,6 +799,13 @@ class FCISolver(lib.StreamObject):
 FCI = FCISolver
 
 
+def _default_contract_2e(fci):
+    '''Whether fci.contract_2e is the contract_2e function of this module'''
+    meth = getattr(fci.contract_2e, '__func__', None)
+    return (meth is not None and
+            meth is getattr(FCISolver.contract_2e, '__func__',
+                            FCISolver.contract_2e))
+
 def _unpack_nelec(nelec, spin=None):
     if spin is None:
         spin = 0
@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Out-of-core FCI solver (spin-free Hamiltonian, no point group symmetry) for
+the CI spaces which are too large to hold the CI vectors in memory.
+
+The CI vectors are numpy memmap arrays managed by lib.vecstore.MemmapStore.
+The Hamiltonian is applied block by block of alpha strings (see
+:func:`contract_2e`), and the Davidson iterations operate on the row blocks
+of the vectors (see :func:`davidson`).  Only a few blocks of the vectors
+are held in memory at a time.  The blocks of :func:`contract_2e` can be
+distributed over local processes.
+'''
+
+import os
+import sys
+import tempfile
+import numpy
+import scipy.linalg
+from pyscf import lib
+from pyscf import ao2mo
+from pyscf.lib import logger
+from pyscf.lib import vecstore
+from pyscf.fci import direct_spin1
+
+
+def contract_2e(eri, fcivec, norb, nelec, link_index=None, out=None,
+                max_memory=2000, nproc=1):
+    '''Block-wise version of :func:`direct_spin1.contract_2e`.
+
+    The input vector is streamed block by block of alpha strings, and the
+    result is accumulated in out block by block.  fcivec and out are
+    typically numpy memmaps.  The memory footprint is determined by the
+    alpha-string block size, which is estimated from max_memory.
+
+    Kwargs:
+        out : ndarray
+            Array to hold the result.  If not given, a new array is allocated
+            in memory.
+        nproc : int
+            Number of local processes to share the alpha-string blocks.
+            fcivec must be a numpy memmap if nproc > 1.
+
+    Returns:
+        out, the contraction H|fcivec> in the shape of fcivec
+    '''
+    eri = ao2mo.restore(4, eri, norb)
+    link_indexa, link_indexb = direct_spin1._unpack(norb, nelec, link_index)
+    na = link_indexa.shape[0]
+    nb = link_indexb.shape[0]
+    shape = fcivec.shape
+    if out is None:
+        out = numpy.zeros((na,nb))
+    else:
+        out = out.reshape(na,nb)
+        for p0, p1 in _row_blocks(na, nb, max_memory):
+            out[p0:p1] = 0
+
+    npair = norb * (norb+1) // 2
+    blksize = _alpha_blksize(npair, nb, max_memory)
+    tasks = list(lib.prange(0, na, blksize))
+    if nproc > 1 and len(tasks) > 1:
+        _contract_2e_mp(eri, fcivec, norb, nelec, link_indexa, link_indexb,
+                        out, tasks, max_memory, nproc)
+    else:
+        _contract_2e_blocks(eri, fcivec.reshape(na,nb), link_indexa,
+                            link_indexb, out, tasks, max_memory)
+    return out.reshape(shape)
+
+def _alpha_blksize(npair, nb, max_memory):
+    '''Number of alpha strings of a block for the intermediates t1 (and the
+    buffers of the same size) in contract_2e'''
+    return max(1, int(max_memory*1e6/8/(npair*nb*3)))
+
+def _row_blocks(na, nb, max_memory):
+    return lib.prange(0, na, max(1, int(max_memory*1e6/8/nb*.5)))
+
+def _contract_2e_blocks(eri, fcivec, link_indexa, link_indexb, out, tasks,
+                        max_memory):
+    '''Contract the tasks (blocks of alpha strings).  For each block, the
+    input vector and the output vector are streamed over the alpha strings.
+    '''
+    from scipy import sparse
+    na = link_indexa.shape[0]
+    nb = link_indexb.shape[0]
+    npair = eri.shape[0]
+    link_b = direct_spin1._link_matrix(link_indexb, nb, npair)
+    link_bT = link_b.T.tocsr()
+    stream_blocks = list(lib.prange(0, na, _alpha_blksize(npair, nb, max_memory)))
+
+    for p0, p1 in tasks:
+        nblk = p1 - p0
+        # E_{pq}|str0> = sign |str1> for str1 in the block, as the sparse
+        # matrix [(pq,str1), str0]
+        mask = (link_indexa[:,:,2] >= p0) & (link_indexa[:,:,2] < p1)
+        str0 = numpy.where(mask)[0]
+        pair, str1, sign = link_indexa[mask][:,[0,2,3]].T
+        link_a = sparse.csr_matrix((sign.astype(numpy.double),
+                                    (pair*nblk+str1-p0, str0)),
+                                   shape=(npair*nblk,na)).tocsc()
+        link_blocks = []
+        for q0, q1 in stream_blocks:
+            g = link_a[:,q0:q1]
+            if g.nnz > 0:
+                link_blocks.append((q0, q1, g.tocsr(), g.T.tocsr()))
+        link_a = None
+
+        t1 = numpy.zeros((npair*nblk,nb))
+        for q0, q1, g, gT in link_blocks:
+            t1 += g.dot(numpy.asarray(fcivec[q0:q1]))
+        ci0 = numpy.asarray(fcivec[p0:p1])
+        tmp = link_b.dot(ci0.T).reshape(npair,nb,nblk)
+        t1 = t1.reshape(npair,nblk,nb)
+        t1 += tmp.transpose(0,2,1)
+        ci0 = tmp = None
+
+        t1 = numpy.dot(eri, t1.reshape(npair,-1))
+        for q0, q1, g, gT in link_blocks:
+            out[q0:q1] += gT.dot(t1.reshape(npair*nblk,nb))
+        t1 = lib.transpose(t1.reshape(npair,nblk,nb), axes=(0,2,1))
+        tmp = link_bT.dot(t1.reshape(npair*nb,nblk))
+        out[p0:p1] += tmp.T
+        t1 = tmp = None
+    return out
+
+def _memmap_info(a):
+    if not isinstance(a, numpy.memmap) or a.filename is None:
+        raise TypeError('numpy.memmap is required for nproc > 1')
+    return (a.filename, a.offset, a.dtype.char, a.size)
+
+def _open_memmap(info, mode, shape):
+    filename, offset, dtype, size = info
+    return numpy.memmap(filename, dtype=dtype, mode=mode, offset=offset,
+                        shape=(size,)).reshape(shape)
+
+def _contract_2e_worker(args):
+    eri, civec_info, link_indexa, link_indexb, out_file, tasks, max_memory = args
+    na = link_indexa.shape[0]
+    nb = link_indexb.shape[0]
+    fcivec = _open_memmap(civec_info, 'r', (na,nb))
+    out = numpy.lib.format.open_memmap(out_file, mode='w+', dtype=numpy.double,
+                                       shape=(na,nb))
+    _contract_2e_blocks(eri, fcivec, link_indexa, link_indexb, out, tasks,
+                        max_memory)
+    out.flush()
+    return out_file
+
+def _contract_2e_mp(eri, fcivec, norb, nelec, link_indexa, link_indexb, out,
+                    tasks, max_memory, nproc):
+    '''Distribute the alpha-string blocks over nproc processes.  Each process
+    accumulates its contributions in its own memmap file.  They are summed
+    into out at the end.'''
+    import multiprocessing
+    na = link_indexa.shape[0]
+    nb = link_indexb.shape[0]
+    civec_info = _memmap_info(fcivec)
+    fcivec.flush()
+    nproc = min(nproc, len(tasks))
+    tmpdir = tempfile.mkdtemp(prefix='fci_outcore', dir=lib.param.TMPDIR)
+    args = [(eri, civec_info, link_indexa, link_indexb,
+             os.path.join(tmpdir, '%d.npy' % i), tasks[i::nproc],
+             max_memory/nproc) for i in range(nproc)]
+    pool = multiprocessing.Pool(nproc)
+    try:
+        out_files = pool.map(_contract_2e_worker, args)
+    finally:
+        pool.close()
+        pool.join()
+
+    for out_file in out_files:
+        buf = numpy.load(out_file, mmap_mode='r')
+        for p0, p1 in _row_blocks(na, nb, max_memory):
+            out[p0:p1] += buf[p0:p1]
+        buf = None
+        os.remove(out_file)
+    os.rmdir(tmpdir)
+    return out
+
+
+def davidson(aop, x0, precond, store, tol=1e-12, max_cycle=50, max_space=12,
+             lindep=1e-14, max_memory=2000, nroots=1, verbose=logger.WARN):
+    '''Davidson diagonalization for the vectors held in a vecstore.
+
+    It follows the algorithm of :func:`lib.linalg_helper.davidson1` but all
+    vector operations are carried out block by block.  Only the blocks of
+    the subspace vectors are loaded in memory.
+
+    Args:
+        aop : function(x, out)
+            Writes the matrix-vector product A x in out
+        x0 : list of 1D arrays
+            Initial guess
+        precond : function(dx, e, p0, p1)
+            Preconditioner for the segment [p0:p1] of the residual dx
+        store : lib.vecstore.VecStore
+            To allocate the vectors
+
+    Returns:
+        conv : list of bool
+        e : list of eigenvalues
+        c : list of eigenvectors (allocated in store)
+    '''
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(sys.stdout, verbose)
+
+    toloose = numpy.sqrt(tol)
+    size = x0[0].size
+    max_space = max_space + nroots * 2
+    # xs, ax, and the Ritz vectors, residuals of all roots
+    blksize = max(1, int(max_memory*1e6/8/(max_space*2+nroots*4)))
+    blocks = list(lib.prange(0, size, blksize))
+    def dot(x, y):
+        return sum(numpy.dot(x[p0:p1], y[p0:p1]) for p0, p1 in blocks)
+
+    keys = {}
+    def new_vector():
+        key = 'dav%d' % len(keys)
+        while key in store:
+            key += '_'
+        v = store.empty(key, size)
+        keys[id(v)] = (key, v)
+        return v
+    def release(alive):
+        alive = set(id(x) for x in alive)
+        for i in [i for i in keys if i not in alive]:
+            del(store[keys.pop(i)[0]])
+
+    xs = []
+    ax = []
+    heff = numpy.zeros((max_space+nroots,max_space+nroots))
+    xt = []
+    for x in x0:
+        v = new_vector()
+        for p0, p1 in blocks:
+            v[p0:p1] = x[p0:p1]
+        xt.append(v)
+    e = numpy.zeros(nroots)
+    conv = [False] * nroots
+    x1 = None
+    for icyc in range(max_cycle):
+        # Gram-Schmidt for the new trial vectors
+        head = len(xs)
+        for x in xt:
+            norm0 = numpy.sqrt(dot(x, x))
+            for y in xs:
+                s = dot(y, x)
+                for p0, p1 in blocks:
+                    x[p0:p1] -= s * y[p0:p1]
+            norm = numpy.sqrt(dot(x, x))
+            if norm**2 < lindep * norm0**2:
+                continue
+            for p0, p1 in blocks:
+                x[p0:p1] *= 1./norm
+            xs.append(x)
+            v = new_vector()
+            aop(x, v)
+            ax.append(v)
+        xt = None
+        space = len(xs)
+        if space == head:
+            log.debug('Linear dependency in trial subspace')
+            break
+
+        for i in range(head, space):
+            for j in range(i+1):
+                heff[i,j] = heff[j,i] = dot(xs[j], ax[i])
+        w, v = scipy.linalg.eigh(heff[:space,:space])
+        elast, e = e, w[:nroots]
+        v = v[:,:nroots]
+
+        # Ritz vectors, the residuals and their preconditioned vectors
+        x1 = [new_vector() for k in range(nroots)]
+        ax1 = [new_vector() for k in range(nroots)]
+        dx = [new_vector() for k in range(nroots)]
+        dx_norm = numpy.zeros(nroots)
+        for p0, p1 in blocks:
+            xblk = numpy.dot(v.T, [x[p0:p1] for x in xs])
+            axblk = numpy.dot(v.T, [x[p0:p1] for x in ax])
+            for k in range(nroots):
+                x1[k][p0:p1] = xblk[k]
+                ax1[k][p0:p1] = axblk[k]
+                r = axblk[k] - e[k] * xblk[k]
+                dx_norm[k] += numpy.dot(r, r)
+                dx[k][p0:p1] = precond(r, e[k], p0, p1)
+        dx_norm = numpy.sqrt(dx_norm)
+        de = e - elast
+        conv = [abs(de[k]) < tol and dx_norm[k] < toloose for k in range(nroots)]
+        log.debug('davidson %d %d  |r|= %4.3g  e= %s  max|de|= %4.3g',
+                  icyc, space, max(dx_norm), e, max(abs(de)))
+
+        if all(conv):
+            break
+
+        xt = [dx[k] for k in range(nroots) if not conv[k]]
+        if space + len(xt) > max_space:
+            # Restart from the Ritz vectors
+            xs = x1
+            ax = ax1
+            heff[:] = 0
+            heff[numpy.arange(nroots),numpy.arange(nroots)] = e
+        dx = ax1 = None
+        # delete the vectors which are not referenced anymore
+        release(xs + ax + xt + x1)
+
+    if x1 is None:
+        x1 = xs[:nroots]
+    release(x1)
+    return conv, e, x1
+
+
+def kernel_ms1(fci, h1e, eri, norb, nelec, ci0=None, link_index=None,
+               tol=None, lindep=None, max_cycle=None, max_space=None,
+               nroots=None, max_memory=None, verbose=None, ecore=0, **kwargs):
+    '''Out-of-core version of :func:`direct_spin1.kernel_ms1`.  The CI
+    vectors are numpy memmaps in fci.store.
+    '''
+    if nroots is None: nroots = fci.nroots
+    if tol is None: tol = fci.conv_tol
+    if lindep is None: lindep = fci.lindep
+    if max_cycle is None: max_cycle = fci.max_cycle
+    if max_space is None: max_space = fci.max_space
+    if max_memory is None: max_memory = fci.max_memory
+    if verbose is None: verbose = logger.Logger(fci.stdout, fci.verbose)
+
+    nelec = direct_spin1._unpack_nelec(nelec, fci.spin)
+    link_indexa, link_indexb = direct_spin1._unpack(norb, nelec, link_index)
+    na = link_indexa.shape[0]
+    nb = link_indexb.shape[0]
+    if fci.store is None:
+        fci.store = vecstore.MemmapStore(max_memory=0)
+    store = fci.store
+
+    hdiag = store.empty('hdiag', na*nb)
+    hdiag[:] = fci.make_hdiag(h1e, eri, norb, nelec)
+    level_shift = fci.level_shift
+    def precond(dx, e, p0, p1):
+        hdiagd = hdiag[p0:p1] - (e-level_shift)
+        hdiagd[abs(hdiagd)<1e-8] = 1e-8
+        return dx/hdiagd
+
+    if ci0 is None:
+        ci0 = []
+        for addr in _lowest_diag(hdiag, nroots, max_memory):
+            x = store.empty('guess%d' % len(ci0), na*nb)
+            for p0, p1 in _row_blocks(na*nb, 1, max_memory):
+                x[p0:p1] = 0
+            x[addr] = 1
+            ci0.append(x)
+        # Add noise
+        ci0[0][0] += 1e-5
+        ci0[0][-1] -= 1e-5
+    else:
+        if isinstance(ci0, numpy.ndarray) and ci0.size == na*nb:
+            ci0 = [ci0.ravel()]
+        else:
+            ci0 = [x.ravel() for x in ci0]
+
+    h2e = fci.absorb_h1e(h1e, eri, norb, nelec, .5)
+    def hop(x, out):
+        contract_2e(h2e, x.reshape(na,nb), norb, nelec,
+                    (link_indexa,link_indexb), out=out.reshape(na,nb),
+                    max_memory=max_memory, nproc=fci.nproc)
+
+    with lib.with_omp_threads(fci.threads):
+        conv, e, c = davidson(hop, ci0, precond, store, tol=tol,
+                              max_cycle=max_cycle, max_space=max_space,
+                              lindep=lindep, max_memory=max_memory,
+                              nroots=nroots, verbose=verbose)
+    del(store['hdiag'])
+    for i in range(len(ci0)):
+        if 'guess%d' % i in store:
+            del(store['guess%d' % i])
+    if nroots > 1:
+        fci.converged = conv
+        return e+ecore, [x.reshape(na,nb) for x in c]
+    else:
+        fci.converged = conv[0]
+        return e[0]+ecore, c[0].reshape(na,nb)
+
+def _lowest_diag(hdiag, nroots, max_memory):
+    '''Addresses of the nroots lowest elements of hdiag'''
+    addrs = []
+    vals = []
+    for p0, p1 in _row_blocks(hdiag.size, 1, max_memory):
+        blk = numpy.asarray(hdiag[p0:p1])
+        k = min(nroots, p1-p0)
+        idx = numpy.argsort(blk)[:k]
+        addrs.append(idx + p0)
+        vals.append(blk[idx])
+    addrs = numpy.hstack(addrs)
+    return addrs[numpy.argsort(numpy.hstack(vals), kind='mergesort')[:nroots]]
+
+
+class FCISolver(direct_spin1.FCISolver):
+    '''Out-of-core FCI solver.  The CI vectors are saved in numpy memmap
+    files.
+
+    Attributes:
+        nproc : int
+            Number of local processes to evaluate the sigma vectors.
+        store : lib.vecstore.VecStore
+            Storage of the CI vectors.  By default, a MemmapStore in
+            lib.param.TMPDIR is created when the kernel is called.
+    '''
+    def __init__(self, mol=None):
+        direct_spin1.FCISolver.__init__(self, mol)
+        self.nproc = 1
+        self.store = None
+
+    def dump_flags(self, verbose=None):
+        direct_spin1.FCISolver.dump_flags(self, verbose)
+        logger.info(self, 'nproc = %d', self.nproc)
+
+    def contract_2e(self, eri, fcivec, norb, nelec, link_index=None, **kwargs):
+        return contract_2e(eri, fcivec, norb, nelec, link_index,
+                           max_memory=self.max_memory, nproc=self.nproc,
+                           **kwargs)
+
+    def kernel(self, h1e, eri, norb, nelec, ci0=None,
+               tol=None, lindep=None, max_cycle=None, max_space=None,
+               nroots=None, ecore=0, **kwargs):
+        if self.verbose >= logger.WARN:
+            self.check_sanity()
+        self.eci, self.ci = \
+                kernel_ms1(self, h1e, eri, norb, nelec, ci0, None,
+                           tol, lindep, max_cycle, max_space, nroots,
+                           ecore=ecore, **kwargs)
+        return self.eci, self.ci
@@ -27,6 +27,9 @@ from pyscf.fci import rdm
 
 libfci = lib.load_library('libfci')
 
+# Buffer size (MB) for the candidate strings generated by each thread
+SELECT_BUFSIZE = 200
+
 def contract_2e(eri, civec_strs, norb, nelec, link_index=None):
     ci_coeff, nelec, ci_strs = _unpack(civec_strs, nelec)
     if link_index is None:
@@ -87,21 +90,41 @@ def contract_2e(eri, civec_strs, norb, nelec, link_index=None):
 
 def select_strs(myci, eri, eri_pq_max, civec_max, strs, norb, nelec):
     strs = numpy.asarray(strs, dtype=numpy.int64)
+    civec_max = numpy.asarray(civec_max, dtype=numpy.double)
     nstrs = len(strs)
     nvir = norb - nelec
-    strs_add = numpy.empty((nstrs*(nelec*nvir)**2//4), dtype=numpy.int64)
-    libfci.SCIselect_strs.restype = ctypes.c_int
-    nadd = libfci.SCIselect_strs(strs_add.ctypes.data_as(ctypes.c_void_p),
-                                 strs.ctypes.data_as(ctypes.c_void_p),
-                                 eri.ctypes.data_as(ctypes.c_void_p),
-                                 eri_pq_max.ctypes.data_as(ctypes.c_void_p),
-                                 civec_max.ctypes.data_as(ctypes.c_void_p),
-                                 ctypes.c_double(myci.select_cutoff),
-                                 ctypes.c_int(norb), ctypes.c_int(nelec),
-                                 ctypes.c_int(nstrs))
-    strs_add = sorted(set(strs_add[:nadd]) - set(strs))
+    # the candidates of each block of strs are generated in a thread
+    max_add = max(1, (nelec*nvir)**2//4)
+    blksize = int(SELECT_BUFSIZE*1e6/8/max_add)
+    blksize = max(1, min(blksize, (nstrs+lib.num_threads()-1)//lib.num_threads()))
+    def select(task):
+        p0, p1 = task
+        strs_add = numpy.empty(((p1-p0)*max_add), dtype=numpy.int64)
+        libfci.SCIselect_strs.restype = ctypes.c_int
+        nadd = libfci.SCIselect_strs(strs_add.ctypes.data_as(ctypes.c_void_p),
+                                     strs[p0:p1].ctypes.data_as(ctypes.c_void_p),
+                                     eri.ctypes.data_as(ctypes.c_void_p),
+                                     eri_pq_max.ctypes.data_as(ctypes.c_void_p),
+                                     civec_max[p0:p1].ctypes.data_as(ctypes.c_void_p),
+                                     ctypes.c_double(myci.select_cutoff),
+                                     ctypes.c_int(norb), ctypes.c_int(nelec),
+                                     ctypes.c_int(p1-p0))
+        return numpy.unique(strs_add[:nadd])
+    strs_add = lib.map_with_threads(select, lib.prange(0, nstrs, blksize))
+    strs_add = numpy.unique(numpy.hstack([numpy.zeros(0,dtype=numpy.int64)]
+                                         + strs_add))
+    #:strs_add = sorted(set(strs_add[:nadd]) - set(strs))
+    strs_add = strs_add[~_isin_sorted(numpy.sort(strs), strs_add)]
     return numpy.asarray(strs_add, dtype=numpy.int64)
 
+def _isin_sorted(sorted_strs, strs):
+    '''Whether the elements of strs can be found in the sorted array sorted_strs'''
+    if len(sorted_strs) == 0:
+        return numpy.zeros(len(strs), dtype=bool)
+    idx = numpy.searchsorted(sorted_strs, strs)
+    idx[idx == len(sorted_strs)] = 0
+    return sorted_strs[idx] == strs
+
 def enlarge_space(myci, civec_strs, eri, norb, nelec):
     if isinstance(civec_strs, (tuple, list)):
         nelec, (strsa, strsb) = _unpack(civec_strs[0], nelec)[1:]
@@ -160,6 +183,58 @@ def cre_des_linkstr(strs, norb, nelec, tril=False):
                               ctypes.c_int(tril))
     return link_index
 
+def update_cre_des_linkstr(link_index, strs_old, strs, norb, nelec, tril=False):
+    '''Update the link table of strs_old (generated by :func:`cre_des_linkstr`)
+    for the new string space strs.  Only the rows of the new strings, and of
+    the strings which are connected to the new or the removed strings, are
+    regenerated.  The rest rows are moved to the new addresses.
+    '''
+    strs_old = numpy.asarray(strs_old, dtype=numpy.int64)
+    strs = numpy.asarray(strs, dtype=numpy.int64)
+    nvir = norb - nelec
+    nstrs = len(strs)
+    kept = _isin_sorted(strs, strs_old)
+    is_old = _isin_sorted(strs_old, strs)
+    changed = numpy.hstack((strs_old[~kept], strs[~is_old]))
+    rows = numpy.where(~is_old)[0]
+    if len(changed) > 0:
+        conn = _single_excitations(changed, norb)
+        conn = conn[_isin_sorted(strs, conn)]
+        rows = numpy.unique(numpy.hstack((rows, numpy.searchsorted(strs, conn))))
+    if len(rows) > nstrs * .5:
+        return cre_des_linkstr(strs, norb, nelec, tril)
+
+    # address in the new space for the kept strings
+    addr = numpy.zeros(len(strs_old), dtype=numpy.int32)
+    addr[kept] = numpy.searchsorted(strs, strs_old[kept])
+    new_index = numpy.zeros((nstrs,nelec+nelec*nvir,4), dtype=numpy.int32)
+    tab = link_index[kept]
+    tab[:,:,2] = addr[tab[:,:,2]] * (tab[:,:,3] != 0)
+    new_index[addr[kept]] = tab
+
+    rows = numpy.asarray(rows, dtype=numpy.int32)
+    new_index[rows] = 0
+    libfci.SCIcre_des_linkstr_rows(new_index.ctypes.data_as(ctypes.c_void_p),
+                                   ctypes.c_int(norb), ctypes.c_int(nstrs),
+                                   ctypes.c_int(nelec),
+                                   strs.ctypes.data_as(ctypes.c_void_p),
+                                   rows.ctypes.data_as(ctypes.c_void_p),
+                                   ctypes.c_int(len(rows)), ctypes.c_int(tril))
+    return new_index
+
+def _single_excitations(strs, norb):
+    '''All strings which are connected to strs by one single excitation'''
+    bits = numpy.left_shift(1, numpy.arange(norb, dtype=numpy.int64))
+    p, q = numpy.tril_indices(norb, -1)
+    pq = bits[p] | bits[q]
+    out = []
+    for p0, p1 in lib.prange(0, len(strs), max(1, int(SELECT_BUFSIZE*1e6/8/len(pq)))):
+        s = strs[p0:p1,None]
+        # one of p, q is occupied and the other one is empty
+        mask = ((s & bits[p]) == 0) != ((s & bits[q]) == 0)
+        out.append(numpy.unique((s ^ pq)[mask]))
+    return numpy.unique(numpy.hstack(out))
+
 def cre_des_linkstr_tril(strs, norb, nelec):
     '''Given intermediates, the link table to generate input strs
     '''
@@ -180,7 +255,7 @@ def des_des_linkstr(strs, norb, nelec, tril=False):
                                      strs.ctypes.data_as(ctypes.c_void_p),
                                      ctypes.c_int(norb), ctypes.c_int(nelec),
                                      ctypes.c_int(nstrs))
-    inter1 = numpy.asarray(sorted(set(inter1[:ninter])), dtype=numpy.int64)
+    inter1 = numpy.unique(inter1[:ninter])
     ninter = len(inter1)
 
     inter = numpy.empty((ninter*nelec), dtype=numpy.int64)
@@ -188,7 +263,7 @@ def des_des_linkstr(strs, norb, nelec, tril=False):
                                      inter1.ctypes.data_as(ctypes.c_void_p),
                                      ctypes.c_int(norb), ctypes.c_int(nelec-1),
                                      ctypes.c_int(ninter))
-    inter = numpy.asarray(sorted(set(inter[:ninter])), dtype=numpy.int64)
+    inter = numpy.unique(inter[:ninter])
     ninter = len(inter)
 
     nvir += 2
@@ -221,7 +296,7 @@ def gen_des_linkstr(strs, norb, nelec):
                                      strs.ctypes.data_as(ctypes.c_void_p),
                                      ctypes.c_int(norb), ctypes.c_int(nelec),
                                      ctypes.c_int(nstrs))
-    inter = numpy.asarray(sorted(set(inter[:ninter])), dtype=numpy.int64)
+    inter = numpy.unique(inter[:ninter])
     ninter = len(inter)
 
     nvir += 1
@@ -248,7 +323,7 @@ def gen_cre_linkstr(strs, norb, nelec):
                                      strs.ctypes.data_as(ctypes.c_void_p),
                                      ctypes.c_int(norb), ctypes.c_int(nelec),
                                      ctypes.c_int(nstrs))
-    inter = numpy.asarray(sorted(set(inter[:ninter])), dtype=numpy.int64)
+    inter = numpy.unique(inter[:ninter])
     ninter = len(inter)
 
     link_index = numpy.zeros((ninter,nelec+1,4), dtype=numpy.int32)
@@ -394,6 +469,7 @@ def kernel_float_space(myci, h1e, eri, norb, nelec, ci0=None,
 
     namax = cistring.num_strings(norb, nelec[0])
     nbmax = cistring.num_strings(norb, nelec[1])
+    link_index = prev = None
     e_last = 0
     float_tol = 3e-4
     conv = False
@@ -404,7 +480,8 @@ def kernel_float_space(myci, h1e, eri, norb, nelec, ci0=None,
                   icycle, (len(ci_strs[0]), len(ci_strs[1])), float_tol)
 
         ci0 = [c.ravel() for c in ci0]
-        link_index = _all_linkstr_index(ci_strs, norb, nelec)
+        link_index = _all_linkstr_index(ci_strs, norb, nelec, prev)
+        prev = (ci_strs, link_index)
         hdiag = myci.make_hdiag(h1e, eri, ci_strs, norb, nelec)
         #e, ci0 = lib.davidson(hop, ci0.reshape(-1), precond, tol=float_tol)
         e, ci0 = myci.eig(hop, ci0, precond, tol=float_tol, lindep=lindep,
@@ -435,7 +512,7 @@ def kernel_float_space(myci, h1e, eri, norb, nelec, ci0=None,
     ci_strs = ci0[0]._strs
     log.debug('Extra CI in selected space %s', (len(ci_strs[0]), len(ci_strs[1])))
     ci0 = [c.ravel() for c in ci0]
-    link_index = _all_linkstr_index(ci_strs, norb, nelec)
+    link_index = _all_linkstr_index(ci_strs, norb, nelec, prev)
     hdiag = myci.make_hdiag(h1e, eri, ci_strs, norb, nelec)
     e, c = myci.eig(hop, ci0, precond, tol=tol, lindep=lindep,
                     max_cycle=max_cycle, max_space=max_space, nroots=nroots,
@@ -844,11 +921,33 @@ def _unpack(civec_strs, nelec, ci_strs=None, spin=None):
         ci_strs = (strsa, strsb)
     return civec_strs, (neleca, nelecb), ci_strs
 
-def _all_linkstr_index(ci_strs, norb, nelec):
-    cd_indexa = cre_des_linkstr_tril(ci_strs[0], norb, nelec[0])
-    dd_indexa = des_des_linkstr_tril(ci_strs[0], norb, nelec[0])
-    cd_indexb = cre_des_linkstr_tril(ci_strs[1], norb, nelec[1])
-    dd_indexb = des_des_linkstr_tril(ci_strs[1], norb, nelec[1])
+def _all_linkstr_index(ci_strs, norb, nelec, prev=None):
+    '''Link tables for the strings ci_strs.  prev = (ci_strs, link_index)
+    of a previous string space.  Its tables are reused or updated if given.
+    '''
+    def gen(strs, nelec, prev_strs, prev_cd, prev_dd):
+        if prev_strs is not None and numpy.array_equal(strs, prev_strs):
+            return prev_cd, prev_dd
+        if prev_strs is not None:
+            cd_index = update_cre_des_linkstr(prev_cd, prev_strs, strs, norb,
+                                              nelec, True)
+        else:
+            cd_index = cre_des_linkstr_tril(strs, norb, nelec)
+        dd_index = des_des_linkstr_tril(strs, norb, nelec)
+        return cd_index, dd_index
+
+    if prev is None:
+        prev_strs = (None, None)
+        prev = (None,) * 4
+    else:
+        prev_strs, prev = prev
+    cd_indexa, dd_indexa = gen(ci_strs[0], nelec[0], prev_strs[0],
+                               prev[0], prev[1])
+    if nelec[0] == nelec[1] and numpy.array_equal(ci_strs[0], ci_strs[1]):
+        cd_indexb, dd_indexb = cd_indexa, dd_indexa
+    else:
+        cd_indexb, dd_indexb = gen(ci_strs[1], nelec[1], prev_strs[1],
+                                   prev[2], prev[3])
     return cd_indexa, dd_indexa, cd_indexb, dd_indexb
 
 # numpy.ndarray does not allow to attach attribtues.  Overwrite the
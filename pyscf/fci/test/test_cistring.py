@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
 import unittest
+import shutil
+import tempfile
 import numpy
 from pyscf.fci import cistring
 
@@ -34,6 +36,40 @@ class KnowValues(unittest.TestCase):
         idx3[:,:,1] = 0
         self.assertTrue(numpy.all(idx2 == idx3))
 
+    def test_linkstr_cache(self):
+        cache = cistring.LinkstrCache(max_memory=.02)
+        ref = cistring._gen_linkstr_index(range(8), 4, tril=True)
+        gen = lambda: cistring._gen_linkstr_index(range(8), 4, tril=True)
+        idx = cache.get(((0,1,2,3,4,5,6,7), 4, True), gen)
+        self.assertEqual(idx.dtype, numpy.int32)
+        self.assertTrue(numpy.array_equal(idx, ref))
+        fail = lambda: self.fail('table is not cached')
+        idx = cache.get(((0,1,2,3,4,5,6,7), 4, True), fail)
+        self.assertTrue(numpy.array_equal(idx, ref))
+        # evicted by the next table
+        cache.get(((0,1,2,3,4,5,6,7,8), 3, False),
+                  cistring._gen_linkstr_index, range(9), 3)
+        self.assertEqual(list(cache._tables.keys()),
+                         [((0,1,2,3,4,5,6,7,8), 3, False)])
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cache = cistring.LinkstrCache(shared_dir=tmpdir)
+            cache.get(((0,1,2,3,4,5,6,7), 4, True), gen)
+            cache1 = cistring.LinkstrCache(shared_dir=tmpdir)
+            idx = cache1.get(((0,1,2,3,4,5,6,7), 4, True), fail)
+            self.assertTrue(numpy.array_equal(idx, ref))
+        finally:
+            shutil.rmtree(tmpdir)
+
+        cistring.gen_linkstr_index(range(8), 4)
+        idx = cistring.gen_linkstr_index(range(8), 4)
+        self.assertTrue(numpy.array_equal(idx, cistring._gen_linkstr_index(range(8), 4)))
+        # the cached table is not modified through the returned copy
+        idx[:] = 0
+        idx = cistring.gen_linkstr_index(range(8), 4)
+        self.assertTrue(numpy.array_equal(idx, cistring._gen_linkstr_index(range(8), 4)))
+
     def test_addr2str(self):
         self.assertEqual(bin(cistring.addr2str(6, 3, 7)), '0b11001')
         self.assertEqual(bin(cistring.addr2str(6, 3, 8)), '0b11010')
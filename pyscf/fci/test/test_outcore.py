@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import unittest
+from functools import reduce
+import numpy
+from pyscf import gto
+from pyscf import scf
+from pyscf import ao2mo
+from pyscf import fci
+from pyscf.lib import vecstore
+
+mol = gto.Mole()
+mol.verbose = 0
+mol.output = None
+mol.atom = [
+    ['H', ( 1.,-1.    , 0.   )],
+    ['H', ( 0.,-1.    ,-1.   )],
+    ['H', ( 0.,-0.5   ,-0.   )],
+    ['H', ( 0.,-0.    ,-1.   )],
+    ['H', ( 1.,-0.5   , 0.   )],
+    ['H', ( 0., 1.    , 1.   )],
+]
+mol.basis = {'H': 'sto-3g'}
+mol.build()
+
+m = scf.RHF(mol)
+m.conv_tol = 1e-15
+ehf = m.scf()
+
+norb = m.mo_coeff.shape[1]
+nelec = (mol.nelectron//2, mol.nelectron//2-1)
+h1e = reduce(numpy.dot, (m.mo_coeff.T, m.get_hcore(), m.mo_coeff))
+g2e = ao2mo.incore.general(m._eri, (m.mo_coeff,)*4, compact=False)
+na = fci.cistring.num_strings(norb, nelec[0])
+nb = fci.cistring.num_strings(norb, nelec[1])
+
+class KnowValues(unittest.TestCase):
+    def test_contract(self):
+        numpy.random.seed(15)
+        ci0 = numpy.random.random((na,nb))
+        ref = fci.direct_spin1.contract_2e(g2e, ci0, norb, nelec)
+        ci1 = fci.outcore.contract_2e(g2e, ci0, norb, nelec, max_memory=1e-3)
+        self.assertAlmostEqual(abs(ci1 - ref).max(), 0, 9)
+
+        store = vecstore.MemmapStore(max_memory=0)
+        x = store.empty('x', na*nb)
+        x[:] = ci0.ravel()
+        out = store.empty('out', na*nb)
+        fci.outcore.contract_2e(g2e, x.reshape(na,nb), norb, nelec,
+                                out=out.reshape(na,nb), max_memory=1e-3,
+                                nproc=2)
+        self.assertAlmostEqual(abs(out.reshape(na,nb) - ref).max(), 0, 9)
+        store.close()
+
+    def test_kernel(self):
+        eref, cref = fci.direct_spin1.kernel(h1e, g2e, norb, nelec, nroots=2)
+        cis = fci.outcore.FCISolver(mol)
+        cis.max_memory = 1e-2
+        e, c = cis.kernel(h1e, g2e, norb, nelec)
+        self.assertAlmostEqual(e, eref[0], 9)
+        self.assertAlmostEqual(abs(numpy.dot(c.ravel(), cref[0].ravel())), 1, 7)
+
+        e, c = cis.kernel(h1e, g2e, norb, nelec, nroots=2)
+        self.assertAlmostEqual(abs(e - eref).max(), 0, 9)
+        self.assertTrue(isinstance(c[0], numpy.memmap))
+
+if __name__ == "__main__":
+    print("Full Tests for out-of-core FCI")
+    unittest.main()
@@ -189,6 +189,21 @@ class KnowValues(unittest.TestCase):
         cd_index1[:,:,1] = 0
         self.assertTrue(numpy.all(cd_index0 == cd_index1))
 
+    def test_update_cre_des_linkstr(self):
+        norb, nelec = 10, 4
+        strs = cistring.gen_strings4orblist(range(norb), nelec)
+        numpy.random.seed(11)
+        strs0 = strs[numpy.random.random(len(strs)) > .5]
+        # remove a few strings and add a few strings
+        strs1 = strs0[numpy.random.random(len(strs0)) > .05]
+        strs1 = numpy.unique(numpy.append(strs1, strs[numpy.random.random(len(strs)) > .97]))
+        for tril in (False, True):
+            cd_index0 = select_ci.cre_des_linkstr(strs0, norb, nelec, tril)
+            cd_index1 = select_ci.update_cre_des_linkstr(cd_index0, strs0, strs1,
+                                                         norb, nelec, tril)
+            ref = select_ci.cre_des_linkstr(strs1, norb, nelec, tril)
+            self.assertTrue(numpy.all(cd_index1 == ref))
+
     def test_des_des_linkstr(self):
         norb, nelec = 10, 4
         strs = cistring.gen_strings4orblist(range(norb), nelec)
@@ -57,6 +57,22 @@ class KnowValues(unittest.TestCase):
         ci3 = fci.direct_spin1.contract_2e(g2e, ci2, norb, neleci)
         self.assertAlmostEqual(numpy.linalg.norm(ci3), 127.49780293866368, 6)
 
+    def test_contract_batch(self):
+        ci1s = fci.direct_spin1.contract_2e_batch(g2e, [ci0, ci1], norb, nelec)
+        self.assertAlmostEqual(abs(ci1s[0] - fci.direct_spin1.contract_2e(g2e, ci0, norb, nelec)).max(), 0, 9)
+        self.assertAlmostEqual(abs(ci1s[1] - fci.direct_spin1.contract_2e(g2e, ci1, norb, nelec)).max(), 0, 9)
+        ci1s = fci.direct_spin1.contract_2e_batch(g2e, [ci2, ci3.ravel()], norb, neleci,
+                                                  max_memory=1e-3)
+        self.assertAlmostEqual(abs(ci1s[0] - fci.direct_spin1.contract_2e(g2e, ci2, norb, neleci)).max(), 0, 9)
+        self.assertEqual(ci1s[1].shape, (ci3.size,))
+        self.assertAlmostEqual(abs(ci1s[1] - fci.direct_spin1.contract_2e(g2e, ci3, norb, neleci).ravel()).max(), 0, 9)
+
+    def test_kernel_nroots(self):
+        e = fci.direct_spin1.kernel(h1e, g2e, norb, nelec, nroots=3,
+                                    davidson_only=True)[0]
+        eref = fci.direct_spin1.kernel(h1e, g2e, norb, nelec, nroots=3)[0]
+        self.assertAlmostEqual(abs(e - eref).max(), 0, 7)
+
     def test_kernel(self):
         eref, cref = fci.direct_spin0.kernel(h1e, g2e, norb, mol.nelectron)
         e, c = fci.direct_spin1.kernel(h1e, g2e, norb, nelec)
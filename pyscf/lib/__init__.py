@@ -17,4 +17,5 @@ from pyscf.lib.numpy_helper import *
 from pyscf.lib.linalg_helper import *
 from pyscf.lib import chkfile
 from pyscf.lib import diis
+from pyscf.lib import vecstore
 from pyscf.lib.misc import StreamObject
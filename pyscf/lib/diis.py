@@ -15,10 +15,14 @@ import h5py
 from . import parameters
 from . import logger
 from . import misc
+from . import vecstore
 
 
 INCORE_SIZE = 1e7
 BLOCK_SIZE  = int(20e6) # ~ 160/320 MB
+# Memory budget (MB) for the DIIS vectors.  The oldest vectors are moved to
+# disk if the budget is exceeded
+MAX_MEMORY = INCORE_SIZE * 8e-6 * 12
 # PCCP, 4, 11
 # GEDIIS, JCTC, 2, 835
 # C2DIIS, IJQC, 45, 31
@@ -31,6 +35,16 @@ class DIIS(object):
             DIIS subspace size. The maximum number of the vectors to be stored.
         min_space
             The minimal size of subspace before DIIS extrapolation.
+        max_memory : float
+            Memory limit (in MB).  Default is the max_memory of dev, the
+            solver which owns the DIIS object.  The vectors are held in
+            memory while they fit in the memory left under this limit.  The
+            oldest vectors are moved to disk when it is exceeded.
+        storage : str
+            Backend to hold the vectors out of the memory. 'memmap' or 'h5'
+            (see lib.vecstore).  Default is lib.param.VECSTORE_BACKEND.
+            Nothing is written to the backend until the vectors exceed the
+            memory limit.
 
     Functions:
         update(x, xerr=None) :
@@ -93,33 +107,39 @@ class DIIS(object):
             self.stdout = sys.stdout
         self.space = 6
         self.min_space = 1
+        if getattr(dev, 'max_memory', None) is not None:
+            self.max_memory = dev.max_memory
+        else:
+            self.max_memory = MAX_MEMORY
+        self.storage = None
 
 ##################################################
 # don't modify the following private variables, they are not input options
         self.filename = filename
-        self._diisfile = None
-        self._buffer = {}
+        self._vecs = None
         self._bookkeep = [] # keep the ordering of input vectors
         self._head = 0
         self._H = None
         self._xprev = None
         self._err_vec_touched = False
+        self._nunsaved = 0  # vectors pushed after the last snapshot
 
-    def _store(self, key, value):
-        if value.size < INCORE_SIZE:
-            self._buffer[key] = value
-
-        # save the error vector if filename is given, this file can be used to
-        # restore the DIIS state
-        if value.size >= INCORE_SIZE or isinstance(self.filename, str):
-            if self._diisfile is None:
-                self._diisfile = misc.H5TmpFile(self.filename)
-            if key in self._diisfile:
-                self._diisfile[key][:] = value
+    def _init_store(self):
+        if self._vecs is None:
+            max_memory = self.max_memory
+            if max_memory is not None:
+                max_memory = max(0, max_memory - misc.current_memory()[0])
+            if isinstance(self.filename, str):
+                # save all vectors in the file which can be used to restore
+                # the DIIS state
+                self._vecs = vecstore.H5Store(max_memory, persist=True,
+                                              filename=self.filename)
             else:
-                self._diisfile[key] = value
-# to avoid "Unable to find a valid file signature" error when reopen from crash
-            self._diisfile.flush()
+                self._vecs = vecstore.new_store(self.storage, max_memory)
+        return self._vecs
+
+    def _store(self, key, value):
+        self._init_store()[key] = value
 
     def push_err_vec(self, xerr):
         self._err_vec_touched = True
@@ -139,6 +159,7 @@ class DIIS(object):
             key = 'x%d' % (self._head)
             self._store(key, x)
             self._head += 1
+            self._nunsaved += 1
 
         elif self._xprev is None:
 # If push_err_vec is not called in advance, the error vector is generated
@@ -153,28 +174,114 @@ class DIIS(object):
             ekey = 'e%d'%self._head
             xkey = 'x%d'%self._head
             self._store(xkey, x)
-            if x.size < INCORE_SIZE:
-                self._buffer[ekey] = x - self._xprev
-                if isinstance(self.filename, str):
-                    self._store(ekey, self._buffer[ekey])
-            else:
-                if ekey not in self._diisfile:
-                    self._diisfile.create_dataset(ekey, (x.size,), x.dtype)
-                for p0,p1 in prange(0, x.size, BLOCK_SIZE):
-                    self._diisfile[ekey][p0:p1] = x[p0:p1] - self._xprev[p0:p1]
+            err = self._vecs.empty(ekey, x.size, x.dtype)
+            for p0,p1 in prange(0, x.size, BLOCK_SIZE):
+                err[p0:p1] = x[p0:p1] - self._xprev[p0:p1]
             self._head += 1
+            self._nunsaved += 1
 
-    def get_err_vec(self, idx):
-        if self._buffer:
-            return self._buffer['e%d'%idx]
+    def _dump_state(self):
+        '''Save the bookkeeping variables with the vectors, so that the DIIS
+        object can be recovered from the file by :func:`restore`'''
+        if isinstance(self.filename, str):
+            self._store('state', numpy.asarray([self._head] + self._bookkeep))
+            if self._xprev is not None:
+                self._store('xprev', self._xprev)
+
+    def dump(self, filename):
+        '''Save the DIIS subspace (the vectors and the bookkeeping variables)
+        in filename.  The DIIS object can be recovered by :func:`restore`.
+        '''
+        with h5py.File(filename, 'w') as f:
+            for i in range(self.get_num_vec()):
+                f['e%d'%i] = numpy.asarray(self.get_err_vec(i))
+                f['x%d'%i] = numpy.asarray(self.get_vec(i))
+            f['state'] = numpy.asarray([self._head] + self._bookkeep)
+            if self._xprev is not None:
+                f['xprev'] = self._xprev
+        return self
+
+    def snapshot(self):
+        '''Copies of the DIIS vectors which were pushed after the last call
+        of snapshot (or restore), and the bookkeeping variables.  Writing the
+        snapshots one after another to the same HDF5 file (key by key) gives
+        the file of :func:`dump`, while each write only involves the new
+        vectors.  Since the data are copied, the file can be written in a
+        background thread.
+        '''
+        nd = self.get_num_vec()
+        snap = {'state': numpy.asarray([self._head] + self._bookkeep)}
+        for i in self._bookkeep[nd-min(self._nunsaved, nd):]:
+            snap['e%d'%i] = numpy.array(self.get_err_vec(i))
+            snap['x%d'%i] = numpy.array(self.get_vec(i))
+        if self._xprev is not None:
+            snap['xprev'] = numpy.array(self._xprev)
+        self._nunsaved = 0
+        return snap
+
+    def restore(self, filename, inplace=True):
+        '''Recover the DIIS subspace from the file generated by :func:`dump`
+        or by a DIIS object which was initialized with the filename.
+
+        Kwargs:
+            inplace : bool
+                Whether to keep the DIIS vectors in filename.  If False, the
+                vectors are copied to the storage of this DIIS object and
+                filename is not modified afterwards.
+        '''
+        if self._vecs is not None:
+            self._vecs.close()
+            self._vecs = None
+        if inplace:
+            self.filename = filename
+            vecs = self._init_store()
+            if 'state' not in vecs:
+                return self
+            state = vecs['state']
+            if 'xprev' in vecs:
+                xprev = numpy.array(vecs['xprev'])
+            else:
+                xprev = None
         else:
-            return self._diisfile['e%d'%idx]
+            with h5py.File(filename, 'r') as f:
+                if 'state' not in f:
+                    return self
+                state = f['state'][:]
+                for i in range(len(state) - 1):
+                    self._store('e%d'%i, f['e%d'%i][:])
+                    self._store('x%d'%i, f['x%d'%i][:])
+                if 'xprev' in f:
+                    xprev = f['xprev'][:]
+                else:
+                    xprev = None
+            vecs = self._init_store()
+
+        self._head = int(state[0])
+        self._bookkeep = [int(i) for i in state[1:]]
+        self._xprev = xprev
+        self._nunsaved = 0
+        if xprev is None:
+            self._err_vec_touched = len(self._bookkeep) > 0
+
+        nd = self.get_num_vec()
+        self._H = None
+        for i in range(nd):
+            ei = numpy.array(self.get_err_vec(i), copy=False)
+            if self._H is None:
+                self._H = numpy.zeros((self.space+1,self.space+1), ei.dtype)
+                self._H[0,1:] = self._H[1:,0] = 1
+            for j in range(i+1):
+                tmp = vecs.dot(ei, 'e%d'%j)
+                self._H[j+1,i+1] = tmp
+                self._H[i+1,j+1] = tmp.conjugate()
+        logger.debug(self, 'Restore %d DIIS vectors from %s', nd, filename)
+        return self
+
+    def get_err_vec(self, idx):
+        return self._vecs['e%d'%idx]
 
     def get_vec(self, idx):
-        if self._buffer:
-            return self._buffer['x%d'%idx]
-        else:
-            return self._diisfile['x%d'%idx]
+        return self._vecs['x%d'%idx]
 
     def get_num_vec(self):
         return len(self._bookkeep)
@@ -195,6 +302,7 @@ class DIIS(object):
 
         nd = self.get_num_vec()
         if nd < self.min_space:
+            self._dump_state()
             return x
 
         dt = numpy.array(self.get_err_vec(self._head-1), copy=False)
@@ -202,10 +310,7 @@ class DIIS(object):
             self._H = numpy.zeros((self.space+1,self.space+1), dt.dtype)
             self._H[0,1:] = self._H[1:,0] = 1
         for i in range(nd):
-            tmp = 0
-            dti = self.get_err_vec(i)
-            for p0,p1 in prange(0, dt.size, BLOCK_SIZE):
-                tmp += numpy.dot(dt[p0:p1].conj(), dti[p0:p1])
+            tmp = self._vecs.dot(dt, 'e%d'%i)
             self._H[self._head,i+1] = tmp
             self._H[i+1,self._head] = tmp.conjugate()
         dt = None
@@ -230,9 +335,9 @@ class DIIS(object):
             self._xprev = xnew = numpy.zeros_like(x.ravel())
 
         for i, ci in enumerate(c[1:]):
-            xi = self.get_vec(i)
             for p0,p1 in prange(0, x.size, BLOCK_SIZE):
-                xnew[p0:p1] += xi[p0:p1] * ci
+                xnew[p0:p1] += self._vecs.getblock('x%d'%i, p0, p1) * ci
+        self._dump_state()
         return xnew.reshape(x.shape)
 
 def prange(start, end, step):
@@ -18,6 +18,7 @@ from pyscf.lib import parameters
 from pyscf.lib import logger
 from pyscf.lib import numpy_helper
 from pyscf.lib import misc
+from pyscf.lib import vecstore
 
 def safe_eigh(h, s, lindep=1e-15):
     '''Solve generalized eigenvalue problem  h v = w s v.
@@ -317,6 +318,8 @@ def davidson1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
     # max_space*2 for holding ax and xs, nroots*2 for holding axt and xt
     _incore = max_memory*1e6/x0[0].nbytes > max_space*2+nroots*3
     lessio = lessio and not _incore
+    # Memory budget of xs and ax when they cannot be entirely held in memory
+    xs_memory = max(max_memory - x0[0].nbytes*nroots*3e-6, 0) * .5
     log.debug1('max_cycle %d  max_space %d  max_memory %d  incore %s',
                max_cycle, max_space, max_memory, _incore)
     heff = None
@@ -332,8 +335,8 @@ def davidson1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
                 xs = []
                 ax = []
             else:
-                xs = _Xlist()
-                ax = _Xlist()
+                xs = _Xlist(xs_memory)
+                ax = _Xlist(xs_memory)
             space = 0
 # Orthogonalize xt space because the basis of subspace xs must be orthogonal
 # but the eigenvectors x0 might not be strictly orthogonal
@@ -619,8 +622,10 @@ def davidson_nosym1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
     #max_cycle = min(max_cycle, x0[0].size)
     max_space = max_space + nroots * 4
     # max_space*2 for holding ax and xs, nroots*2 for holding axt and xt
-    _incore = max_memory*1e6/x0[0].nbytes > max_space*2+nroots * 3
+    _incore = max_memory*1e6/x0[0].nbytes > max_space*2+nroots*3
     lessio = lessio and not _incore
+    # Memory budget of xs and ax when they cannot be entirely held in memory
+    xs_memory = max(max_memory - x0[0].nbytes*nroots*3e-6, 0) * .5
     log.debug1('max_cycle %d  max_space %d  max_memory %d  incore %s',
                max_cycle, max_space, max_memory, _incore)
     heff = None
@@ -636,8 +641,8 @@ def davidson_nosym1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
                 xs = []
                 ax = []
             else:
-                xs = _Xlist()
-                ax = _Xlist()
+                xs = _Xlist(xs_memory)
+                ax = _Xlist(xs_memory)
             space = 0
 # Orthogonalize xt space because the basis of subspace xs must be orthogonal
 # but the eigenvectors x0 might not be strictly orthogonal
@@ -923,6 +928,8 @@ def dgeev1(abop, x0, precond, type=1, tol=1e-12, max_cycle=50, max_space=12,
     # max_space*3 for holding ax, bx and xs, nroots*3 for holding axt, bxt and xt
     _incore = max_memory*1e6/x0[0].nbytes > max_space*3+nroots*3
     lessio = lessio and not _incore
+    # Memory budget of xs, ax and bx when they cannot be entirely held in memory
+    xs_memory = max(max_memory - x0[0].nbytes*nroots*3e-6, 0) / 3
     heff = numpy.empty((max_space,max_space), dtype=x0[0].dtype)
     seff = numpy.empty((max_space,max_space), dtype=x0[0].dtype)
     fresh_start = True
@@ -935,9 +942,9 @@ def dgeev1(abop, x0, precond, type=1, tol=1e-12, max_cycle=50, max_space=12,
                 ax = []
                 bx = []
             else:
-                xs = _Xlist()
-                ax = _Xlist()
-                bx = _Xlist()
+                xs = _Xlist(xs_memory)
+                ax = _Xlist(xs_memory)
+                bx = _Xlist(xs_memory)
             space = 0
 # Orthogonalize xt space because the basis of subspace xs must be orthogonal
 # but the eigenvectors x0 are very likely non-orthogonal when A is non-Hermitian.
@@ -1269,37 +1276,39 @@ def _sort_elast(elast, conv_last, vlast, v, fresh_start):
 
 
 class _Xlist(list):
-    def __init__(self):
-        self.scr_h5 = misc.H5TmpFile()
+    '''A list of vectors held in a vecstore.VecStore.  The oldest vectors
+    are moved to disk when the memory budget max_memory (MB) is exceeded.'''
+    def __init__(self, max_memory=None, backend=None):
+        if max_memory is None:
+            max_memory = 0
+        self.store = vecstore.new_store(backend, max_memory)
         self.index = []
+        self._count = 0
 
     def __getitem__(self, n):
         key = self.index[n]
-        return self.scr_h5[key].value
+        return self.store[key]
 
     def append(self, x):
-        key = str(len(self.index) + 1)
-        if key in self.index:
-            for i in range(len(self.index)+1):
-                if str(i) not in self.index:
-                    key = str(i)
-                    break
+        key = str(self._count)
+        self._count += 1
         self.index.append(key)
-        self.scr_h5[key] = x
-        self.scr_h5.flush()
+        self.store[key] = x
 
     def __setitem__(self, n, x):
         key = self.index[n]
-        self.scr_h5[key][:] = x
-        self.scr_h5.flush()
+        self.store[key] = x
 
     def __len__(self):
         return len(self.index)
 
+    def __iter__(self):
+        for key in self.index:
+            yield self.store[key]
+
     def pop(self, index):
         key = self.index.pop(index)
-        del(self.scr_h5[key])
-
+        del(self.store[key])
 
 if __name__ == '__main__':
     numpy.random.seed(12)
@@ -49,68 +49,103 @@ static void make_occ_vir(int *occ, int *vir, uint64_t str1, int norb)
         }
 }
 
-void SCIcre_des_linkstr(int *link_index, int norb, int nstrs, int nocc,
-                        uint64_t *strs, int store_trilidx)
+static void cre_des_linkstr_row(int *tab, int str_id, int norb, int nstrs,
+                                int nocc, uint64_t *strs, int store_trilidx)
 {
-        int ninter = nstrs;
         int occ[norb];
         int vir[norb];
         int nvir = norb - nocc;
-        int nlink = nocc * nvir + nocc;
-        int str_id, i, a, k, ai, addr;
-        uint64_t str0, str1;
-        int *tab;
-
-        for (str_id = 0; str_id < ninter; str_id++) {
-                str1 = strs[str_id];
-                make_occ_vir(occ, vir, str1, norb);
-
-                tab = link_index + str_id * nlink * 4;
-                if (store_trilidx) {
-                        for (k = 0; k < nocc; k++) {
-                                tab[k*4+0] = occ[k]*(occ[k]+1)/2+occ[k];
-                                tab[k*4+2] = str_id;
-                                tab[k*4+3] = 1;
-                        }
-                        for (a = 0; a < nvir; a++) {
-                        for (i = 0; i < nocc; i++) {
-                                str0 = (str1^(1ULL<<occ[i])) | (1ULL<<vir[a]);
-                                addr = SCIstr2addr(str0, strs, nstrs);
-                                if (addr >= 0) {
-                                        if (vir[a] > occ[i]) {
-                                                ai = vir[a]*(vir[a]+1)/2+occ[i];
-                                        } else {
-                                                ai = occ[i]*(occ[i]+1)/2+vir[a];
-                                        }
-                                        tab[k*4+0] = ai;
-                                        tab[k*4+2] = addr;
-                                        tab[k*4+3] = FCIcre_des_sign(vir[a], occ[i], str1);
-                                        k++;
+        int i, a, k, ai, addr;
+        uint64_t str0;
+        uint64_t str1 = strs[str_id];
+        make_occ_vir(occ, vir, str1, norb);
+
+        if (store_trilidx) {
+                for (k = 0; k < nocc; k++) {
+                        tab[k*4+0] = occ[k]*(occ[k]+1)/2+occ[k];
+                        tab[k*4+2] = str_id;
+                        tab[k*4+3] = 1;
+                }
+                for (a = 0; a < nvir; a++) {
+                for (i = 0; i < nocc; i++) {
+                        str0 = (str1^(1ULL<<occ[i])) | (1ULL<<vir[a]);
+                        addr = SCIstr2addr(str0, strs, nstrs);
+                        if (addr >= 0) {
+                                if (vir[a] > occ[i]) {
+                                        ai = vir[a]*(vir[a]+1)/2+occ[i];
+                                } else {
+                                        ai = occ[i]*(occ[i]+1)/2+vir[a];
                                 }
-                        } }
-
-                } else {
-                        for (k = 0; k < nocc; k++) {
-                                tab[k*4+0] = occ[k];
-                                tab[k*4+1] = occ[k];
-                                tab[k*4+2] = str_id;
-                                tab[k*4+3] = 1;
+                                tab[k*4+0] = ai;
+                                tab[k*4+2] = addr;
+                                tab[k*4+3] = FCIcre_des_sign(vir[a], occ[i], str1);
+                                k++;
                         }
-                        for (a = 0; a < nvir; a++) {
-                        for (i = 0; i < nocc; i++) {
-                                str0 = (str1^(1ULL<<occ[i])) | (1ULL<<vir[a]);
-                                addr = SCIstr2addr(str0, strs, nstrs);
-                                if (addr >= 0) {
-                                        tab[k*4+0] = vir[a];
-                                        tab[k*4+1] = occ[i];
-                                        tab[k*4+2] = addr;
-                                        tab[k*4+3] = FCIcre_des_sign(vir[a], occ[i], str1);
-                                        k++;
-                                }
-                        } }
+                } }
+
+        } else {
+                for (k = 0; k < nocc; k++) {
+                        tab[k*4+0] = occ[k];
+                        tab[k*4+1] = occ[k];
+                        tab[k*4+2] = str_id;
+                        tab[k*4+3] = 1;
                 }
+                for (a = 0; a < nvir; a++) {
+                for (i = 0; i < nocc; i++) {
+                        str0 = (str1^(1ULL<<occ[i])) | (1ULL<<vir[a]);
+                        addr = SCIstr2addr(str0, strs, nstrs);
+                        if (addr >= 0) {
+                                tab[k*4+0] = vir[a];
+                                tab[k*4+1] = occ[i];
+                                tab[k*4+2] = addr;
+                                tab[k*4+3] = FCIcre_des_sign(vir[a], occ[i], str1);
+                                k++;
+                        }
+                } }
+        }
+}
+
+void SCIcre_des_linkstr(int *link_index, int norb, int nstrs, int nocc,
+                        uint64_t *strs, int store_trilidx)
+{
+        int nvir = norb - nocc;
+        int nlink = nocc * nvir + nocc;
+        int str_id;
+#pragma omp parallel default(none) \
+        shared(link_index, norb, nstrs, nocc, strs, store_trilidx, nlink) \
+        private(str_id)
+{
+#pragma omp for schedule(static)
+        for (str_id = 0; str_id < nstrs; str_id++) {
+                cre_des_linkstr_row(link_index+str_id*nlink*4, str_id,
+                                    norb, nstrs, nocc, strs, store_trilidx);
+        }
+}
+}
+
+/*
+ * Regenerate the rows row_ids of the link table.  The other rows are not
+ * touched.  The rows to regenerate should be zeroed by the caller.
+ */
+void SCIcre_des_linkstr_rows(int *link_index, int norb, int nstrs, int nocc,
+                             uint64_t *strs, int *row_ids, int nrows,
+                             int store_trilidx)
+{
+        int nvir = norb - nocc;
+        int nlink = nocc * nvir + nocc;
+        int n;
+#pragma omp parallel default(none) \
+        shared(link_index, norb, nstrs, nocc, strs, row_ids, nrows, \
+               store_trilidx, nlink) \
+        private(n)
+{
+#pragma omp for schedule(static)
+        for (n = 0; n < nrows; n++) {
+                cre_des_linkstr_row(link_index+row_ids[n]*nlink*4, row_ids[n],
+                                    norb, nstrs, nocc, strs, store_trilidx);
         }
 }
+}
 
 void SCIdes_des_linkstr(int *link_index, int norb, int nocc, int nstrs, int ninter,
                         uint64_t *strs, uint64_t *inter, int store_trilidx)
@@ -574,6 +574,26 @@ def background_process(func, *args, **kwargs):
 bg = background = bg_thread = background_thread
 bp = bg_process = background_process
 
+def map_with_threads(func, args, nthreads=None):
+    '''Parallel version of map(func, args) in a pool of Python threads.  It is
+    efficient when func spends most time in numpy or C code which releases
+    the GIL.  Results are returned in the order of args.
+    '''
+    args = list(args)
+    if nthreads is None:
+        nthreads = num_threads()
+    nthreads = min(nthreads, len(args))
+    if nthreads <= 1 or imp.lock_held():
+# Python threads may hang in the import stage.  See call_in_background.
+        return [func(x) for x in args]
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(nthreads)
+    try:
+        return pool.map(func, args)
+    finally:
+        pool.close()
+        pool.join()
+
 
 class H5TmpFile(h5py.File):
     def __init__(self, filename=None, *args, **kwargs):
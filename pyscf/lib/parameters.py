@@ -10,6 +10,12 @@ L_MAX      = 8
 MAX_MEMORY = int(os.environ.get('PYSCF_MAX_MEMORY', 4000)) # MB
 TMPDIR = os.environ.get('TMPDIR', '.')
 TMPDIR = os.environ.get('PYSCF_TMPDIR', TMPDIR)
+# Directory to keep the DF integral tensors which can be shared between jobs.
+# The cache is disabled if DF_CACHE_DIR is None
+DF_CACHE_DIR = os.environ.get('PYSCF_DF_CACHE_DIR', None)
+DF_CACHE_SIZE = int(os.environ.get('PYSCF_DF_CACHE_SIZE', 20000)) # MB
+# Backend to hold the vectors of DIIS and Davidson solvers (incore, memmap, h5)
+VECSTORE_BACKEND = os.environ.get('PYSCF_VECSTORE_BACKEND', 'h5')
 
 BOHR = float(os.environ.get('PYSCF_BOHR', BOHR))
 LIGHT_SPEED = float(os.environ.get('PYSCF_LIGHT_SPEED', LIGHT_SPEED))
@@ -0,0 +1,144 @@
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import unittest
+import tempfile
+import numpy
+import h5py
+from pyscf import lib
+from pyscf.lib import vecstore
+
+class KnowValues(unittest.TestCase):
+    def test_backends(self):
+        numpy.random.seed(1)
+        x = numpy.random.random(100)
+        for backend in ('incore', 'memmap', 'h5'):
+            store = vecstore.new_store(backend, max_memory=100*8*2.5e-6)
+            ref = {}
+            for i in range(6):
+                ref[str(i)] = store[str(i)] = numpy.random.random(100)
+            del(store['2'])
+            del(ref['2'])
+            v = store.empty('9', 100)
+            v[:50] = 1
+            v[50:] = 2
+            ref['9'] = numpy.append(numpy.ones(50), numpy.ones(50)*2)
+            store.flush()
+            self.assertEqual(sorted(store.keys()), sorted(ref.keys()))
+            for k in ref:
+                self.assertAlmostEqual(abs(store[k] - ref[k]).max(), 0, 14)
+                self.assertAlmostEqual(store.dot(x, k), numpy.dot(x, ref[k]), 12)
+            store.close()
+
+    def test_spill_on_demand(self):
+        store = vecstore.new_store('h5', max_memory=1)
+        store['a'] = numpy.ones(100)
+        self.assertTrue(store._h5file is None)
+        store['b'] = numpy.ones(200000)
+        store.flush()
+        self.assertTrue(store._h5file is not None)
+        self.assertAlmostEqual(abs(store['a'] - 1).max(), 0, 14)
+        store.close()
+
+        store = vecstore.new_store('memmap', max_memory=1)
+        store['a'] = numpy.ones(100)
+        self.assertTrue(store._dir is None)
+        store.close()
+
+        mf = lib.StreamObject()
+        mf.max_memory = 1234
+        self.assertEqual(lib.diis.DIIS(mf).max_memory, 1234)
+
+    def test_diis_outcore(self):
+        numpy.random.seed(1)
+        a = numpy.random.random((50,50)) * .05
+        b = numpy.random.random(50)
+        def solve(backend, max_memory):
+            adiis = lib.diis.DIIS()
+            adiis.storage = backend
+            adiis.max_memory = max_memory
+            x = numpy.zeros(50)
+            for i in range(12):
+                x = adiis.update(numpy.dot(a, x) + b)
+            return x
+        ref = solve('incore', None)
+        self.assertAlmostEqual(abs(numpy.dot(a, ref) + b - ref).max(), 0, 7)
+        self.assertAlmostEqual(abs(solve('memmap', 1e-3) - ref).max(), 0, 12)
+        self.assertAlmostEqual(abs(solve('h5', 1e-3) - ref).max(), 0, 12)
+        self.assertAlmostEqual(abs(solve('h5', 0) - ref).max(), 0, 12)
+
+    def test_diis_restore(self):
+        numpy.random.seed(1)
+        a = numpy.random.random((50,50)) * .05
+        b = numpy.random.random(50)
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        adiis = lib.diis.DIIS(filename=ftmp.name)
+        ref = lib.diis.DIIS()
+        x = x1 = numpy.zeros(50)
+        for i in range(5):
+            x = adiis.update(numpy.dot(a, x) + b)
+            x1 = ref.update(numpy.dot(a, x1) + b)
+        adiis._vecs.close()
+
+        adiis = lib.diis.DIIS().restore(ftmp.name)
+        for i in range(5):
+            x = adiis.update(numpy.dot(a, x) + b)
+            x1 = ref.update(numpy.dot(a, x1) + b)
+        self.assertAlmostEqual(abs(x - x1).max(), 0, 12)
+
+    def test_diis_dump(self):
+        numpy.random.seed(1)
+        a = numpy.random.random((50,50)) * .05
+        b = numpy.random.random(50)
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        adiis = lib.diis.DIIS()
+        ref = lib.diis.DIIS()
+        x = x1 = numpy.zeros(50)
+        for i in range(5):
+            x = adiis.update(numpy.dot(a, x) + b)
+            x1 = ref.update(numpy.dot(a, x1) + b)
+        adiis.dump(ftmp.name)
+        # updates after the dump are not restored
+        adiis.update(numpy.dot(a, x) + b)
+
+        adiis = lib.diis.DIIS().restore(ftmp.name, inplace=False)
+        for i in range(5):
+            x = adiis.update(numpy.dot(a, x) + b)
+            x1 = ref.update(numpy.dot(a, x1) + b)
+        self.assertAlmostEqual(abs(x - x1).max(), 0, 12)
+
+    def test_diis_snapshot(self):
+        numpy.random.seed(1)
+        a = numpy.random.random((50,50)) * .05
+        b = numpy.random.random(50)
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        adiis = lib.diis.DIIS()
+        adiis.space = 3
+        ref = lib.diis.DIIS()
+        ref.space = 3
+        x = x1 = numpy.zeros(50)
+        with h5py.File(ftmp.name, 'w') as f:
+            for i in range(8):
+                x = adiis.update(numpy.dot(a, x) + b)
+                x1 = ref.update(numpy.dot(a, x1) + b)
+                if i % 3 == 1:
+                    snap = adiis.snapshot()
+                    self.assertTrue(len(snap) <= 8)
+                    for key, val in snap.items():
+                        if key in f:
+                            del(f[key])
+                        f[key] = val
+        # updates after the last snapshot are not restored
+        adiis.update(numpy.dot(a, x) + b)
+
+        adiis = lib.diis.DIIS().restore(ftmp.name, inplace=False)
+        adiis.space = 3
+        for i in range(5):
+            x = adiis.update(numpy.dot(a, x) + b)
+            x1 = ref.update(numpy.dot(a, x1) + b)
+        self.assertAlmostEqual(abs(x - x1).max(), 0, 12)
+
+if __name__ == "__main__":
+    print("Full Tests for vecstore")
+    unittest.main()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Storage of the vectors of iterative subspace methods (DIIS, Davidson)
+
+Vectors are held in memory until the memory budget is exhausted.  Then the
+oldest vectors are spilled to the storage backend:
+
+* InCoreStore: no backend, all vectors are kept in memory.
+* MemmapStore: every spilled vector is a numpy memmap file.
+* H5Store: the spilled vectors are written to a HDF5 file by background
+  threads (write-behind).  The solver does not wait for the disk.
+'''
+
+import os
+import imp
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy
+import h5py
+from pyscf.lib import parameters
+from pyscf.lib import misc
+
+BLOCK_SIZE = int(20e6)  # ~ 160/320 MB
+
+class VecStore(object):
+    '''Dict-like storage of 1D vectors with a memory budget.
+
+    Attributes:
+        max_memory : float or None
+            Memory budget (in MB) for the vectors held in memory.  When it is
+            exceeded, the oldest vectors are moved to the backend.  None
+            means no limit.
+        persist : bool
+            Whether to save every vector in the backend, even the ones held in
+            memory.  It is needed if the storage is used to restore a
+            calculation.
+
+    The stored arrays are not copied.  They should not be modified in place
+    after being stored.
+    '''
+    def __init__(self, max_memory=None, persist=False):
+        self.max_memory = max_memory
+        self.persist = persist
+        self._incore = OrderedDict()
+        self._mem_size = 0
+        self._outcore = set()
+
+    def __setitem__(self, key, value):
+        value = numpy.asarray(value).ravel()
+        if key in self:
+            del self[key]
+        if self.persist:
+            self._save(key, value)
+            self._outcore.add(key)
+        if self._fit_incore(value.nbytes):
+            self._incore[key] = value
+            self._mem_size += value.nbytes
+        elif not self.persist:
+            self._save(key, value)
+            self._outcore.add(key)
+
+    def __getitem__(self, key):
+        if key in self._incore:
+            return self._incore[key]
+        elif key in self._outcore:
+            return self._load(key)
+        else:
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        if key in self._incore:
+            self._mem_size -= self._incore.pop(key).nbytes
+        if key in self._outcore:
+            self._outcore.remove(key)
+            self._delete(key)
+
+    def __contains__(self, key):
+        return key in self._incore or key in self._outcore
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        return list(self._incore.keys()) + [k for k in self._outcore
+                                            if k not in self._incore]
+
+    def _fit_incore(self, nbytes):
+        '''Spill the oldest vectors until the new vector of nbytes fits in the
+        memory budget.  Returns False if it cannot be held in memory.'''
+        if self.max_memory is None:
+            return True
+        budget = self.max_memory * 1e6
+        if nbytes > budget:
+            return False
+        while self._incore and self._mem_size + nbytes > budget:
+            key, value = self._incore.popitem(last=False)
+            self._mem_size -= value.nbytes
+            if key not in self._outcore:
+                self._save(key, value)
+                self._outcore.add(key)
+        return True
+
+    def empty(self, key, shape, dtype=numpy.double):
+        '''Allocate a vector for key.  The returned array (or the array-like
+        object of the backend) can be filled block by block.'''
+        size = int(numpy.prod(shape))
+        if key in self:
+            del self[key]
+        if not self.persist and self._fit_incore(size*numpy.dtype(dtype).itemsize):
+            value = self._incore[key] = numpy.empty(size, dtype)
+            self._mem_size += value.nbytes
+        else:
+            value = self._create(key, size, dtype)
+            self._outcore.add(key)
+        return value
+
+    def getblock(self, key, p0, p1):
+        '''v[p0:p1] of the stored vector v'''
+        if key in self._incore:
+            return self._incore[key][p0:p1]
+        elif key in self._outcore:
+            return self._load_block(key, p0, p1)
+        else:
+            raise KeyError(key)
+
+    def dot(self, x, key):
+        '''Inner product <x|v> of x and the stored vector v, evaluated block
+        by block to avoid loading the whole vector v'''
+        x = x.ravel()
+        s = 0
+        for p0, p1 in misc.prange(0, x.size, BLOCK_SIZE):
+            s += numpy.dot(x[p0:p1].conj(), self.getblock(key, p0, p1))
+        return s
+
+    def flush(self):
+        pass
+
+    def close(self):
+        '''Release the vectors held in memory.  The vectors saved in the
+        backend of a persistent storage are kept.'''
+        self._incore.clear()
+        self._mem_size = 0
+
+    def _save(self, key, value):
+        raise NotImplementedError
+
+    def _load(self, key):
+        raise NotImplementedError
+
+    def _load_block(self, key, p0, p1):
+        return self._load(key)[p0:p1]
+
+    def _create(self, key, size, dtype):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+
+class InCoreStore(VecStore):
+    '''Keep all vectors in memory'''
+    def __init__(self, max_memory=None, persist=False):
+        VecStore.__init__(self, None, False)
+
+
+class MemmapStore(VecStore):
+    '''Spill vectors to numpy memmap files.  The spilled vectors are read
+    lazily page by page by the OS.'''
+    def __init__(self, max_memory=None, persist=False, dir=None):
+        VecStore.__init__(self, max_memory, persist)
+        if dir is None:
+            dir = parameters.TMPDIR
+        self._tmpdir = dir
+        self._dir = None  # created when the first vector is spilled
+        self._files = {}
+        self._count = 0
+
+    def _create(self, key, size, dtype):
+        if self._dir is None:
+            self._dir = tempfile.mkdtemp(prefix='vecstore', dir=self._tmpdir)
+        fname = os.path.join(self._dir, '%d.npy' % self._count)
+        self._count += 1
+        mm = numpy.lib.format.open_memmap(fname, mode='w+', dtype=dtype,
+                                          shape=(size,))
+        self._files[key] = (fname, mm)
+        return mm
+
+    def _save(self, key, value):
+        self._create(key, value.size, value.dtype)[:] = value
+
+    def _load(self, key):
+        v = self._files[key][1].view()
+        v.flags.writeable = False
+        return v
+
+    def _delete(self, key):
+        fname, mm = self._files.pop(key)
+        del mm
+        if os.path.isfile(fname):
+            os.remove(fname)
+
+    def close(self):
+        VecStore.close(self)
+        self._files.clear()
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class H5Store(VecStore):
+    '''Spill vectors to a HDF5 file.  The vectors are written by a background
+    thread.  Until the writing is finished, the vector is served from
+    memory.'''
+    def __init__(self, max_memory=None, persist=False, filename=None):
+        VecStore.__init__(self, max_memory, persist)
+        self._h5file = None
+        if persist or filename is not None:
+            self._h5file = misc.H5TmpFile(filename, 'a')
+            if persist:
+                # vectors saved by a previous run can be read back
+                self._outcore.update(self._h5file.keys())
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._writer = None
+# Python threads may hang in the import stage.  See misc.call_in_background
+        self.async_write = not (imp.lock_held() or h5py.version.version[:4] == '2.2.')
+
+    @property
+    def _h5(self):
+        # The temporary file is created when the first vector is spilled
+        if self._h5file is None:
+            with self._lock:
+                if self._h5file is None:
+                    self._h5file = misc.H5TmpFile()
+        return self._h5file
+
+    def _write(self, key, value):
+        if key in self._h5:
+            dset = self._h5[key]
+            if dset.shape == value.shape and dset.dtype == value.dtype:
+                dset[:] = value
+            else:
+                del(self._h5[key])
+                self._h5[key] = value
+        else:
+            self._h5[key] = value
+# to avoid "Unable to find a valid file signature" error when reopen from crash
+        self._h5.flush()
+        with self._lock:
+            if self._pending.get(key) is value:
+                del(self._pending[key])
+
+    def _remove(self, key):
+        if key in self._h5:
+            del(self._h5[key])
+
+    def _run_after(self, writer, fn, *args):
+        if writer is not None:
+            writer.join()
+        fn(*args)
+
+    def _submit(self, fn, *args):
+        if self.async_write:
+            # Chain the writers so that the file operations are executed in
+            # order without blocking the caller
+            self._writer = misc.background_thread(self._run_after,
+                                                  self._writer, fn, *args)
+        else:
+            fn(*args)
+
+    def _save(self, key, value):
+        with self._lock:
+            self._pending[key] = value
+        self._submit(self._write, key, value)
+
+    def _load(self, key):
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+        return self._h5[key][:]
+
+    def _load_block(self, key, p0, p1):
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key][p0:p1]
+        return self._h5[key][p0:p1]
+
+    def _create(self, key, size, dtype):
+        self.flush()
+        if key in self._h5:
+            del(self._h5[key])
+        return self._h5.create_dataset(key, (size,), dtype)
+
+    def _delete(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+        self._submit(self._remove, key)
+
+    def flush(self):
+        '''Wait for the background writing'''
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+    def close(self):
+        self.flush()
+        VecStore.close(self)
+        if self._h5file is not None:
+            self._h5file.close()
+
+
+_BACKENDS = {
+    'incore': InCoreStore,
+    'memmap': MemmapStore,
+    'h5'    : H5Store,
+}
+
+def new_store(backend=None, max_memory=None, persist=False, **kwargs):
+    '''Create a vector storage.
+
+    Kwargs:
+        backend : str or VecStore class
+            'incore', 'memmap' or 'h5'.  Default is parameters.VECSTORE_BACKEND.
+            The memmap and h5 backends hold the vectors in memory and create
+            their files only when max_memory is exceeded.
+        max_memory : float
+            Memory budget in MB for the vectors held in memory.
+        persist : bool
+            Save all vectors in the backend.
+        filename : str
+            HDF5 file name for the 'h5' backend.
+    '''
+    if backend is None:
+        backend = parameters.VECSTORE_BACKEND
+    if isinstance(backend, str):
+        backend = _BACKENDS[backend.lower()]
+    return backend(max_memory=max_memory, persist=persist, **kwargs)
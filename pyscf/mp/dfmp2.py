@@ -15,8 +15,17 @@ from pyscf import df
 from pyscf.mp import mp2
 #from pyscf.mp.mp2 import make_rdm1, make_rdm2, make_rdm1_ao
 
+# Fraction of max_memory to hold the (ia|L) tensor in memory.  If it does not
+# fit, the tensor is saved on disk and loaded by the tiles of occupied orbitals.
+OVL_INCORE_FRACTION = .4
+
 def kernel(mp, mo_energy=None, mo_coeff=None, eris=None, with_t2=True,
            verbose=logger.NOTE):
+    '''DF-MP2 energy.  The (ia|jb) integrals are formed tile by tile of the
+    occupied pairs (I,J) from the (ia|L) tensor.  The tiles are computed in a
+    pool of mp.tile_threads threads.  With with_t2=False, the t2 amplitudes
+    are not stored and the memory footprint is bounded by mp.max_memory.
+    '''
     if mo_energy is None or mo_coeff is None:
         mo_coeff = mp2._mo_without_core(mp, mp.mo_coeff)
         mo_energy = mp2._mo_energy_without_core(mp, mp.mo_energy)
@@ -25,25 +34,96 @@ def kernel(mp, mo_energy=None, mo_coeff=None, eris=None, with_t2=True,
         # not supported when mo_energy or mo_coeff is given.
         assert(mp.frozen is 0 or mp.frozen is None)
 
+    log = logger.new_logger(mp, verbose)
+    time0 = (time.clock(), time.time())
     nocc = mp.nocc
     nvir = mp.nmo - nocc
+    naux = _get_df(mp).get_naoaux()
     eia = mo_energy[:nocc,None] - mo_energy[None,nocc:]
 
-    t2 = None
-    emp2 = 0
-    for istep, qov in enumerate(mp.loop_ao2mo(mo_coeff, nocc)):
-        logger.debug(mp, 'Load cderi step %d', istep)
-        for i in range(nocc):
-            buf = numpy.dot(qov[:,i*nvir:(i+1)*nvir].T,
-                            qov).reshape(nvir,nocc,nvir)
-            gi = numpy.array(buf, copy=False)
-            gi = gi.reshape(nvir,nocc,nvir).transpose(1,0,2)
-            t2i = gi/lib.direct_sum('jb+a->jba', eia, eia[i])
-            emp2 += numpy.einsum('jab,jab', t2i, gi) * 2
-            emp2 -= numpy.einsum('jab,jba', t2i, gi)
+    mem_now = lib.current_memory()[0]
+    max_memory = max(2000, mp.max_memory*.9-mem_now)
+    if with_t2:
+        t2 = numpy.empty((nocc,nocc,nvir,nvir))
+        max_memory = max(2000, max_memory-t2.nbytes/1e6)
+    else:
+        t2 = None
+
+    # (ia|L) saved as ovL[i,a,L] so that the tile of occupied orbitals I is
+    # a contiguous (I*a,L) matrix
+    if nocc*nvir*naux*8/1e6 < max_memory*OVL_INCORE_FRACTION:
+        ovL = numpy.empty((nocc,nvir,naux))
+        # The rest of the memory for the tiles
+        max_memory -= ovL.nbytes/1e6
+    else:
+        ftmp = lib.H5TmpFile()
+        ovL = ftmp.create_dataset('ovL', (nocc,nvir,naux), 'f8')
+    def save(p0, p1, qov):
+        ovL[:,:,p0:p1] = lib.transpose(qov).reshape(nocc,nvir,p1-p0)
+    p1 = 0
+    with lib.call_in_background(save) as async_save:
+        for istep, qov in enumerate(mp.loop_ao2mo(mo_coeff, nocc)):
+            logger.debug(mp, 'Load cderi step %d', istep)
+            p0, p1 = p1, p1 + qov.shape[0]
+            async_save(p0, p1, qov.copy())
+    time1 = log.timer_debug1('(ia|L)', *time0)
+
+    nthreads = mp.tile_threads
+    if nthreads is None:
+        nthreads = lib.num_threads()
+    occblk = _occ_tile_size(nocc, nvir, naux, max_memory, nthreads)
+    log.debug1('DF-MP2 occupied tile size %d, %d threads', occblk, nthreads)
+
+    def contract(i0, i1, ovL_i, j0j1):
+        j0, j1 = j0j1
+        if j0 == i0:
+            ovL_j = ovL_i
+        else:
+            ovL_j = numpy.asarray(ovL[j0:j1]).reshape(-1,naux)
+        gi = lib.dot(ovL_i, ovL_j.T).reshape(i1-i0,nvir,j1-j0,nvir)
+        gi = gi.transpose(0,2,1,3)
+        t2ij = gi/lib.direct_sum('ia+jb->ijab', eia[i0:i1], eia[j0:j1])
+        e = numpy.einsum('ijab,ijab', t2ij, gi) * 2
+        e-= numpy.einsum('ijab,ijba', t2ij, gi)
+        if with_t2:
+            t2[i0:i1,j0:j1] = t2ij
+        if j0 < i0:
+            # t2[j,i,b,a] = t2[i,j,a,b].  Tile (J,I) gives the same energy
+            e *= 2
+            if with_t2:
+                t2[j0:j1,i0:i1] = t2ij.transpose(1,0,3,2)
+        return e
 
+    emp2 = 0
+    for i0, i1 in lib.prange(0, nocc, occblk):
+        ovL_i = numpy.asarray(ovL[i0:i1]).reshape(-1,naux)
+        es = lib.map_with_threads(lambda j0j1: contract(i0, i1, ovL_i, j0j1),
+                                  lib.prange(0, i1, occblk), nthreads)
+        emp2 += sum(es)
+        ovL_i = None
+    log.timer_debug1('DF-MP2 tiles', *time1)
     return emp2, t2
 
+def _occ_tile_size(nocc, nvir, naux, max_memory, nthreads):
+    '''The largest tile of occupied orbitals which fits in max_memory.  Each
+    thread holds one tile of (ia|L) and three buffers of (ia|jb) of the tile
+    pair, in addition to the (ia|L) tile held by the main thread.'''
+    mem_avail = max_memory * 1e6 / 8
+    occblk = nocc
+    while occblk > 1:
+        mem = ((1+nthreads) * occblk*nvir*naux +
+               nthreads * 3 * occblk**2*nvir**2)
+        if mem < mem_avail:
+            break
+        occblk = (occblk + 1) // 2
+    return max(1, occblk)
+
+def _get_df(mp):
+    if mp.with_df is None:
+        return mp._scf.with_df
+    else:
+        return mp.with_df
+
 
 class DFMP2(mp2.MP2):
     def __init__(self, mf, frozen=0, mo_coeff=None, mo_occ=None):
@@ -53,6 +133,10 @@ class DFMP2(mp2.MP2):
             self.with_df = df.DF(mf.mol)
             self.with_df.auxbasis = df.make_auxbasis(mf.mol, mp2fit=True)
         mp2.MP2.__init__(self, mf, frozen, mo_coeff, mo_occ)
+# Number of threads to compute the tiles of occupied pairs.  None means
+# lib.num_threads().  Note BLAS may be multi-threaded as well.
+        self.tile_threads = None
+        self._keys = self._keys.union(['tile_threads'])
 
     @lib.with_doc(mp2.MP2.kernel.__doc__)
     def kernel(self, mo_energy=None, mo_coeff=None, eris=None, with_t2=True):
@@ -63,10 +147,7 @@ class DFMP2(mp2.MP2):
         nmo = mo.shape[1]
         ijslice = (0, nocc, nocc, nmo)
         Lov = None
-        if self.with_df is None:
-            with_df = self._scf.with_df
-        else:
-            with_df = self.with_df
+        with_df = _get_df(self)
 
         nvir = nmo - nocc
         naux = with_df.get_naoaux()
@@ -144,6 +144,34 @@ class KnownValues(unittest.TestCase):
         e = pt.kernel()[0]
         self.assertAlmostEqual(e, -0.14708846352674113, 9)
 
+    def test_dfmp2_tiles(self):
+        mf_df = mf.density_fit('weigend')
+        # Reference from the (ia|jb) integrals of the DF object
+        e0, t2ref = mp.mp2.RMP2(mf_df).kernel()
+        pt = mp.dfmp2.DFMP2(mf_df)
+        e, t2 = pt.kernel()
+        self.assertAlmostEqual(e, e0, 9)
+        self.assertAlmostEqual(abs(t2 - t2ref).max(), 0, 9)
+
+        # (ia|L) on disk, tiles of occupied orbitals which do not divide nocc
+        self.assertEqual(pt.nocc, 5)
+        pt.tile_threads = 3
+        incore_fraction = mp.dfmp2.OVL_INCORE_FRACTION
+        occ_tile_size = mp.dfmp2._occ_tile_size
+        mp.dfmp2.OVL_INCORE_FRACTION = 0
+        try:
+            for blk in (2, 3):
+                mp.dfmp2._occ_tile_size = lambda *args: blk
+                e, t2 = pt.kernel()
+                self.assertAlmostEqual(e, e0, 9)
+                self.assertAlmostEqual(abs(t2 - t2ref).max(), 0, 9)
+            e = pt.kernel(with_t2=False)[0]
+        finally:
+            mp.dfmp2.OVL_INCORE_FRACTION = incore_fraction
+            mp.dfmp2._occ_tile_size = occ_tile_size
+        self.assertAlmostEqual(e, e0, 9)
+        self.assertTrue(pt.t2 is None)
+
     def test_mp2_frozen(self):
         pt = mp.mp2.MP2(mf)
         pt.frozen = [1]
@@ -20,10 +20,16 @@ from pyscf.pbc.cc.kccsd import get_frozen_mask
 from pyscf.pbc.cc import kintermediates_rhf as imdk
 from pyscf.lib import linalg_helper
 from pyscf.pbc.lib import kpts_helper
+from pyscf.pbc.lib.kpts_helper import gather_kblocks
+from pyscf.pbc.lib.kpts_helper import create_kblock_dataset, KptsBlockStore
 
 #einsum = np.einsum
 einsum = lib.einsum
 
+# Fraction of the free memory (cc.max_memory - current memory) to cache the
+# k-point blocks of the HDF5 ERIs and the Wvvvv intermediates
+ERI_CACHE_FRACTION = .5
+
 # This is restricted (R)CCSD
 # Ref: Hirata, et al., J. Chem. Phys. 120, 2581 (2004)
 
@@ -98,6 +104,7 @@ def update_amps(cc, t1, t2, eris):
     Lvv = imdk.Lvv(t1,t2,eris,kconserv)
     Woooo = imdk.cc_Woooo(t1,t2,eris,kconserv)
     Wvvvv = imdk.cc_Wvvvv(t1,t2,eris,kconserv)
+    Wvvvv.max_memory = max(0, cc.max_memory - lib.current_memory()[0]) * ERI_CACHE_FRACTION
     Wvoov = imdk.cc_Wvoov(t1,t2,eris,kconserv)
     Wvovo = imdk.cc_Wvovo(t1,t2,eris,kconserv)
 
@@ -109,6 +116,9 @@ def update_amps(cc, t1, t2, eris):
         Lvv[k] -= np.diag(np.diag(fvv[k]))
 
     # T1 equation
+    # The k-point blocks of the summed k-index (kx) are stacked and contracted
+    # in one einsum call.
+    kranges = np.arange(nkpts)
     t1new = np.array(fov).astype(t1.dtype).conj()
     for ka in range(nkpts):
         ki = ka
@@ -117,86 +127,140 @@ def update_amps(cc, t1, t2, eris):
         t1new[ka] += einsum('ac,ic->ia',Fvv[ka],t1[ki])
         t1new[ka] += -einsum('ki,ka->ia',Foo[ki],t1[ka])
 
-        tau_term = np.empty((nkpts,nocc,nocc,nvir,nvir), dtype=t1.dtype)
-        for kk in range(nkpts):
-            tau_term[kk] = 2*t2[kk,ki,kk] - t2[ki,kk,kk].transpose(1,0,2,3)
+        #:for kk in range(nkpts):
+        #:    tau_term[kk] = 2*t2[kk,ki,kk] - t2[ki,kk,kk].transpose(1,0,2,3)
+        tau_term = 2*t2[kranges,ki,kranges] - t2[ki,kranges,kranges].transpose(0,2,1,3,4)
         tau_term[ka] += einsum('ic,ka->kica',t1[ki],t1[ka])
+        #:for kk in range(nkpts):
+        #:    kc = kk
+        #:    t1new[ka] += einsum('kc,kica->ia',Fov[kc],tau_term[kk])
+        #:    t1new[ka] +=  einsum('akic,kc->ia',2*eris.voov[ka,kk,ki],t1[kc])
+        #:    t1new[ka] +=  einsum('kaic,kc->ia', -eris.ovov[kk,ka,ki],t1[kc])
+        t1new[ka] += einsum('xkc,xkica->ia',Fov,tau_term)
+        t1new[ka] += 2*einsum('xakic,xkc->ia',eris.voov[ka,:,ki],t1)
+        t1new[ka] += -einsum('xkaic,xkc->ia',eris.ovov[:,ka,ki],t1)
+        tau_term = None
 
         for kk in range(nkpts):
-            kc = kk
-            t1new[ka] += einsum('kc,kica->ia',Fov[kc],tau_term[kk])
-
-            t1new[ka] +=  einsum('akic,kc->ia',2*eris.voov[ka,kk,ki],t1[kc])
-            t1new[ka] +=  einsum('kaic,kc->ia', -eris.ovov[kk,ka,ki],t1[kc])
-
-            for kc in range(nkpts):
-                kd = kconserv[ka,kc,kk]
-
-                Svovv = 2*eris.vovv[ka,kk,kc] - eris.vovv[ka,kk,kd].transpose(0,1,3,2)
-                tau_term_1 = t2[ki,kk,kc].copy()
-                if ki == kc and kk == kd:
-                    tau_term_1 += einsum('ic,kd->ikcd',t1[ki],t1[kk])
-                t1new[ka] += einsum('akcd,ikcd->ia',Svovv,tau_term_1)
-
-                # kk - ki + kl = kc
-                #  => kl = ki - kk + kc
-                kl = kconserv[ki,kk,kc]
-                Sooov = 2*eris.ooov[kk,kl,ki] - eris.ooov[kl,kk,ki].transpose(1,0,2,3)
-                tau_term_1 = t2[kk,kl,ka].copy()
-                if kk == ka and kl == kc:
-                    tau_term_1 += einsum('ka,lc->klac',t1[ka],t1[kc])
-                t1new[ka] += -einsum('klic,klac->ia',Sooov,tau_term_1)
+            #:for kc in range(nkpts):
+            #:    kd = kconserv[ka,kc,kk]
+            #:    Svovv = 2*eris.vovv[ka,kk,kc] - eris.vovv[ka,kk,kd].transpose(0,1,3,2)
+            #:    tau_term_1 = t2[ki,kk,kc].copy()
+            #:    if ki == kc and kk == kd:
+            #:        tau_term_1 += einsum('ic,kd->ikcd',t1[ki],t1[kk])
+            #:    t1new[ka] += einsum('akcd,ikcd->ia',Svovv,tau_term_1)
+            kds = kconserv[ka,kranges,kk]
+            Svovv = 2*np.asarray(eris.vovv[ka,kk]) \
+                    - gather_kblocks(eris.vovv, ka, kk, kds).transpose(0,1,2,4,3)
+            tau_term_1 = t2[ki,kk].copy()
+            # kc == ki  =>  kd == kk
+            tau_term_1[ki] += einsum('ic,kd->ikcd',t1[ki],t1[kk])
+            t1new[ka] += einsum('xakcd,xikcd->ia',Svovv,tau_term_1)
+
+            #:for kc in range(nkpts):
+            #:    # kk - ki + kl = kc
+            #:    #  => kl = ki - kk + kc
+            #:    kl = kconserv[ki,kk,kc]
+            #:    Sooov = 2*eris.ooov[kk,kl,ki] - eris.ooov[kl,kk,ki].transpose(1,0,2,3)
+            #:    tau_term_1 = t2[kk,kl,ka].copy()
+            #:    if kk == ka and kl == kc:
+            #:        tau_term_1 += einsum('ka,lc->klac',t1[ka],t1[kc])
+            #:    t1new[ka] += -einsum('klic,klac->ia',Sooov,tau_term_1)
+            kls = kconserv[ki,kk,kranges]
+            Sooov = 2*gather_kblocks(eris.ooov, kk, kls, ki) \
+                    - gather_kblocks(eris.ooov, kls, kk, ki).transpose(0,2,1,3,4)
+            tau_term_1 = t2[kk,kls,ka]
+            if kk == ka:
+                # kk == ka  =>  kl == kc
+                tau_term_1 = tau_term_1 + einsum('ka,xlc->xklac',t1[ka],t1)
+            t1new[ka] += -einsum('xklic,xklac->ia',Sooov,tau_term_1)
+            Svovv = Sooov = tau_term_1 = None
 
     # T2 equation
+    def update_t2_block(kija):
+        ki, kj, ka = kija
+        # Chemist's notation for momentum conserving t2(ki,kj,ka,kb)
+        kb = kconserv[ki,ka,kj]
+
+        #:for kl in range(nkpts):
+        #:    kk = kconserv[kj,kl,ki]
+        #:    tau_term = t2[kk,kl,ka].copy()
+        #:    if kl == kb and kk == ka:
+        #:        tau_term += einsum('ic,jd->ijcd',t1[ka],t1[kb])
+        #:    t2new_tmp += 0.5 * einsum('klij,klab->ijab',Woooo[kk,kl,ki],tau_term)
+        kks = kconserv[kj,kranges,ki]
+        tau_term = t2[kks,kranges,ka]
+        # kl == kb  =>  kk == ka
+        tau_term[kb] += einsum('ic,jd->ijcd',t1[ka],t1[kb])
+        t2new_tmp = 0.5 * einsum('xklij,xklab->ijab',Woooo[kks,kranges,ki],tau_term)
+
+        #:for kc in range(nkpts):
+        #:    kd = kconserv[ka,kc,kb]
+        #:    tau_term = t2[ki,kj,kc].copy()
+        #:    if ki == kc and kj == kd:
+        #:        tau_term += einsum('ic,jd->ijcd',t1[ki],t1[kj])
+        #:    t2new_tmp += 0.5 * einsum('abcd,ijcd->ijab',Wvvvv[ka,kb,kc],tau_term)
+        tau_term = t2[ki,kj].copy()
+        # kc == ki  =>  kd == kj
+        tau_term[ki] += einsum('ic,jd->ijcd',t1[ki],t1[kj])
+        t2new_tmp += 0.5 * einsum('xabcd,xijcd->ijab',Wvvvv[ka,kb],tau_term)
+        tau_term = None
+
+        t2new_tmp += einsum('ac,ijcb->ijab',Lvv[ka],t2[ki,kj,ka])
+
+        t2new_tmp += einsum('ki,kjab->ijab',-Loo[ki],t2[ki,kj,ka])
+
+        kc = kconserv[ka,ki,kb]
+        tmp2 = np.asarray(eris.vovv[kc,ki,kb]).transpose(3,2,1,0).conj() \
+                - einsum('kbic,ka->abic',eris.ovov[ka,kb,ki],t1[ka])
+        t2new_tmp += einsum('abic,jc->ijab',tmp2,t1[kj])
+
+        kk = kconserv[ki,ka,kj]
+        tmp2 = np.asarray(eris.ooov[kj,ki,kk]).transpose(3,2,1,0).conj() \
+                + einsum('akic,jc->akij',eris.voov[ka,kk,ki],t1[kj])
+        t2new_tmp -= einsum('akij,kb->ijab',tmp2,t1[kb])
+
+        #:for kk in range(nkpts):
+        #:    kc = kconserv[ka,ki,kk]
+        #:    tmp_voov = 2.*Wvoov[ka,kk,ki] - Wvovo[ka,kk,kc].transpose(0,1,3,2)
+        #:    t2new_tmp += einsum('akic,kjcb->ijab',tmp_voov,t2[kk,kj,kc])
+        #:    kc = kconserv[ka,ki,kk]
+        #:    t2new_tmp -= einsum('akic,kjbc->ijab',Wvoov[ka,kk,ki],t2[kk,kj,kb])
+        #:    kc = kconserv[kk,ka,kj]
+        #:    t2new_tmp -= einsum('bkci,kjac->ijab',Wvovo[kb,kk,kc],t2[kk,kj,ka])
+        kcs = kconserv[ka,ki,kranges]
+        tmp_voov = 2.*Wvoov[ka,:,ki] - Wvovo[ka,kranges,kcs].transpose(0,1,2,4,3)
+        t2new_tmp += einsum('xakic,xkjcb->ijab',tmp_voov,t2[kranges,kj,kcs])
+        tmp_voov = None
+        t2new_tmp -= einsum('xakic,xkjbc->ijab',Wvoov[ka,:,ki],t2[:,kj,kb])
+        kcs = kconserv[kranges,ka,kj]
+        t2new_tmp -= einsum('xbkci,xkjac->ijab',Wvovo[kb,kranges,kcs],t2[:,kj,ka])
+        return t2new_tmp
+
+    # The (ki,kj,ka) blocks can be computed in a pool of threads
+    nthreads = cc.kblock_threads
+    if nthreads is None:
+        nthreads = lib.num_threads()
+    # The blocks are sorted by (ka,kb) so that the consecutive blocks use the
+    # same Wvvvv[ka,kb].  Wvvvv[ka,kb] for the next batch of blocks is loaded
+    # in background if Wvvvv is held on disk.
+    kijas = sorted(kpts_helper.loop_kkk(nkpts),
+                   key=lambda kija: (kija[2], kconserv[kija[0],kija[2],kija[1]],
+                                     kija[0]))
+    blksize = max(1, nthreads)
     t2new = np.array(eris.oovv).conj()
-    for ki in range(nkpts):
-      for kj in range(nkpts):
-        for ka in range(nkpts):
-            # Chemist's notation for momentum conserving t2(ki,kj,ka,kb)
+    for p0, p1 in lib.prange(0, len(kijas), blksize):
+        if p1 < len(kijas) and isinstance(Wvvvv, KptsBlockStore):
+            kas = [kija[2] for kija in kijas[p1:p1+blksize]]
+            kbs = [kconserv[ki,ka,kj] for ki, kj, ka in kijas[p1:p1+blksize]]
+            Wvvvv.prefetch(kas, kbs, slice(None))
+        t2new_tmps = lib.map_with_threads(update_t2_block, kijas[p0:p1],
+                                          nthreads)
+        for (ki, kj, ka), t2new_tmp in zip(kijas[p0:p1], t2new_tmps):
             kb = kconserv[ki,ka,kj]
-
-            t2new_tmp = np.zeros((nocc,nocc,nvir,nvir), dtype=t2.dtype)
-            for kl in range(nkpts):
-                kk = kconserv[kj,kl,ki]
-                tau_term = t2[kk,kl,ka].copy()
-                if kl == kb and kk == ka:
-                    tau_term += einsum('ic,jd->ijcd',t1[ka],t1[kb])
-                t2new_tmp += 0.5 * einsum('klij,klab->ijab',Woooo[kk,kl,ki],tau_term)
-
-            for kc in range(nkpts):
-                kd = kconserv[ka,kc,kb]
-                tau_term = t2[ki,kj,kc].copy()
-                if ki == kc and kj == kd:
-                    tau_term += einsum('ic,jd->ijcd',t1[ki],t1[kj])
-                t2new_tmp += 0.5 * einsum('abcd,ijcd->ijab',Wvvvv[ka,kb,kc],tau_term)
-
-            t2new_tmp += einsum('ac,ijcb->ijab',Lvv[ka],t2[ki,kj,ka])
-
-            t2new_tmp += einsum('ki,kjab->ijab',-Loo[ki],t2[ki,kj,ka])
-
-            kc = kconserv[ka,ki,kb]
-            tmp2 = np.asarray(eris.vovv[kc,ki,kb]).transpose(3,2,1,0).conj() \
-                    - einsum('kbic,ka->abic',eris.ovov[ka,kb,ki],t1[ka])
-            t2new_tmp += einsum('abic,jc->ijab',tmp2,t1[kj])
-
-            kk = kconserv[ki,ka,kj]
-            tmp2 = np.asarray(eris.ooov[kj,ki,kk]).transpose(3,2,1,0).conj() \
-                    + einsum('akic,jc->akij',eris.voov[ka,kk,ki],t1[kj])
-            t2new_tmp -= einsum('akij,kb->ijab',tmp2,t1[kb])
-
-            for kk in range(nkpts):
-                kc = kconserv[ka,ki,kk]
-                tmp_voov = 2.*Wvoov[ka,kk,ki] - Wvovo[ka,kk,kc].transpose(0,1,3,2)
-                t2new_tmp += einsum('akic,kjcb->ijab',tmp_voov,t2[kk,kj,kc])
-
-                kc = kconserv[ka,ki,kk]
-                t2new_tmp -= einsum('akic,kjbc->ijab',Wvoov[ka,kk,ki],t2[kk,kj,kb])
-
-                kc = kconserv[kk,ka,kj]
-                t2new_tmp -= einsum('bkci,kjac->ijab',Wvovo[kb,kk,kc],t2[kk,kj,ka])
-
             t2new[ki,kj,ka] += t2new_tmp
             t2new[kj,ki,kb] += t2new_tmp.transpose(1,0,3,2)
+        t2new_tmps = None
 
     for ki in range(nkpts):
         eia = foo[ki].diagonal()[:,None] - fvv[ki].diagonal()
@@ -273,7 +337,10 @@ class RCCSD(pyscf.cc.ccsd.CCSD):
         assert(isinstance(mf, scf.khf.KSCF))
         pyscf.cc.ccsd.CCSD.__init__(self, mf, frozen, mo_coeff, mo_occ)
         self.max_space = 20
-        self._keys = self._keys.union(['max_space'])
+# Number of threads to compute the k-point blocks of the T2 equation.  None
+# means lib.num_threads().  Note BLAS may be multi-threaded as well.
+        self.kblock_threads = 1
+        self._keys = self._keys.union(['max_space', 'kblock_threads'])
         self.kpts = mf.kpts
         self.mo_energy = mf.mo_energy
         self.nkpts = len(self.kpts)
@@ -950,16 +1017,18 @@ class _ERIS:#(pyscf.cc.ccsd._ChemistsERIs):
             self.dtype = dtype
         else:
             log.info('using HDF5 ERI storage')
+            # The datasets are chunked by (kp,kq,kr) blocks which are the
+            # units of the reads in update_amps.
             _tmpfile1 = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
             self.feri1 = h5py.File(_tmpfile1.name)
 
-            self.oooo = self.feri1.create_dataset('oooo', (nkpts,nkpts,nkpts,nocc,nocc,nocc,nocc), dtype.char)
-            self.ooov = self.feri1.create_dataset('ooov', (nkpts,nkpts,nkpts,nocc,nocc,nocc,nvir), dtype.char)
-            self.oovv = self.feri1.create_dataset('oovv', (nkpts,nkpts,nkpts,nocc,nocc,nvir,nvir), dtype.char)
-            self.ovov = self.feri1.create_dataset('ovov', (nkpts,nkpts,nkpts,nocc,nvir,nocc,nvir), dtype.char)
-            self.voov = self.feri1.create_dataset('voov', (nkpts,nkpts,nkpts,nvir,nocc,nocc,nvir), dtype.char)
-            self.vovv = self.feri1.create_dataset('vovv', (nkpts,nkpts,nkpts,nvir,nocc,nvir,nvir), dtype.char)
-            self.vvvv = self.feri1.create_dataset('vvvv', (nkpts,nkpts,nkpts,nvir,nvir,nvir,nvir), dtype.char)
+            self.oooo = create_kblock_dataset(self.feri1, 'oooo', (nkpts,nkpts,nkpts,nocc,nocc,nocc,nocc), dtype)
+            self.ooov = create_kblock_dataset(self.feri1, 'ooov', (nkpts,nkpts,nkpts,nocc,nocc,nocc,nvir), dtype)
+            self.oovv = create_kblock_dataset(self.feri1, 'oovv', (nkpts,nkpts,nkpts,nocc,nocc,nvir,nvir), dtype)
+            self.ovov = create_kblock_dataset(self.feri1, 'ovov', (nkpts,nkpts,nkpts,nocc,nvir,nocc,nvir), dtype)
+            self.voov = create_kblock_dataset(self.feri1, 'voov', (nkpts,nkpts,nkpts,nvir,nocc,nocc,nvir), dtype)
+            self.vovv = create_kblock_dataset(self.feri1, 'vovv', (nkpts,nkpts,nkpts,nvir,nocc,nvir,nvir), dtype)
+            self.vvvv = create_kblock_dataset(self.feri1, 'vvvv', (nkpts,nkpts,nkpts,nvir,nvir,nvir,nvir), dtype)
 
             # <ij|pq>  = (ip|jq)
             cput1 = time.clock(), time.time()
@@ -1047,6 +1116,17 @@ class _ERIS:#(pyscf.cc.ccsd._ChemistsERIs):
                         self.vvvv[iks,ikq,ikr,:,:,:,a] = buf_kpt.transpose(3,2,1,0).conj()[:,:,:,0] / nkpts
             cput1 = log.timer_debug1('transforming vvvv', *cput1)
 
+            # The blocks are read through LRU caches.  The memory budget is
+            # shared by the tensors in proportion to their sizes.
+            keys = ('oooo', 'ooov', 'oovv', 'ovov', 'voov', 'vovv', 'vvvv')
+            sizes = numpy.array([getattr(self, key).size for key in keys])
+            mem_now = lib.current_memory()[0]
+            max_memory = max(0, cc.max_memory-mem_now) * ERI_CACHE_FRACTION
+            for key, size in zip(keys, sizes):
+                setattr(self, key,
+                        KptsBlockStore(getattr(self, key),
+                                       max_memory*size/max(1,sizes.sum())))
+
         log.timer('CCSD integral transformation', *cput0)
 
 def verify_eri_symmetry(nmo, nkpts, kconserv, eri):
@@ -8,6 +8,8 @@ import tempfile
 import numpy as np
 import h5py
 from pyscf import lib
+from pyscf.pbc.lib.kpts_helper import gather_kblocks
+from pyscf.pbc.lib.kpts_helper import create_kblock_dataset, KptsBlockStore
 
 #einsum = np.einsum
 einsum = lib.einsum
@@ -17,17 +19,25 @@ einsum = lib.einsum
 
 ### Eqs. (37)-(39) "kappa"
 
+# The k-point blocks of the summed k-index are stacked (kx) and contracted in
+# one einsum call.
+
 def cc_Foo(t1,t2,eris,kconserv):
     nkpts, nocc, nvir = t1.shape
+    kranges = np.arange(nkpts)
     Fki = np.empty((nkpts,nocc,nocc),dtype=t2.dtype)
     for ki in range(nkpts):
         kk = ki
         Fki[ki] = eris.fock[ki,:nocc,:nocc].copy()
         for kl in range(nkpts):
-            for kc in range(nkpts):
-                kd = kconserv[kk,kc,kl]
-                Soovv = 2*eris.oovv[kk,kl,kc] - eris.oovv[kk,kl,kd].transpose(0,1,3,2)
-                Fki[ki] += einsum('klcd,ilcd->ki',Soovv,t2[ki,kl,kc])
+            #:for kc in range(nkpts):
+            #:    kd = kconserv[kk,kc,kl]
+            #:    Soovv = 2*eris.oovv[kk,kl,kc] - eris.oovv[kk,kl,kd].transpose(0,1,3,2)
+            #:    Fki[ki] += einsum('klcd,ilcd->ki',Soovv,t2[ki,kl,kc])
+            kds = kconserv[kk,kranges,kl]
+            Soovv = 2*np.asarray(eris.oovv[kk,kl]) \
+                    - gather_kblocks(eris.oovv, kk, kl, kds).transpose(0,1,2,4,3)
+            Fki[ki] += einsum('xklcd,xilcd->ki',Soovv,t2[ki,kl])
             #if ki == kc:
             kd = kconserv[kk,ki,kl]
             Soovv = 2*eris.oovv[kk,kl,ki] - eris.oovv[kk,kl,kd].transpose(0,1,3,2)
@@ -36,15 +46,20 @@ def cc_Foo(t1,t2,eris,kconserv):
 
 def cc_Fvv(t1,t2,eris,kconserv):
     nkpts, nocc, nvir = t1.shape
+    kranges = np.arange(nkpts)
     Fac = np.empty((nkpts,nvir,nvir),dtype=t2.dtype)
     for ka in range(nkpts):
         kc = ka
         Fac[ka] = eris.fock[ka,nocc:,nocc:].copy()
         for kl in range(nkpts):
-            for kk in range(nkpts):
-                kd = kconserv[kk,kc,kl]
-                Soovv = 2*eris.oovv[kk,kl,kc] - eris.oovv[kk,kl,kd].transpose(0,1,3,2)
-                Fac[ka] += -einsum('klcd,klad->ac',Soovv,t2[kk,kl,ka])
+            #:for kk in range(nkpts):
+            #:    kd = kconserv[kk,kc,kl]
+            #:    Soovv = 2*eris.oovv[kk,kl,kc] - eris.oovv[kk,kl,kd].transpose(0,1,3,2)
+            #:    Fac[ka] += -einsum('klcd,klad->ac',Soovv,t2[kk,kl,ka])
+            kds = kconserv[kranges,kc,kl]
+            Soovv = 2*np.asarray(eris.oovv[:,kl,kc]) \
+                    - gather_kblocks(eris.oovv, kranges, kl, kds).transpose(0,1,2,4,3)
+            Fac[ka] += -einsum('xklcd,xklad->ac',Soovv,t2[:,kl,ka])
             #if kk == ka
             kd = kconserv[ka,kc,kl]
             Soovv = 2*eris.oovv[ka,kl,kc] - eris.oovv[ka,kl,kd].transpose(0,1,3,2)
@@ -55,10 +70,14 @@ def cc_Fov(t1,t2,eris,kconserv):
     nkpts, nocc, nvir = t1.shape
     Fkc = np.empty((nkpts,nocc,nvir),dtype=t2.dtype)
     Fkc[:] = eris.fock[:,:nocc,nocc:].copy()
+    kranges = np.arange(nkpts)
     for kk in range(nkpts):
-        for kl in range(nkpts):
-            Soovv = 2.*eris.oovv[kk,kl,kk] - eris.oovv[kk,kl,kl].transpose(0,1,3,2)
-            Fkc[kk] += einsum('klcd,ld->kc',Soovv,t1[kl])
+        #:for kl in range(nkpts):
+        #:    Soovv = 2.*eris.oovv[kk,kl,kk] - eris.oovv[kk,kl,kl].transpose(0,1,3,2)
+        #:    Fkc[kk] += einsum('klcd,ld->kc',Soovv,t1[kl])
+        Soovv = 2.*np.asarray(eris.oovv[kk,:,kk]) \
+                - gather_kblocks(eris.oovv, kk, kranges, kranges).transpose(0,1,2,4,3)
+        Fkc[kk] += einsum('xklcd,xld->kc',Soovv,t1)
     return Fkc
 
 ### Eqs. (40)-(41) "lambda"
@@ -69,20 +88,26 @@ def Loo(t1,t2,eris,kconserv):
     Lki = cc_Foo(t1,t2,eris,kconserv)
     for ki in range(nkpts):
         Lki[ki] += einsum('kc,ic->ki',fov[ki],t1[ki])
-        for kl in range(nkpts):
-            Lki[ki] += 2*einsum('klic,lc->ki',eris.ooov[ki,kl,ki],t1[kl])
-            Lki[ki] +=  -einsum('lkic,lc->ki',eris.ooov[kl,ki,ki],t1[kl])
+        #:for kl in range(nkpts):
+        #:    Lki[ki] += 2*einsum('klic,lc->ki',eris.ooov[ki,kl,ki],t1[kl])
+        #:    Lki[ki] +=  -einsum('lkic,lc->ki',eris.ooov[kl,ki,ki],t1[kl])
+        Lki[ki] += 2*einsum('xklic,xlc->ki',eris.ooov[ki,:,ki],t1)
+        Lki[ki] +=  -einsum('xlkic,xlc->ki',eris.ooov[:,ki,ki],t1)
     return Lki
 
 def Lvv(t1,t2,eris,kconserv):
     nkpts, nocc, nvir = t1.shape
     fov = eris.fock[:,:nocc,nocc:]
     Lac = cc_Fvv(t1,t2,eris,kconserv)
+    kranges = np.arange(nkpts)
     for ka in range(nkpts):
         Lac[ka] += -einsum('kc,ka->ac',fov[ka],t1[ka])
-        for kk in range(nkpts):
-            Svovv = 2*eris.vovv[ka,kk,ka] - eris.vovv[ka,kk,kk].transpose(0,1,3,2)
-            Lac[ka] += einsum('akcd,kd->ac',Svovv,t1[kk])
+        #:for kk in range(nkpts):
+        #:    Svovv = 2*eris.vovv[ka,kk,ka] - eris.vovv[ka,kk,kk].transpose(0,1,3,2)
+        #:    Lac[ka] += einsum('akcd,kd->ac',Svovv,t1[kk])
+        Svovv = 2*np.asarray(eris.vovv[ka,:,ka]) \
+                - gather_kblocks(eris.vovv, ka, kranges, kranges).transpose(0,1,2,4,3)
+        Lac[ka] += einsum('xakcd,xkd->ac',Svovv,t1)
     return Lac
 
 ### Eqs. (42)-(45) "chi"
@@ -143,7 +168,9 @@ def cc_Wvvvv(t1,t2,eris,kconserv):
     _tmpfile1 = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
     fimd = h5py.File(_tmpfile1.name)
     nkpts, nocc, nvir = t1.shape
-    Wabcd = fimd.create_dataset('vvvv', (nkpts,nkpts,nkpts,nvir,nvir,nvir,nvir), ds_type) 
+    Wabcd = create_kblock_dataset(fimd, 'vvvv', (nkpts,nkpts,nkpts,nvir,nvir,nvir,nvir), ds_type)
+    # The blocks written in the first loop are read in the second loop
+    Wabcd = KptsBlockStore(Wabcd)
     for ka in range(nkpts):
         for kb in range(ka+1):
             for kc in range(nkpts):
@@ -16,7 +16,7 @@ import pyscf.pbc.cc.kccsd_rhf
 import pyscf.pbc.cc.ccsd
 import make_test_cell
 
-def run_kcell(cell, n, nk):
+def run_kcell(cell, n, nk, kblock_threads=1):
     #############################################
     # Do a k-point calculation                  #
     #############################################
@@ -34,6 +34,7 @@ def run_kcell(cell, n, nk):
     cc = pyscf.pbc.cc.kccsd_rhf.RCCSD(kmf)
     cc.conv_tol=1e-8
     cc.verbose = 7
+    cc.kblock_threads = kblock_threads
     ecc, t1, t2 = cc.kernel()
     return ekpt, ecc
 
@@ -49,6 +50,15 @@ class KnownValues(unittest.TestCase):
         self.assertAlmostEqual(escf,hf_311, 9)
         self.assertAlmostEqual(ecc, cc_311, 6)
 
+    def test_311_n1_threads(self):
+        L = 7.0
+        n = 9
+        cell = make_test_cell.test_cell_n1(L,[n]*3)
+        nk = (3, 1, 1)
+        cc_311 = -0.042702177586414237
+        escf, ecc = run_kcell(cell,n,nk,kblock_threads=3)
+        self.assertAlmostEqual(ecc, cc_311, 6)
+
     def test_single_kpt(self):
         cell = pbcgto.Cell()
         cell.atom = '''
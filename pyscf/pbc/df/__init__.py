@@ -4,10 +4,12 @@ from . import fft
 from . import aft
 from . import df
 from . import mdf
+from . import isdf
 from .df import DF, GDF
 from .mdf import MDF
 from .aft import AFTDF
 from .fft import FFTDF
+from .isdf import ISDF
 from pyscf.df.addons import aug_etb
 
 # For backward compatibility
@@ -17,7 +17,9 @@ Ref:
 
 import time
 import copy
+import hashlib
 import tempfile
+import threading
 import numpy
 import h5py
 import scipy.linalg
@@ -117,34 +119,127 @@ def make_modchg_basis(auxcell, smooth_eta):
     logger.debug1(auxcell, 'chgcell.rcut %s', chgcell.rcut)
     return chgcell
 
+# States of the k-point tasks in the manifest of _make_j3c
+J3C_PENDING = 0
+J3C_OUTPUT = 2
+J3C_DONE = 1
+
+def _j3c_key(mydf, cell, fused_cell, kptij_lst):
+    '''Fingerprint of the inputs of _make_j3c.  It is stored in the manifest
+    of cderi_file to decide whether an interrupted build can be resumed.'''
+    h = hashlib.sha1()
+    h.update(repr((cell.dimension, mydf.eta, mydf.linear_dep_threshold)).encode())
+    for x in (cell._atm, cell._bas, cell._env, cell.lattice_vectors(),
+              fused_cell._atm, fused_cell._bas, fused_cell._env,
+              mydf.mesh, kptij_lst):
+        x = numpy.asarray(x)
+        h.update(repr(x.shape).encode())
+        h.update(numpy.ascontiguousarray(x).tobytes())
+    return h.hexdigest()
+
 # kpti == kptj: s2 symmetry
 # kpti == kptj == 0 (gamma point): real
 def _make_j3c(mydf, cell, auxcell, kptij_lst, cderi_file):
+    '''Build the 3-center integrals in cderi_file.
+
+    The build is split into independent tasks, one for each unique k-point
+    difference kptj-kpti.  Every task writes its own datasets and its state
+    is recorded in the manifest "j3c-manifest" of cderi_file:
+    J3C_PENDING, J3C_OUTPUT (all outputs are written, moving them over the
+    raw 3c2e integrals may be incomplete) and J3C_DONE.  If cderi_file holds
+    the manifest of an interrupted build with the same cell, auxiliary
+    basis, mesh and k-points, the pending moves of J3C_OUTPUT tasks are
+    finished and only the J3C_PENDING tasks are computed.  Tasks are
+    executed in mydf.j3c_nthreads threads.
+    '''
     t1 = (time.clock(), time.time())
     log = logger.Logger(mydf.stdout, mydf.verbose)
-    max_memory = max(2000, mydf.max_memory-lib.current_memory()[0])
     fused_cell, fuse = fuse_auxcell(mydf, auxcell)
-    outcore.aux_e2(cell, fused_cell, cderi_file, 'int3c2e_sph', aosym='s2',
-                   kptij_lst=kptij_lst, dataname='j3c', max_memory=max_memory)
-    t1 = log.timer_debug1('3c2e', *t1)
+
+    kptis = kptij_lst[:,0]
+    kptjs = kptij_lst[:,1]
+    kpt_ji = kptjs - kptis
+    uniq_kpts, uniq_index, uniq_inverse = unique(kpt_ji)
+    nuniq = len(uniq_kpts)
+    log.debug('Num uniq kpts %d', nuniq)
+    log.debug2('uniq_kpts %s', uniq_kpts)
+
+    key = _j3c_key(mydf, cell, fused_cell, kptij_lst)
+    state = None
+    if h5py.is_hdf5(cderi_file):
+        with h5py.File(cderi_file) as feri:
+            if ('j3c-manifest' in feri and
+                feri['j3c-manifest'].attrs['key'] == key):
+                state = numpy.asarray(feri['j3c-manifest'])
+    if state is None:
+        max_memory = max(2000, mydf.max_memory-lib.current_memory()[0])
+        outcore.aux_e2(cell, fused_cell, cderi_file, 'int3c2e_sph', aosym='s2',
+                       kptij_lst=kptij_lst, dataname='j3c', max_memory=max_memory)
+        t1 = log.timer_debug1('3c2e', *t1)
+        feri = h5py.File(cderi_file)
+        for label in ('j2c', 'j3c-out', 'j3c-manifest'):
+            if label in feri:
+                del(feri[label])
+        manifest = feri.create_dataset('j3c-manifest', (nuniq,), 'i1')
+        manifest[:] = J3C_PENDING
+        manifest.attrs['key'] = key
+        manifest.attrs['j2c'] = 0
+        state = numpy.asarray(manifest)
+    else:
+        log.info('Resume j3c build in %s. %d of %d k-point tasks are done.',
+                 cderi_file, numpy.count_nonzero(state == J3C_DONE), nuniq)
+        feri = h5py.File(cderi_file)
+        manifest = feri['j3c-manifest']
+
+    def adapted_ji_idx_of(uniq_kptji_id):
+        return numpy.where(uniq_inverse == uniq_kptji_id)[0]
+
+    def commit(uniq_kptji_id):
+        # Replace the raw 3c2e integrals with the task output.  The state
+        # J3C_OUTPUT is recorded before anything is moved, so that a build
+        # interrupted in this step finishes the moves on resume instead of
+        # recomputing the task from partially replaced j3c data.
+        manifest[uniq_kptji_id] = J3C_OUTPUT
+        feri.flush()
+        for ji in adapted_ji_idx_of(uniq_kptji_id):
+            if 'j3c-out/%d'%ji in feri:
+                if 'j3c/%d'%ji in feri:
+                    del(feri['j3c/%d'%ji])
+                feri.move('j3c-out/%d'%ji, 'j3c/%d'%ji)
+        manifest[uniq_kptji_id] = J3C_DONE
+        feri.flush()
+
+    for k in numpy.where(state == J3C_OUTPUT)[0]:
+        commit(k)
+    todo = numpy.where(state == J3C_PENDING)[0]
 
     nao = cell.nao_nr()
     naux = auxcell.nao_nr()
-    mesh = mydf.mesh
+    mesh = numpy.asarray(mydf.mesh)
     Gv, Gvbase, kws = cell.get_Gv_weights(mesh)
     b = cell.reciprocal_vectors()
     gxyz = lib.cartesian_prod([numpy.arange(len(x)) for x in Gvbase])
     ngrids = gxyz.shape[0]
 
-    kptis = kptij_lst[:,0]
-    kptjs = kptij_lst[:,1]
-    kpt_ji = kptjs - kptis
-    uniq_kpts, uniq_index, uniq_inverse = unique(kpt_ji)
-    log.debug('Num uniq kpts %d', len(uniq_kpts))
-    log.debug2('uniq_kpts %s', uniq_kpts)
-    # j2c ~ (-kpt_ji | kpt_ji)
-    j2c = fused_cell.pbc_intor('int2c2e_sph', hermi=1, kpts=uniq_kpts)
-    feri = h5py.File(cderi_file)
+    if len(todo) > 0 and not (manifest.attrs['j2c'] and 'j2c' in feri):
+        if 'j2c' in feri:
+            del(feri['j2c'])
+# For an odd mesh the G-vectors are symmetric about 0, and the metric
+# j2c(-kpt) is the complex conjugate of j2c(kpt).  The factor of j2c(kpt)
+# is shared by the tasks of kpt and -kpt.
+        j2c_src = numpy.arange(nuniq)
+        if numpy.all(mesh % 2 == 1):
+            for k in todo:
+                if j2c_src[k] == k:
+                    kp = member(-uniq_kpts[k], uniq_kpts)
+                    if len(kp) > 0 and kp[0] > k and state[kp[0]] == J3C_PENDING:
+                        j2c_src[kp[0]] = k
+        j2c_ids = [k for k in todo if j2c_src[k] == k]
+        log.debug1('j2c factors of %d kpts are shared with -kpt',
+                   len(todo) - len(j2c_ids))
+
+        # j2c ~ (-kpt_ji | kpt_ji)
+        j2c = fused_cell.pbc_intor('int2c2e_sph', hermi=1, kpts=uniq_kpts[j2c_ids])
 
 # An alternative method to evalute j2c. This method might have larger numerical error?
 #    chgcell = make_modchg_basis(auxcell, mydf.eta)
@@ -170,33 +265,62 @@ def _make_j3c(mydf, cell, auxcell, kptij_lst, cderi_file):
 #        feri['j2c/%d'%k] = fuse(fuse(j2c[k]).T).T
 #        aoaux = LkR = LkI = coulG = None
 
-    max_memory = max(2000, mydf.max_memory - lib.current_memory()[0])
-    blksize = max(2048, int(max_memory*.5e6/16/fused_cell.nao_nr()))
-    log.debug2('max_memory %s (MB)  blocksize %s', max_memory, blksize)
-    for k, kpt in enumerate(uniq_kpts):
-        coulG = numpy.sqrt(mydf.weighted_coulG(kpt, False, mesh))
-        for p0, p1 in lib.prange(0, ngrids, blksize):
-            aoaux = ft_ao.ft_ao(fused_cell, Gv[p0:p1], None, b, gxyz[p0:p1], Gvbase, kpt).T
-            LkR = aoaux.real * coulG[p0:p1]
-            LkI = aoaux.imag * coulG[p0:p1]
-            aoaux = None
-
-            if is_zero(kpt):  # kpti == kptj
-                j2c[k][naux:] -= lib.ddot(LkR[naux:], LkR.T)
-                j2c[k][naux:] -= lib.ddot(LkI[naux:], LkI.T)
-                j2c[k][:naux,naux:] = j2c[k][naux:,:naux].T
-            else:
-                j2cR, j2cI = zdotCN(LkR[naux:], LkI[naux:], LkR.T, LkI.T)
-                j2c[k][naux:] -= j2cR + j2cI * 1j
-                j2c[k][:naux,naux:] = j2c[k][naux:,:naux].T.conj()
-            LkR = LkI = None
-        feri['j2c/%d'%k] = fuse(fuse(j2c[k]).T).T
-    j2c = coulG = None
+        max_memory = max(2000, mydf.max_memory - lib.current_memory()[0])
+        blksize = max(2048, int(max_memory*.5e6/16/fused_cell.nao_nr()))
+        log.debug2('max_memory %s (MB)  blocksize %s', max_memory, blksize)
+        for i, k in enumerate(j2c_ids):
+            kpt = uniq_kpts[k]
+            coulG = numpy.sqrt(mydf.weighted_coulG(kpt, False, mesh))
+            for p0, p1 in lib.prange(0, ngrids, blksize):
+                aoaux = ft_ao.ft_ao(fused_cell, Gv[p0:p1], None, b, gxyz[p0:p1], Gvbase, kpt).T
+                LkR = aoaux.real * coulG[p0:p1]
+                LkI = aoaux.imag * coulG[p0:p1]
+                aoaux = None
+
+                if is_zero(kpt):  # kpti == kptj
+                    j2c[i][naux:] -= lib.ddot(LkR[naux:], LkR.T)
+                    j2c[i][naux:] -= lib.ddot(LkI[naux:], LkI.T)
+                    j2c[i][:naux,naux:] = j2c[i][naux:,:naux].T
+                else:
+                    j2cR, j2cI = zdotCN(LkR[naux:], LkI[naux:], LkR.T, LkI.T)
+                    j2c[i][naux:] -= j2cR + j2cI * 1j
+                    j2c[i][:naux,naux:] = j2c[i][naux:,:naux].T.conj()
+                LkR = LkI = None
+            j2c_k = fuse(fuse(j2c[i]).T).T
+            j2c[i] = None
+            try:
+                j2c_k = scipy.linalg.cholesky(j2c_k, lower=True)
+                j2ctag = 'CD'
+            except scipy.linalg.LinAlgError as e:
+                #msg =('===================================\n'
+                #      'J-metric not positive definite.\n'
+                #      'It is likely that mesh is not enough.\n'
+                #      '===================================')
+                #log.error(msg)
+                #raise scipy.linalg.LinAlgError('\n'.join([e.message, msg]))
+                w, v = scipy.linalg.eigh(j2c_k)
+                log.debug('DF metric linear dependency for kpt %s', k)
+                log.debug('cond = %.4g, drop %d bfns',
+                          w[-1]/w[0], numpy.count_nonzero(w<mydf.linear_dep_threshold))
+                v = v[:,w>mydf.linear_dep_threshold].T.conj()
+                v /= numpy.sqrt(w[w>mydf.linear_dep_threshold]).reshape(-1,1)
+                j2c_k = v
+                j2ctag = 'eig'
+            feri['j2c/%d'%k] = j2c_k
+            feri['j2c/%d'%k].attrs['tag'] = j2ctag
+        j2c = j2c_k = coulG = None
+        manifest.attrs['j2c_src'] = j2c_src
+        manifest.attrs['j2c'] = 1
+        feri.flush()
+        t1 = log.timer_debug1('j2c', *t1)
+
+    nthreads = max(1, min(mydf.j3c_nthreads, len(todo)))
+    lock = threading.Lock()
 
     def make_kpt(uniq_kptji_id):  # kpt = kptj - kpti
         kpt = uniq_kpts[uniq_kptji_id]
         log.debug1('kpt = %s', kpt)
-        adapted_ji_idx = numpy.where(uniq_inverse == uniq_kptji_id)[0]
+        adapted_ji_idx = adapted_ji_idx_of(uniq_kptji_id)
         adapted_kptjs = kptjs[adapted_ji_idx]
         nkptj = len(adapted_kptjs)
         log.debug1('adapted_ji_idx = %s', adapted_ji_idx)
@@ -206,25 +330,13 @@ def _make_j3c(mydf, cell, auxcell, kptij_lst, cderi_file):
         Gaux *= mydf.weighted_coulG(kpt, False, mesh).reshape(-1,1)
         kLR = Gaux.real.copy('C')
         kLI = Gaux.imag.copy('C')
-        j2c = numpy.asarray(feri['j2c/%d'%uniq_kptji_id])
-        try:
-            j2c = scipy.linalg.cholesky(j2c, lower=True)
-            j2ctag = 'CD'
-        except scipy.linalg.LinAlgError as e:
-            #msg =('===================================\n'
-            #      'J-metric not positive definite.\n'
-            #      'It is likely that mesh is not enough.\n'
-            #      '===================================')
-            #log.error(msg)
-            #raise scipy.linalg.LinAlgError('\n'.join([e.message, msg]))
-            w, v = scipy.linalg.eigh(j2c)
-            log.debug('DF metric linear dependency for kpt %s', uniq_kptji_id)
-            log.debug('cond = %.4g, drop %d bfns',
-                      w[-1]/w[0], numpy.count_nonzero(w<mydf.linear_dep_threshold))
-            v = v[:,w>mydf.linear_dep_threshold].T.conj()
-            v /= numpy.sqrt(w[w>mydf.linear_dep_threshold]).reshape(-1,1)
-            j2c = v
-            j2ctag = 'eig'
+        Gaux = None
+        with lock:
+            j2c_id = manifest.attrs['j2c_src'][uniq_kptji_id]
+            j2c = numpy.asarray(feri['j2c/%d'%j2c_id])
+            j2ctag = feri['j2c/%d'%j2c_id].attrs['tag']
+        if j2c_id != uniq_kptji_id:
+            j2c = j2c.conj()
         naux0 = j2c.shape[0]
 
         if is_zero(kpt):  # kpti == kptj
@@ -239,9 +351,17 @@ def _make_j3c(mydf, cell, auxcell, kptij_lst, cderi_file):
             aosym = 's1'
             nao_pair = nao**2
 
+        with lock:
+            for ji in adapted_ji_idx:
+                if 'j3c-out/%d'%ji in feri:
+                    del(feri['j3c-out/%d'%ji])
+                feri.create_dataset('j3c-out/%d'%ji, (naux0,nao_pair),
+                                    feri['j3c/%d'%ji].dtype,
+                                    chunks=(min(256,naux0), min(256,nao_pair)))
+
         mem_now = lib.current_memory()[0]
         log.debug2('memory = %s', mem_now)
-        max_memory = max(2000, mydf.max_memory-mem_now)
+        max_memory = max(2000, mydf.max_memory-mem_now) / nthreads
         # nkptj for 3c-coulomb arrays plus 1 Lpq array
         buflen = min(max(int(max_memory*.6*1e6/16/naux/(nkptj+1)), 1), nao_pair)
         shranges = _guess_shell_ranges(cell, buflen, aosym)
@@ -266,7 +386,8 @@ def _make_j3c(mydf, cell, auxcell, kptij_lst, cderi_file):
             j3cR = []
             j3cI = []
             for k, idx in enumerate(adapted_ji_idx):
-                v = numpy.asarray(feri['j3c/%d'%idx][:,col0:col1])
+                with lock:
+                    v = numpy.asarray(feri['j3c/%d'%idx][:,col0:col1])
                 if is_zero(kpt):
                     for i, c in enumerate(vbar):
                         if c != 0:
@@ -306,17 +427,24 @@ def _make_j3c(mydf, cell, auxcell, kptij_lst, cderi_file):
                     v = scipy.linalg.solve_triangular(j2c, v, lower=True, overwrite_b=True)
                 else:
                     v = lib.dot(j2c, v)
-                feri['j3c/%d'%ji][:naux0,col0:col1] = v
-
-        del(feri['j2c/%d'%uniq_kptji_id])
-        for k, ji in enumerate(adapted_ji_idx):
-            v = feri['j3c/%d'%ji][:naux0]
-            del(feri['j3c/%d'%ji])
-            feri['j3c/%d'%ji] = v
-
-    for k, kpt in enumerate(uniq_kpts):
-        make_kpt(k)
-
+                with lock:
+                    feri['j3c-out/%d'%ji][:,col0:col1] = v
+
+        with lock:
+            commit(uniq_kptji_id)
+
+    try:
+        lib.map_with_threads(make_kpt, todo, nthreads)
+    except:
+        # Keep the file consistent for the resumed build
+        feri.close()
+        raise
+
+    manifest.attrs['j2c'] = 0
+    if 'j2c' in feri:
+        del(feri['j2c'])
+    if 'j3c-out' in feri:
+        del(feri['j3c-out'])
     feri.close()
 
 
@@ -349,6 +477,9 @@ class GDF(aft.AFTDF):
         self.auxcell = None
         self.blockdim = 240
         self.linear_dep_threshold = LINEAR_DEP_THR
+# Number of unique k-point tasks of _make_j3c running concurrently.  Each
+# task works with max_memory/j3c_nthreads.
+        self.j3c_nthreads = 1
         self._j_only = False
 # If _cderi_to_save is specified, the 3C-integral tensor will be saved in this file.
         self._cderi_to_save = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
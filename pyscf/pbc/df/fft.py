@@ -157,9 +157,20 @@ class FFTDF(lib.StreamObject):
         self.blockdim = 240 # to mimic molecular DF object
         self.non0tab = None
 
+# Cache the AO values on the uniform mesh so that they are evaluated only once
+# in the SCF iterations.  The cache is dropped when the mesh or the cell changes.
+        self.cache_ao = False
+# Memory budget (in MB) of the cached AO values.  AO values beyond the budget
+# are held in memmap files.  Default is half of max_memory
+        self.ao_cache_memory = None
+# Cache the AO values in single precision
+        self.ao_cache_single_precision = False
+
 # Not input options
         self.exxdiv = None  # to mimic KRHF/KUHF object in function get_coulG
         self._numint = numint._KNumInt()
+        self._ao_cache = None
+        self._ao_cache_key = None
         self._keys = set(self.__dict__.keys())
 
     def dump_flags(self):
@@ -168,6 +179,10 @@ class FFTDF(lib.StreamObject):
         logger.info(self, 'mesh = %s', self.mesh)
         logger.info(self, 'len(kpts) = %d', len(self.kpts))
         logger.debug1(self, '    kpts = %s', self.kpts)
+        if self.cache_ao:
+            logger.info(self, 'cache_ao = %s  ao_cache_memory = %s  '
+                        'ao_cache_single_precision = %s', self.cache_ao,
+                        self.ao_cache_memory, self.ao_cache_single_precision)
         return self
 
     def check_sanity(self):
@@ -226,22 +241,97 @@ class FFTDF(lib.StreamObject):
                 self.non0tab = None
             self.mesh = mesh
 
-        ni = self._numint
-        coords = cell.gen_uniform_grids(mesh)
-        if self.non0tab is None:
-            self.non0tab = ni.make_mask(cell, coords)
         if kpts_band is None:
-            aoR = ni.eval_ao(cell, coords, kpts, non0tab=self.non0tab)
+            aoR = self.eval_ao_kpts(mesh, kpts)
             for k in range(len(kpts)):
                 yield k, aoR[k]
         else:
-            aoR = ni.eval_ao(cell, coords, kpts_band, non0tab=self.non0tab)
+            aoR = self.eval_ao_kpts(mesh, kpts_band)
             if kpts_band.ndim == 1:
                 yield 0, aoR
             else:
                 for k in range(len(kpts_band)):
                     yield k, aoR[k]
 
+    def eval_ao_kpts(self, mesh=None, kpts=None):
+        '''AO values on the uniform mesh for each k-point in kpts.  If cache_ao
+        is set, the AO values are taken from the cache (or saved in the cache
+        for the next call).  The returned AO values of the cache should not
+        be modified.
+
+        Returns:
+            A list of (ngrids,nao) ndarrays
+        '''
+        cell = self.cell
+        if kpts is None:
+            kpts = self.kpts
+        kpts = numpy.reshape(kpts, (-1,3))
+        if mesh is None:
+            mesh = self.mesh
+        mesh = numpy.asarray(mesh)
+
+        ni = self._numint
+        coords = cell.gen_uniform_grids(mesh)
+        if numpy.array_equal(mesh, self.mesh):
+            if self.non0tab is None:
+                self.non0tab = ni.make_mask(cell, coords)
+            non0tab = self.non0tab
+        else:
+            non0tab = None
+
+        if not self.cache_ao:
+            return ni.eval_ao(cell, coords, kpts, non0tab=non0tab)
+
+        store = self._get_ao_cache(mesh)
+        ngrids = len(coords)
+        keys = ['%.9f,%.9f,%.9f' % tuple(k) for k in kpts.round(9)+0.]
+        missing = []
+        for k, key in enumerate(keys):
+            if key not in store and key not in keys[:k]:
+                missing.append(k)
+        if missing:
+            aoR = ni.eval_ao(cell, coords, kpts[missing], non0tab=non0tab)
+            for k, ao in zip(missing, aoR):
+                if self.ao_cache_single_precision:
+                    if ao.dtype == numpy.double:
+                        ao = ao.astype(numpy.float32)
+                    else:
+                        ao = ao.astype(numpy.complex64)
+                store[keys[k]] = ao
+            aoR = None
+            logger.debug1(self, 'Cache AO values of %d k-points', len(missing))
+
+        aoR = []
+        for key in keys:
+            ao = store[key].reshape(ngrids,-1)
+            if ao.dtype == numpy.float32:
+                ao = ao.astype(numpy.double)
+            elif ao.dtype == numpy.complex64:
+                ao = ao.astype(numpy.complex128)
+            aoR.append(ao)
+        return aoR
+
+    def _get_ao_cache(self, mesh):
+        cell = self.cell
+        key = (tuple(mesh), cell._atm.tostring(), cell._bas.tostring(),
+               cell._env.tostring(), cell.lattice_vectors().tostring())
+        if self._ao_cache is None or self._ao_cache_key != key:
+            self.reset_ao_cache()
+            max_memory = self.ao_cache_memory
+            if max_memory is None:
+                max_memory = self.max_memory * .5
+            self._ao_cache = lib.vecstore.new_store('memmap', max_memory)
+            self._ao_cache_key = key
+        return self._ao_cache
+
+    def reset_ao_cache(self):
+        '''Release the cached AO values'''
+        if self._ao_cache is not None:
+            self._ao_cache.close()
+        self._ao_cache = None
+        self._ao_cache_key = None
+        return self
+
     get_pp = get_pp
     get_nuc = get_nuc
 
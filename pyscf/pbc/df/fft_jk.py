@@ -44,15 +44,16 @@ def get_j_kpts(mydf, dm_kpts, hermi=1, kpts=np.zeros((1,3)), kpts_band=None):
     coulG = tools.get_coulG(cell, mesh=mesh, low_dim_ft_type=low_dim_ft_type)
     ngrids = len(coulG)
 
-    vR = rhoR = np.zeros((nset,ngrids))
+    rhoR = np.zeros((nset,ngrids))
     for k, aoR in mydf.aoR_loop(mesh, kpts):
         for i in range(nset):
             rhoR[i] += numint.eval_rho(cell, aoR, dms[i,k])
-    for i in range(nset):
-        rhoR[i] *= 1./nkpts
-        rhoG = tools.fft(rhoR[i], mesh)
-        vG = coulG * rhoG
-        vR[i] = tools.ifft(vG, mesh).real
+    rhoR *= 1./nkpts
+    # All density sets are transformed together
+    vR = tools.FFTEngine(mesh).convolve(rhoR, coulG, out=rhoR)
+    if vR.dtype == np.complex128:
+        # coulG is not symmetric, e.g. on even meshes
+        vR = vR.real
 
     kpts_band, input_band = _format_kpts_band(kpts_band, kpts), kpts_band
     nband = len(kpts_band)
@@ -112,12 +113,12 @@ def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=np.zeros((1,3)), kpts_band=None,
     else:
         vk_kpts = np.zeros((nset,nband,nao,nao), dtype=np.complex128)
 
-    ao2_kpts = mydf._numint.eval_ao(cell, coords, kpts, non0tab=mydf.non0tab)
+    ao2_kpts = mydf.eval_ao_kpts(mesh, kpts)
     ao2_kpts = [np.asarray(ao.T, order='C') for ao in ao2_kpts]
     if input_band is None:
         ao1_kpts = ao2_kpts
     else:
-        ao1_kpts = mydf._numint.eval_ao(cell, coords, kpts_band, non0tab=mydf.non0tab)
+        ao1_kpts = mydf.eval_ao_kpts(mesh, kpts_band)
         ao1_kpts = [np.asarray(ao.T, order='C') for ao in ao1_kpts]
     if mo_coeff is not None and nset == 1:
         mo_coeff = [mo_coeff[k][:,occ>0] * np.sqrt(occ[occ>0])
@@ -131,6 +132,7 @@ def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=np.zeros((1,3)), kpts_band=None,
     ao1_dtype = np.result_type(*ao1_kpts)
     ao2_dtype = np.result_type(*ao2_kpts)
     vR_dm = np.empty((nset,nao,ngrids), dtype=vk_kpts.dtype)
+    fft_engine = tools.FFTEngine(mesh)
 
     for k2, ao2T in enumerate(ao2_kpts):
         if ao2T.size == 0:
@@ -155,11 +157,9 @@ def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=np.zeros((1,3)), kpts_band=None,
 
             for p0, p1 in lib.prange(0, nao, blksize):
                 rho1 = np.einsum('ig,jg->ijg', ao1T[p0:p1].conj()*expmikr, ao2T)
-                vG = tools.fft(rho1.reshape(-1,ngrids), mesh)
+                vR = fft_engine.convolve(rho1.reshape(-1,ngrids), coulG)
+                vR = vR.reshape(p1-p0,naoj,ngrids)
                 rho1 = None
-                vG *= coulG
-                vR = tools.ifft(vG, mesh).reshape(p1-p0,naoj,ngrids)
-                vG = None
                 if vR_dm.dtype == np.double:
                     vR = vR.real
                 for i in range(nset):
@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Interpolative separable density fitting (ISDF) for the exchange matrix
+
+The periodic parts u_i^k(r) = e^{-ikr} phi_i^k(r) of the AO pair products of
+all k-point pairs are expanded on one set of real interpolation vectors
+
+    u_i^{k1*}(r) u_j^{k2}(r) ~ \sum_mu u_i^{k1*}(r_mu) u_j^{k2}(r_mu) zeta_mu(r)
+
+The interpolation points r_mu are selected on the uniform FFT mesh by the
+pivoted Cholesky decomposition of the metric of the pair products
+
+    K(r,r') = |\sum_{k,i} u_i^{k*}(r) u_i^k(r')|^2
+
+The Coulomb matrices of the interpolation vectors
+
+    M^q_{mu,nu} = \int zeta_mu(r) v^q(r-r') zeta_nu(r')
+
+are computed once for every momentum transfer q = k2 - k1.  The exchange
+matrix is then evaluated on the interpolation points without FFTs.
+
+Ref:
+    Lu, Ying, J. Comput. Phys. 302, 329 (2015)
+    Hu, Lin, Yang, J. Chem. Theory Comput. 13, 1188 (2017)
+'''
+
+import time
+import numpy
+import scipy.linalg
+from pyscf import lib
+from pyscf.lib import logger
+from pyscf.pbc import tools
+from pyscf.pbc.df import fft
+from pyscf.pbc.df.df_jk import _format_dms, _format_jks
+from pyscf.pbc.lib.kpts_helper import gamma_point
+
+# Max number of interpolation points per AO function per k-point
+MAX_POINTS_PER_AO = 10
+# Stop selecting interpolation points when the residual of the pair-product
+# metric is smaller than THRESHOLD * max(diagonal)
+THRESHOLD = 1e-8
+
+
+def get_periodic_ao(mydf, kpts, coords=None):
+    '''The periodic part e^{-ikr} phi^k(r) of the Bloch AOs on the uniform mesh'''
+    cell = mydf.cell
+    if coords is None:
+        coords = cell.gen_uniform_grids(mydf.mesh)
+    ao_kpts = mydf.eval_ao_kpts(mydf.mesh, kpts)
+    u_kpts = []
+    for k, ao in enumerate(ao_kpts):
+        if gamma_point(kpts[k]):
+            u_kpts.append(numpy.asarray(ao, order='C'))
+        else:
+            expmikr = numpy.exp(-1j * numpy.dot(coords, kpts[k]))
+            u_kpts.append(numpy.asarray(ao * expmikr[:,None], order='C'))
+    return u_kpts
+
+def select_points(u_kpts, max_points, threshold=THRESHOLD):
+    '''Select the interpolation points by the pivoted Cholesky decomposition
+    of the pair-product metric K(r,r').
+
+    Returns:
+        idx : list of the selected grid indices
+        chol : (len(idx),ngrids) ndarray, K ~ chol.T.dot(chol)
+    '''
+    ngrids = u_kpts[0].shape[0]
+    max_points = min(max_points, ngrids)
+
+    diag = 0
+    for u in u_kpts:
+        diag += numpy.einsum('gi,gi->g', u.conj(), u).real
+    diag = diag ** 2
+    tol = diag.max() * threshold
+
+    # chol grows with the number of selected points.  It is not allocated
+    # for max_points at once.
+    chol = numpy.zeros((min(max_points, 128),ngrids))
+    idx = []
+    for n in range(max_points):
+        p = numpy.argmax(diag)
+        if diag[p] <= tol:
+            break
+        if n == chol.shape[0]:
+            chol = numpy.vstack((chol, numpy.zeros((min(n, max_points-n),ngrids))))
+        a = 0
+        for u in u_kpts:
+            a = a + numpy.dot(u.conj(), u[p])
+        col = a.real**2 + a.imag**2
+        col -= numpy.dot(chol[:n,p], chol[:n])
+        chol[n] = col * (1./numpy.sqrt(col[p]))
+        diag -= chol[n]**2
+        diag[p] = 0
+        idx.append(p)
+    chol = chol[:len(idx)]
+    return idx, chol
+
+def get_coulM(mydf, q, exxdiv=None):
+    '''Coulomb matrix M^q_{mu,nu} of the interpolation vectors for the
+    momentum transfer q'''
+    cell = mydf.cell
+    mesh = mydf.mesh
+    zeta = mydf._zeta
+    npts = zeta.shape[0]
+    mydf.exxdiv = exxdiv
+    coulG = tools.get_coulG(cell, q, True, mydf, mesh,
+                            low_dim_ft_type=mydf.low_dim_ft_type)
+    if gamma_point(q):
+        coulM = numpy.empty((npts,npts))
+    else:
+        coulM = numpy.empty((npts,npts), dtype=numpy.complex128)
+
+    ngrids = zeta.shape[1]
+    mem_now = lib.current_memory()[0]
+    max_memory = mydf.max_memory - mem_now
+    blksize = int(min(npts, max(1, max_memory*1e6/16/3/ngrids)))
+    fft_engine = tools.FFTEngine(mesh)
+    for p0, p1 in lib.prange(0, npts, blksize):
+        vR = fft_engine.convolve(zeta[p0:p1], coulG)
+        if coulM.dtype == numpy.double:
+            vR = vR.real
+        coulM[p0:p1] = lib.dot(vR, zeta.T)
+        vR = None
+    return coulM
+
+
+def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpts_band=None,
+               exxdiv=None):
+    '''Get the exchange (K) AO matrices at sampled k-points with ISDF.
+
+    Args:
+        dm_kpts : (nkpts, nao, nao) ndarray
+            Density matrix at each k-point
+        kpts : (nkpts, 3) ndarray
+
+    Kwargs:
+        kpts_band : (3,) ndarray or (*,3) ndarray
+            A list of arbitrary "band" k-points at which to evalute the matrix.
+            The interpolation vectors are fitted for the products of the
+            orbitals of kpts only.  K matrix of kpts_band is computed by
+            :func:`fft_jk.get_k_kpts`.
+
+    Returns:
+        vk : (nkpts, nao, nao) ndarray
+        or list of vk if the input dm_kpts is a list of DMs
+    '''
+    if kpts_band is not None:
+        from pyscf.pbc.df import fft_jk
+        return fft_jk.get_k_kpts(mydf, dm_kpts, hermi, kpts, kpts_band, exxdiv)
+
+    cell = mydf.cell
+    kpts = numpy.asarray(kpts)
+    mydf.build(kpts)
+    ngrids = numpy.prod(mydf.mesh)
+
+    if hasattr(dm_kpts, 'mo_coeff'):
+        mo_coeff = dm_kpts.mo_coeff
+        mo_occ   = dm_kpts.mo_occ
+    else:
+        mo_coeff = None
+
+    dm_kpts = lib.asarray(dm_kpts, order='C')
+    dms = _format_dms(dm_kpts, kpts)
+    nset, nkpts, nao = dms.shape[:3]
+
+    weight = 1./nkpts * (cell.vol/ngrids)
+
+    if gamma_point(kpts):
+        vk_kpts = numpy.zeros((nset,nkpts,nao,nao), dtype=dms.dtype)
+    else:
+        vk_kpts = numpy.zeros((nset,nkpts,nao,nao), dtype=numpy.complex128)
+
+    # The density matrices on the interpolation points
+    #   G^{k2}_{mu,nu} = \sum_{jl} u_j^{k2}(r_mu) D^{k2}_{jl} u_l^{k2*}(r_nu)
+    x_kpts = mydf._u_points
+    dm_points = []
+    for k2, x2 in enumerate(x_kpts):
+        if mo_coeff is not None and nset == 1:
+            occ = mo_occ[k2]
+            c = mo_coeff[k2][:,occ>0] * numpy.sqrt(occ[occ>0])
+            xc = lib.dot(x2, c)
+            dm_points.append([lib.dot(xc, xc.conj().T)])
+        else:
+            dm_points.append([lib.dot(lib.dot(x2, dms[i,k2]), x2.conj().T)
+                              for i in range(nset)])
+
+    for k1, x1 in enumerate(x_kpts):
+        for i in range(nset):
+            vM = 0
+            for k2 in range(nkpts):
+                coulM = mydf.get_coulM(kpts[k2]-kpts[k1], exxdiv)
+                vM = vM + coulM * dm_points[k2][i]
+            vk = lib.dot(lib.dot(x1.conj().T, vM), x1)
+            if vk_kpts.dtype == numpy.double:
+                vk = vk.real
+            vk_kpts[i,k1] = vk * weight
+
+    return _format_jks(vk_kpts, dm_kpts, None, kpts)
+
+def get_jk(mydf, dm, hermi=1, kpt=numpy.zeros(3), kpts_band=None,
+           with_j=True, with_k=True, exxdiv=None):
+    '''Get the Coulomb (J) and exchange (K) AO matrices for the given density
+    matrix.  See also :func:`fft_jk.get_jk`
+    '''
+    from pyscf.pbc.df import fft_jk
+    dm = numpy.asarray(dm, order='C')
+    vj = vk = None
+    if with_j:
+        vj = fft_jk.get_j(mydf, dm, hermi, kpt, kpts_band)
+    if with_k:
+        vk = get_k(mydf, dm, hermi, kpt, kpts_band, exxdiv)
+    return vj, vk
+
+def get_k(mydf, dm, hermi=1, kpt=numpy.zeros(3), kpts_band=None, exxdiv=None):
+    '''Get the exchange (K) AO matrices for the given density matrix.  See
+    also :func:`fft_jk.get_k`
+    '''
+    dm = numpy.asarray(dm, order='C')
+    nao = dm.shape[-1]
+    dm_kpts = dm.reshape(-1,1,nao,nao)
+    vk = get_k_kpts(mydf, dm_kpts, hermi, kpt.reshape(1,3), kpts_band, exxdiv)
+    if kpts_band is None:
+        vk = vk[:,0,:,:]
+    if dm.ndim == 2:
+        vk = vk[0]
+    return vk
+
+
+class ISDF(fft.FFTDF):
+    '''Interpolative separable density fitting on the uniform FFT mesh.
+
+    The Coulomb matrix is computed by FFTDF.  The exchange matrix is computed
+    with the low-rank factorization of the AO pair products.
+
+    Attributes:
+        max_points : int
+            Max number of the interpolation points.  Default is
+            MAX_POINTS_PER_AO * nao * nkpts.
+        threshold : float
+            Truncation threshold of the pivoted Cholesky decomposition which
+            selects the interpolation points.
+    '''
+    def __init__(self, cell, kpts=numpy.zeros((1,3)), low_dim_ft_type=None):
+        fft.FFTDF.__init__(self, cell, kpts, low_dim_ft_type)
+        self.max_points = None
+        self.threshold = THRESHOLD
+
+# Not input options
+        self.isdf_points = None  # grid indices of the interpolation points
+        self._zeta = None        # interpolation vectors
+        self._u_points = None    # periodic part of AOs on interpolation points
+        self._isdf_kpts = None
+        self._isdf_mesh = None
+        self._isdf_params = None
+        self._coulM = {}
+        self._keys = self._keys.union(['max_points', 'threshold', 'isdf_points'])
+
+    def dump_flags(self):
+        fft.FFTDF.dump_flags(self)
+        logger.info(self, 'max_points = %s', self.max_points)
+        logger.info(self, 'threshold = %g', self.threshold)
+        return self
+
+    def build(self, kpts=None):
+        '''Select the interpolation points and fit the interpolation vectors
+        for the orbital products of kpts.  Nothing is done if they were
+        generated for the same kpts, mesh, threshold and max_points.'''
+        if kpts is None:
+            kpts = self.kpts
+        kpts = numpy.reshape(kpts, (-1,3))
+        if (self._zeta is not None and
+            self._isdf_params == (self.threshold, self.max_points) and
+            numpy.array_equal(self._isdf_mesh, self.mesh) and
+            self._isdf_kpts.shape == kpts.shape and
+            abs(self._isdf_kpts - kpts).max() < 1e-9):
+            return self
+
+        t0 = (time.clock(), time.time())
+        log = logger.new_logger(self)
+        cell = self.cell
+        mesh = numpy.asarray(self.mesh)
+        coords = cell.gen_uniform_grids(mesh)
+        if self.non0tab is None or not numpy.array_equal(self._isdf_mesh, mesh):
+            self.non0tab = self._numint.make_mask(cell, coords)
+
+        u_kpts = get_periodic_ao(self, kpts, coords)
+        max_points = self.max_points
+        if max_points is None:
+            max_points = MAX_POINTS_PER_AO * cell.nao_nr() * len(kpts)
+        # chol and zeta, (npts,ngrids) each, are held in memory
+        ngrids = len(coords)
+        max_memory = self.max_memory - lib.current_memory()[0]
+        mem_points = int(max(max_memory, 0) * 1e6/8/ngrids/2)
+        if mem_points < min(max_points, ngrids):
+            log.warn('Not enough memory for %d ISDF interpolation points. '
+                     'max_points is reduced to %d', max_points, mem_points)
+            max_points = max(mem_points, 1)
+        idx, chol = select_points(u_kpts, max_points, self.threshold)
+        npts = len(idx)
+        t1 = log.timer_debug1('select %d interpolation points' % npts, *t0)
+
+        # zeta = K[:,idx] K[idx,idx]^{-1}.  With K ~ chol.T.dot(chol) and the
+        # upper triangular chol[:,idx], zeta = chol[:,idx]^{-1} chol
+        self._zeta = scipy.linalg.solve_triangular(chol[:,idx], chol, lower=False)
+        self._u_points = [u[idx] for u in u_kpts]
+        self.isdf_points = numpy.asarray(idx)
+        self._isdf_kpts = kpts
+        self._isdf_mesh = mesh
+        self._isdf_params = (self.threshold, self.max_points)
+        self._coulM = {}
+        log.info('ISDF: %d interpolation points on %d grids, %d AOs',
+                 npts, len(coords), cell.nao_nr())
+        log.timer('ISDF interpolation vectors', *t0)
+        return self
+
+    def get_coulM(self, q, exxdiv=None):
+        '''Coulomb matrix of the interpolation vectors for the momentum
+        transfer q.  The matrices are cached for the SCF iterations.'''
+        key = (tuple(numpy.round(q, 9)), exxdiv)
+        if key not in self._coulM:
+            self._coulM[key] = get_coulM(self, q, exxdiv)
+        return self._coulM[key]
+
+    def get_jk(self, dm, hermi=1, kpts=None, kpts_band=None,
+               with_j=True, with_k=True, exxdiv='ewald'):
+        from pyscf.pbc.df import fft_jk
+        if kpts is None:
+            if numpy.all(self.kpts == 0):
+                # Gamma-point calculation by default
+                kpts = numpy.zeros(3)
+            else:
+                kpts = self.kpts
+        else:
+            kpts = numpy.asarray(kpts)
+
+        vj = vk = None
+        if kpts.shape == (3,):
+            vj, vk = get_jk(self, dm, hermi, kpts, kpts_band,
+                            with_j, with_k, exxdiv)
+        else:
+            if with_k:
+                vk = get_k_kpts(self, dm, hermi, kpts, kpts_band, exxdiv)
+            if with_j:
+                vj = fft_jk.get_j_kpts(self, dm, hermi, kpts, kpts_band)
+        return vj, vk
+
+
+if __name__ == '__main__':
+    from pyscf.pbc import gto as pbcgto
+    from pyscf.pbc import scf as pbcscf
+    cell = pbcgto.Cell()
+    cell.verbose = 0
+    cell.atom = 'C 0 0 0; C 1 1 1; C 0 2 2; C 2 0 2'
+    cell.a = numpy.diag([4, 4, 4])
+    cell.basis = 'gth-szv'
+    cell.pseudo = 'gth-pade'
+    cell.mesh = [15]*3
+    cell.build()
+    mf = pbcscf.RHF(cell)
+    dm = mf.get_init_guess()
+    vk0 = fft.FFTDF(cell).get_jk(dm, with_j=False)[1]
+    vk1 = ISDF(cell).get_jk(dm, with_j=False)[1]
+    print(abs(vk1-vk0).max())
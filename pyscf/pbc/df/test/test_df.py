@@ -1,5 +1,8 @@
+import os
 import unittest
+import tempfile
 import numpy
+import h5py
 from pyscf import lib
 import pyscf.pbc
 from pyscf import ao2mo
@@ -100,6 +103,70 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(abs(eri0123.imag.sum()), 4.9901406037999863e-05, 9)
         self.assertAlmostEqual(finger(eri0123), 0.96952612970275598-0.33222740866776712j, 9)
 
+    def test_make_j3c_resume(self):
+        kpts1 = numpy.vstack((kpts[:2], -kpts[1]))
+        mydf = df.DF(cell, kpts1)
+        mydf.auxbasis = 'weigend'
+        mydf.mesh = (21,)*3
+        mydf.j3c_nthreads = 2
+        mydf._cderi_to_save = tempfile.NamedTemporaryFile().name
+        mydf.build()
+        ref = mydf.get_eri((kpts1[1],kpts1[2],kpts1[2],kpts1[1]))
+        eri0110 = kmdf.get_eri((kpts[0],kpts[1],kpts[1],kpts[0]))
+        self.assertAlmostEqual(abs(mydf.get_eri((kpts1[0],kpts1[1],kpts1[1],kpts1[0])) - eri0110).max(), 0, 9)
+        # The DF metric of -kpts[1] is shared with kpts[1]
+        eri0220 = mydf.get_eri((kpts1[0],kpts1[2],kpts1[2],kpts1[0]))
+        self.assertAlmostEqual(abs(eri0220 - eri0110.conj()).max(), 0, 9)
+
+        os.remove(mydf._cderi)
+        mydf.j3c_nthreads = 1
+        mydf.build()
+        self.assertAlmostEqual(abs(mydf.get_eri((kpts1[1],kpts1[2],kpts1[2],kpts1[1])) - ref).max(), 0, 9)
+        with h5py.File(mydf._cderi, 'r') as feri:
+            j3c_ref = [feri['j3c/%d'%ji].value for ji in range(len(feri['j3c']))]
+
+        def check_resumed():
+            with h5py.File(mydf._cderi, 'r') as feri:
+                self.assertTrue(numpy.all(feri['j3c-manifest'].value == df.J3C_DONE))
+                for ji, v in enumerate(j3c_ref):
+                    self.assertAlmostEqual(abs(feri['j3c/%d'%ji].value - v).max(), 0, 12)
+
+        class Interrupt(Exception):
+            pass
+        def interrupt_at(ncalls, fn):
+            count = [0]
+            def f(*args, **kwargs):
+                count[0] += 1
+                if count[0] == ncalls:
+                    raise Interrupt
+                return fn(*args, **kwargs)
+            return f
+
+        # Interrupted while computing a task
+        ft_aopair_kpts = df.ft_ao._ft_aopair_kpts
+        os.remove(mydf._cderi)
+        df.ft_ao._ft_aopair_kpts = interrupt_at(2, ft_aopair_kpts)
+        try:
+            self.assertRaises(Interrupt, mydf.build)
+        finally:
+            df.ft_ao._ft_aopair_kpts = ft_aopair_kpts
+        mydf.build()
+        check_resumed()
+
+        # Interrupted between the moves of the outputs of a task
+        move = h5py.Group.move
+        os.remove(mydf._cderi)
+        h5py.Group.move = interrupt_at(2, move)
+        try:
+            self.assertRaises(Interrupt, mydf.build)
+        finally:
+            h5py.Group.move = move
+        with h5py.File(mydf._cderi, 'r') as feri:
+            self.assertTrue(df.J3C_OUTPUT in feri['j3c-manifest'].value)
+        mydf.build()
+        check_resumed()
+        os.remove(mydf._cderi)
+
 
 
 if __name__ == '__main__':
@@ -660,6 +660,25 @@ class KnowValues(unittest.TestCase):
         vk1 = df.get_jk(dms, kpts=kpts, kpts_band=kpts_band, exxdiv=None)[1]
         self.assertAlmostEqual(lib.finger(vk1), 10.239828255099447+2.1190549216896182j, 9)
 
+    def test_cache_ao(self):
+        dm = mf0.get_init_guess()
+        dms = [dm] * len(kpts)
+        vj0, vk0 = fft.FFTDF(cell).get_jk(dms, kpts=kpts, exxdiv=None)
+        df = fft.FFTDF(cell)
+        df.cache_ao = True
+        df.ao_cache_memory = 0.1
+        for i in range(2):
+            vj1, vk1 = df.get_jk(dms, kpts=kpts, exxdiv=None)
+            self.assertAlmostEqual(abs(vj1-vj0).max(), 0, 12)
+            self.assertAlmostEqual(abs(vk1-vk0).max(), 0, 12)
+        self.assertEqual(len(df._ao_cache), len(kpts))
+
+        df.ao_cache_single_precision = True
+        df.reset_ao_cache()
+        vj1, vk1 = df.get_jk(dms, kpts=kpts, exxdiv=None)
+        self.assertAlmostEqual(abs(vj1-vj0).max(), 0, 5)
+        self.assertAlmostEqual(abs(vk1-vk0).max(), 0, 5)
+
     def test_get_ao_eri(self):
         df = fft.FFTDF(cell)
         eri0 = get_ao_eri(cell)
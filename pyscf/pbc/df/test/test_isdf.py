@@ -0,0 +1,50 @@
+import unittest
+import numpy
+from pyscf.pbc import gto
+from pyscf.pbc import scf
+from pyscf.pbc.df import fft, isdf
+
+
+cell = gto.Cell()
+cell.atom = 'He 1. .5 .5; He .1 1.3 2.1'
+cell.basis = {'He': [(0, (2.5, 1)), (0, (1., 1))]}
+cell.a = numpy.eye(3) * 2.5
+cell.mesh = [13] * 3
+cell.build()
+
+class KnowValues(unittest.TestCase):
+    def test_get_k_gamma(self):
+        dm = scf.RHF(cell).get_init_guess()
+        vk0 = fft.FFTDF(cell).get_jk(dm, with_j=False, exxdiv=None)[1]
+        mydf = isdf.ISDF(cell)
+        vk1 = mydf.get_jk(dm, with_j=False, exxdiv=None)[1]
+        self.assertTrue(vk1.dtype == numpy.float64)
+        self.assertAlmostEqual(abs(vk1-vk0).max(), 0, 4)
+
+        npts = len(mydf.isdf_points)
+        mydf.threshold = 1e-14
+        mydf.max_points = numpy.prod(cell.mesh)
+        mydf.build()
+        self.assertTrue(len(mydf.isdf_points) > npts)
+        vj0, vk0 = fft.FFTDF(cell).get_jk(dm, exxdiv='ewald')
+        vj1, vk1 = mydf.get_jk(dm, exxdiv='ewald')
+        self.assertAlmostEqual(abs(vj1-vj0).max(), 0, 9)
+        self.assertAlmostEqual(abs(vk1-vk0).max(), 0, 8)
+
+    def test_get_k_kpts(self):
+        kpts = cell.make_kpts([2,1,1])
+        nkpts = len(kpts)
+        dm = scf.KRHF(cell, kpts).get_init_guess()
+        mydf = isdf.ISDF(cell, kpts)
+        mydf.threshold = 1e-14
+        mydf.max_points = numpy.prod(cell.mesh)
+        vk0 = fft.FFTDF(cell, kpts).get_jk(dm, kpts=kpts, with_j=False)[1]
+        vk1 = mydf.get_jk(dm, kpts=kpts, with_j=False)[1]
+        self.assertAlmostEqual(abs(vk1-vk0).max(), 0, 8)
+        # Coulomb matrices for q = 0 and q = k1-k0, k0-k1
+        self.assertEqual(len(mydf._coulM), 3)
+
+
+if __name__ == '__main__':
+    print("Full Tests for isdf")
+    unittest.main()
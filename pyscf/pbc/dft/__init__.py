@@ -4,9 +4,11 @@ from pyscf.pbc.dft import rks
 from pyscf.pbc.dft import uks
 from pyscf.pbc.dft import krks
 from pyscf.pbc.dft import kuks
+from pyscf.pbc.dft import krks_ksymm
 
 RKS = rks.RKS
 UKS = uks.UKS
 KRKS = krks.KRKS
 KUKS = kuks.KUKS
+KsymAdaptedKRKS = krks_ksymm.KsymAdaptedKRKS
 
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Non-relativistic Restricted Kohn-Sham for periodic systems with k-point
+symmetry
+
+See Also:
+    pyscf.pbc.scf.khf_ksymm.py : Hartree-Fock with k-point symmetry
+'''
+
+import time
+import numpy as np
+from pyscf import lib
+from pyscf.lib import logger
+from pyscf.pbc.scf import khf_ksymm
+from pyscf.pbc.dft import krks
+from pyscf.pbc.dft import rks
+
+
+def get_veff(ks, cell=None, dm=None, dm_last=0, vhf_last=0, hermi=1,
+             kpts=None, kpts_band=None):
+    '''Coulomb + XC functional at the IBZ k-points
+
+    .. note::
+        This is a replica of pyscf.pbc.dft.krks.get_veff.  The input dm are
+        the density matrices of the IBZ k-points.  The density of the full
+        BZ is constructed by symmetry.
+
+    Returns:
+        Veff : (nibz, nao, nao) ndarray
+        Veff = J + Vxc.
+    '''
+    if cell is None: cell = ks.cell
+    if dm is None: dm = ks.make_rdm1()
+    if kpts is None: kpts = ks.kpts
+    t0 = (time.clock(), time.time())
+
+    # ndim = 3 : dm.shape = (nibz, nao, nao)
+    ground_state = (isinstance(dm, np.ndarray) and dm.ndim == 3 and
+                    kpts_band is None)
+    if kpts_band is None:
+        kpts_band = ks.kpts_ibz
+    dm_bz = ks._dm_to_bz(dm, kpts)
+
+    if ks.grids.coords is None:
+        ks.grids.build(with_non0tab=True)
+        if ks.small_rho_cutoff > 1e-20 and ground_state:
+            ks.grids = rks.prune_small_rho_grids_(ks, cell, dm_bz, ks.grids, kpts)
+        t0 = logger.timer(ks, 'setting up grids', *t0)
+
+    if hermi == 2:  # because rho = 0
+        n, exc, vxc = 0, 0, 0
+    else:
+        n, exc, vxc = ks._numint.nr_rks(cell, ks.grids, ks.xc, dm_bz, 0,
+                                        kpts, kpts_band)
+        logger.debug(ks, 'nelec by numeric integration = %s', n)
+        t0 = logger.timer(ks, 'vxc', *t0)
+
+    weights = ks.kpts_weights
+    omega, alpha, hyb = ks._numint.rsh_and_hybrid_coeff(ks.xc, spin=cell.spin)
+    if abs(hyb) < 1e-10:
+        vj = ks.get_j(cell, dm_bz, hermi, kpts, kpts_band)
+        vxc += vj
+    else:
+        if getattr(ks.with_df, '_j_only', False):  # for GDF and MDF
+            ks.with_df._j_only = False
+        vj, vk = ks.get_jk(cell, dm_bz, hermi, kpts, kpts_band)
+        vxc += vj - vk * (hyb * .5)
+
+        if ground_state:
+            exc -= np.einsum('K,Kij,Kji', weights, dm, vk).real * .5 * hyb*.5
+
+    if ground_state:
+        ecoul = np.einsum('K,Kij,Kji', weights, dm, vj).real * .5
+    else:
+        ecoul = None
+
+    vxc = lib.tag_array(vxc, ecoul=ecoul, exc=exc, vj=None, vk=None)
+    return vxc
+
+
+class KsymAdaptedKRKS(khf_ksymm.KsymAdaptedKSCF, krks.KRKS):
+    '''RKS class with k-point symmetry.
+    '''
+    _khf_class = krks.KRKS
+
+    get_veff = get_veff
+
+    def energy_elec(self, dm_kpts=None, h1e_kpts=None, vhf=None):
+        if h1e_kpts is None: h1e_kpts = self.get_hcore(self.cell)
+        if dm_kpts is None: dm_kpts = self.make_rdm1()
+        if vhf is None or getattr(vhf, 'ecoul', None) is None:
+            vhf = self.get_veff(self.cell, dm_kpts)
+
+        weights = self.kpts_weights
+        e1 = np.einsum('k,kij,kji', weights, h1e_kpts, dm_kpts).real
+        tot_e = e1 + vhf.ecoul + vhf.exc
+        logger.debug(self, 'E1 = %s  Ecoul = %s  Exc = %s', e1, vhf.ecoul, vhf.exc)
+        return tot_e, vhf.ecoul + vhf.exc
+
+
+if __name__ == '__main__':
+    from pyscf.pbc import gto
+    cell = gto.Cell()
+    cell.unit = 'A'
+    cell.atom = 'C 0.,  0.,  0.; C 0.8917,  0.8917,  0.8917'
+    cell.a = '''0.      1.7834  1.7834
+                1.7834  0.      1.7834
+                1.7834  1.7834  0.    '''
+
+    cell.basis = 'gth-szv'
+    cell.pseudo = 'gth-pade'
+    cell.verbose = 4
+    cell.build()
+    mf = KsymAdaptedKRKS(cell, cell.make_kpts([2,2,2]))
+    print(mf.kernel())
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+import unittest
+import numpy as np
+
+from pyscf.pbc import gto as pbcgto
+from pyscf.pbc.dft import krks
+from pyscf.pbc.dft import krks_ksymm
+
+cell = pbcgto.Cell()
+cell.unit = 'A'
+cell.atom = 'C 0.,  0.,  0.; C 0.8917,  0.8917,  0.8917'
+cell.a = '''0.      1.7834  1.7834
+            1.7834  0.      1.7834
+            1.7834  1.7834  0.    '''
+cell.basis = 'gth-szv'
+cell.pseudo = 'gth-pade'
+cell.mesh = [9]*3
+cell.verbose = 7
+cell.output = '/dev/null'
+cell.build()
+
+class KnowValues(unittest.TestCase):
+    def test_krks(self):
+        kpts = cell.make_kpts([2,2,2])
+        mf0 = krks.KRKS(cell, kpts)
+        mf0.xc = 'b3lyp'
+        e0 = mf0.kernel()
+        mf = krks_ksymm.KsymAdaptedKRKS(cell, kpts)
+        mf.xc = 'b3lyp'
+        e1 = mf.kernel()
+        self.assertEqual(len(mf.mo_energy), 3)
+        self.assertAlmostEqual(e1, e0, 8)
+
+        # The IBZ-weighted energies, including the exact exchange in exc,
+        # against the full BZ
+        dm = mf.make_rdm1()
+        vhf = mf.get_veff(cell, dm)
+        vhf0 = mf0.get_veff(cell, mf.kpts_symm.transform_dm(dm))
+        self.assertAlmostEqual(vhf.exc, vhf0.exc, 9)
+        self.assertAlmostEqual(vhf.ecoul, vhf0.ecoul, 9)
+        self.assertAlmostEqual(mf.energy_tot(dm), e0, 8)
+
+if __name__ == '__main__':
+    print("Full Tests for KRKS with k-point symmetry")
+    unittest.main()
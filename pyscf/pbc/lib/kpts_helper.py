@@ -5,7 +5,9 @@
 #          Timothy Berkelbach <tim.berkelbach@gmail.com>
 #
 
+import imp
 import itertools
+import threading
 from collections import OrderedDict
 import numpy as np
 import scipy.linalg
@@ -46,6 +48,190 @@ def loop_kkk(nkpts):
     return itertools.product(range_nkpts, range_nkpts, range_nkpts)
 
 
+def gather_kblocks(a, k1, k2, k3):
+    '''Stack the k-point blocks a[k1,k2,k3] of a k-point tensor along the
+    first axis.  k1, k2, k3 can be integers or 1D index arrays (of the same
+    length).  The tensor a can be a numpy array or a HDF5 dataset.
+    '''
+    if isinstance(a, (np.ndarray, KptsBlockStore)):
+        return a[k1,k2,k3]
+    k1, k2, k3 = np.broadcast_arrays(k1, k2, k3)
+    return np.asarray([a[i,j,k] for i, j, k in zip(k1, k2, k3)])
+
+
+# Upper limit (in bytes) of the HDF5 chunk.  A (kp,kq,kr) block is one chunk
+# unless it is larger than this limit.
+MAX_CHUNK_SIZE = 2**28
+
+def kblock_chunks(shape, dtype):
+    '''HDF5 chunk shape of a k-point tensor a[kp,kq,kr,...] for the access
+    pattern a[kp,kq,kr].  Each chunk holds one (kp,kq,kr) block (or a slice
+    of the block along its first orbital index if the block is too big).
+    '''
+    blkshape = tuple(shape[3:])
+    if not blkshape:
+        return None
+    rowsize = int(np.prod(blkshape[1:])) * np.dtype(dtype).itemsize
+    n0 = max(1, min(blkshape[0], MAX_CHUNK_SIZE // max(rowsize, 1)))
+    return (1, 1, 1, n0) + blkshape[1:]
+
+def create_kblock_dataset(h5group, key, shape, dtype):
+    '''Create the HDF5 dataset for a k-point tensor a[kp,kq,kr,...] with the
+    chunk layout given by :func:`kblock_chunks`'''
+    dtype = np.dtype(dtype)
+    if 0 in shape:
+        return h5group.create_dataset(key, shape, dtype.char)
+    return h5group.create_dataset(key, shape, dtype.char,
+                                  chunks=kblock_chunks(shape, dtype))
+
+class KptsBlockStore(object):
+    '''Read cache for a k-point tensor a[kp,kq,kr,...] which is saved in a
+    HDF5 dataset.
+
+    The (kp,kq,kr) blocks are loaded from the dataset on demand and held in a
+    LRU cache within the memory budget max_memory (in MB).  The object can be
+    indexed like a numpy array.  The first three indices (the k-point
+    indices) can be integers, slices or index arrays.  Assignment is written
+    through to the dataset.
+
+    Blocks which will be used soon can be loaded in background by
+    :func:`prefetch`.
+    '''
+    def __init__(self, dataset, max_memory=None):
+        self.dataset = dataset
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+        self.ndim = len(self.shape)
+        if max_memory is None:
+            max_memory = pyscf.lib.param.MAX_MEMORY
+        self.max_memory = max_memory
+        self._kgrid = np.arange(int(np.prod(self.shape[:3])))
+        self._kgrid = self._kgrid.reshape(self.shape[:3])
+        self._blkshape = tuple(self.shape[3:])
+        self._blksize = int(np.prod(self._blkshape)) * self.dtype.itemsize
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+        self._prefetcher = None
+        self._prefetching = set()
+# Python threads may hang in the import stage.  See lib.call_in_background
+        self.async_prefetch = not imp.lock_held()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None):
+        return np.asarray(self.dataset[:], dtype=dtype)
+
+    def _block_ids(self, kidx):
+        return np.asarray(self._kgrid[tuple(kidx)])
+
+    def _fit_cache(self, nbytes):
+        budget = self.max_memory * 1e6
+        if nbytes > budget:
+            return False
+        while self._blocks and (len(self._blocks)+1)*self._blksize > budget:
+            self._blocks.popitem(last=False)
+        return True
+
+    def _load(self, bid):
+        with self._lock:
+            if bid in self._blocks:
+                # move to the end of the LRU queue
+                blk = self._blocks[bid] = self._blocks.pop(bid)
+                return blk
+        kp, kq, kr = np.unravel_index(bid, self.shape[:3])
+        blk = self.dataset[int(kp),int(kq),int(kr)]
+        with self._lock:
+            if self._fit_cache(self._blksize):
+                self._blocks[bid] = blk
+        return blk
+
+    def __getitem__(self, idx):
+        if not isinstance(idx, tuple):
+            idx = (idx,)
+        kidx, oidx = idx[:3], idx[3:]
+        if any(i is Ellipsis for i in kidx):
+            self.wait()
+            return self.dataset[idx]
+        ids = self._block_ids(kidx)
+        if self._prefetching.intersection(ids.ravel()):
+            self.wait()
+
+        loaded = {}
+        for bid in ids.ravel():
+            if bid not in loaded:
+                loaded[bid] = self._load(bid)
+        if ids.ndim == 0:
+            out = np.array(loaded[int(ids)])
+        else:
+            out = np.empty(ids.shape+self._blkshape, self.dtype)
+            for i, bid in enumerate(ids.ravel()):
+                out.reshape((-1,)+self._blkshape)[i] = loaded[bid]
+        if oidx:
+            out = out[(slice(None),)*ids.ndim + oidx]
+        return out
+
+    def __setitem__(self, idx, value):
+        if not isinstance(idx, tuple):
+            idx = (idx,)
+        self.wait()
+        kidx = idx[:3]
+        if any(i is Ellipsis for i in kidx):
+            ids = self._kgrid.ravel()
+        else:
+            ids = self._block_ids(kidx).ravel()
+        with self._lock:
+            for bid in ids:
+                self._blocks.pop(bid, None)
+        self.dataset[idx] = value
+
+        if len(idx) == 3 and ids.size == 1:
+            # Keep the new block which is likely to be read soon
+            blk = np.empty(self._blkshape, self.dtype)
+            blk[:] = value
+            with self._lock:
+                if self._fit_cache(self._blksize):
+                    self._blocks[ids[0]] = blk
+
+    def _load_blocks(self, ids):
+        for bid in ids:
+            self._load(bid)
+
+    def prefetch(self, k1, k2, k3):
+        '''Load the blocks a[k1,k2,k3] in background'''
+        self.wait()
+        ids = np.unique(self._block_ids((k1, k2, k3)))
+        with self._lock:
+            ids = [bid for bid in ids if bid not in self._blocks]
+        # Leave room in the cache for the blocks which are being used
+        if (not ids or not self.async_prefetch or
+            len(ids)*self._blksize*2 > self.max_memory*1e6):
+            return self
+        with self._lock:
+            self._prefetching = set(ids)
+            self._prefetcher = pyscf.lib.background_thread(self._load_blocks, ids)
+        return self
+
+    def wait(self):
+        '''Wait for the background prefetching'''
+        # wait may be called by several threads.  The prefetcher is joined
+        # through a local reference and reset only by the first thread.
+        # Thread.join is used because ThreadWithReturnValue.join returns the
+        # result only once.
+        prefetcher = self._prefetcher
+        if prefetcher is not None:
+            threading.Thread.join(prefetcher)
+            with self._lock:
+                if self._prefetcher is prefetcher:
+                    self._prefetcher = None
+                    self._prefetching = set()
+        return self
+
+    def clear(self):
+        self.wait()
+        with self._lock:
+            self._blocks.clear()
+
 def get_kconserv(cell, kpts):
     r'''Get the momentum conservation array for a set of k-points.
 
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Space group symmetry of crystals and the irreducible Brillouin zone (IBZ)
+
+A space group operation g = {R|t} maps r to R r + t.  It maps the Bloch AOs
+at k-point k to the Bloch AOs at R k
+
+    g phi^k_{a,m} = \sum_{m'} phi^{Rk}_{b,m'} D_{m'm}(R) exp(-i Rk.L_a)
+
+where atom b = g(a) - L_a and D(R) is the representation of R in the
+(real spherical or Cartesian) GTOs of the shell.  Density matrices (and
+Fock matrices, MO coefficients) are transformed with U = D exp(-i Rk.L)
+
+    dm(Rk) = U dm(k) U^\dagger
+
+Time reversal symmetry gives dm(-k) = dm(k).conj().
+'''
+
+import numpy
+from pyscf import lib
+from pyscf import gto
+from pyscf.lib import logger
+from pyscf.symm import geom
+from pyscf.pbc.lib.kpts_helper import KPT_DIFF_TOL
+
+def get_space_group(cell, tol=geom.TOLERANCE):
+    '''Space group operations of the cell.
+
+    The rotations are searched among the integer matrices (with elements
+    -1, 0, 1) in the basis of lattice vectors which conserve the lattice
+    metric.  For each rotation, the translation is determined by the
+    requirement that all atoms are mapped to atoms of the same kind.
+
+    Returns:
+        rots : (nop,3,3) ndarray
+            Rotation matrices in Cartesian coordinates.  rots[0] is identity.
+        trans : (nop,3) ndarray
+            Translation vectors in Cartesian coordinates.
+        perms : (nop,natm) ndarray of int
+            perms[op,a] is the atom which atom a is mapped to.
+        shifts : (nop,natm,3) ndarray
+            Lattice vectors L_a = R r_a + t - r_{perms[op,a]}
+    '''
+    a = cell.lattice_vectors()
+    natm = cell.natm
+    coords = cell.atom_coords().reshape(-1,3)
+    frac = numpy.dot(coords, numpy.linalg.inv(a))
+    symbols = [cell.atom_symbol(i) for i in range(natm)]
+
+    if cell.dimension < 3:
+        # The lattice search below does not distinguish the periodic and
+        # the vacuum directions.  Only identity is used.
+        ws = numpy.eye(3, dtype=int).reshape(1,3,3)
+    else:
+        ws = lib.cartesian_prod([(1, 0, -1)] * 9).reshape(-1,3,3)
+        metric = numpy.dot(a, a.T)
+        err = abs(numpy.einsum('nij,jk,nlk->nil', ws, metric, ws) - metric)
+        ws = ws[err.max(axis=(1,2)) < tol * abs(metric).max()]
+        # identity first
+        idx = numpy.argsort([abs(w - numpy.eye(3)).sum() for w in ws],
+                            kind='mergesort')
+        ws = ws[idx]
+
+    same_kind = numpy.array([[si == sj for sj in symbols] for si in symbols])
+    rots = []
+    trans = []
+    perms = []
+    shifts = []
+    for w in ws:
+        xw = numpy.dot(frac, w)
+        for j in numpy.where(same_kind[0])[0]:
+            tau = frac[j] - xw[0]
+            dx = xw[:,None,:] + tau - frac
+            dx -= numpy.round(dx)
+            dist = numpy.linalg.norm(numpy.dot(dx, a), axis=2)
+            match = (dist < tol) & same_kind
+            if numpy.all(match.sum(axis=1) == 1):
+                perm = numpy.argmax(match, axis=1)
+                rots.append(numpy.dot(numpy.linalg.solve(a, w), a).T)
+                trans.append(numpy.dot(tau, a))
+                shifts.append(numpy.dot(numpy.round(xw + tau - frac[perm]), a))
+                perms.append(perm)
+                break
+    return (numpy.asarray(rots), numpy.asarray(trans),
+            numpy.asarray(perms), numpy.asarray(shifts))
+
+def _ao_rotation_mat(l, rot, cart=False):
+    '''Representation matrix D of the rotation in the GTOs of angular momentum
+    l, defined by chi(rot^{-1} r) = chi(r) D'''
+    if l == 0:
+        return numpy.ones((1,1))
+    elif l == 1 and not cart:
+        return rot
+    ncart = (l+1)*(l+2)//2
+    if cart:
+        c2s = numpy.eye(ncart)
+    else:
+        c2s = gto.cart2sph(l)
+    # Fit on randomly distributed points
+    r = numpy.random.RandomState(3).random_sample((ncart*2,3)) - .5
+    def cart_polys(r):
+        x, y, z = r.T
+        return numpy.array([x**lx * y**ly * z**(l-lx-ly)
+                            for lx in reversed(range(l+1))
+                            for ly in reversed(range(l-lx+1))]).T
+    y0 = numpy.dot(cart_polys(r), c2s)
+    y1 = numpy.dot(cart_polys(numpy.dot(r, rot)), c2s)
+    return numpy.linalg.lstsq(y0, y1, rcond=-1)[0]
+
+def ao_rotation_mat(cell, rot, perm):
+    '''AO representation of the space group operation {rot|t} (without the
+    Bloch phase factors).  The AOs of atom a are mapped to the AOs of atom
+    perm[a].'''
+    ao_loc = cell.ao_loc_nr()
+    nao = ao_loc[-1]
+    atm_shls = [[] for i in range(cell.natm)]
+    for ib in range(cell.nbas):
+        atm_shls[cell.bas_atom(ib)].append(ib)
+
+    dmats = {}
+    mat = numpy.zeros((nao,nao))
+    for ia in range(cell.natm):
+        ib = perm[ia]
+        if len(atm_shls[ia]) != len(atm_shls[ib]):
+            raise RuntimeError('Atoms %d and %d have different basis' % (ia, ib))
+        for ish, jsh in zip(atm_shls[ia], atm_shls[ib]):
+            l = cell.bas_angular(ish)
+            if l not in dmats:
+                dmats[l] = _ao_rotation_mat(l, rot, cell.cart)
+            d = dmats[l]
+            nd = d.shape[0]
+            i0 = ao_loc[ish]
+            j0 = ao_loc[jsh]
+            for c in range(cell.bas_nctr(ish)):
+                mat[j0+c*nd:j0+c*nd+nd,i0+c*nd:i0+c*nd+nd] = d
+    return mat
+
+
+class KptsSymm(object):
+    '''Reduction of k-points to the irreducible Brillouin zone.
+
+    Attributes:
+        kpts : (nkpts,3) ndarray
+            The k-points in the full Brillouin zone
+        ibz_index : (nibz,) ndarray of int
+            Indices of the IBZ k-points in kpts.
+        weights : (nibz,) ndarray
+            Weight of each IBZ k-point.  The weights sum up to 1.
+        bz2ibz : (nkpts,) ndarray of int
+            bz2ibz[k] is the IBZ k-point which kpts[k] is generated from.
+        bz_op : (nkpts,) ndarray of int
+            The space group operation which maps the IBZ k-point to kpts[k]
+        bz_time_reversal : (nkpts,) ndarray of bool
+            Whether time reversal is combined with bz_op.
+    '''
+    def __init__(self, cell, kpts, tol=geom.TOLERANCE, time_reversal=True):
+        self.cell = cell
+        self.kpts = kpts = numpy.reshape(kpts, (-1,3))
+        self.rots, self.trans, self.perms, self.shifts = get_space_group(cell, tol)
+
+        nkpts = len(kpts)
+        a = cell.lattice_vectors() / (2*numpy.pi)
+        bz2ibz = -numpy.ones(nkpts, dtype=int)
+        bz_op = numpy.zeros(nkpts, dtype=int)
+        bz_tr = numpy.zeros(nkpts, dtype=bool)
+        ibz_index = []
+        for k in range(nkpts):
+            if bz2ibz[k] >= 0:
+                continue
+            kibz = len(ibz_index)
+            ibz_index.append(k)
+            for op, rot in enumerate(self.rots):
+                rk = numpy.dot(rot, kpts[k])
+                for tr in ((False, True) if time_reversal else (False,)):
+                    # compare the scaled k-points modulo reciprocal lattice vectors
+                    dk = numpy.dot(kpts - (-rk if tr else rk), a.T)
+                    dk = abs(dk - numpy.round(dk)).sum(axis=1)
+                    for j in numpy.where((dk < KPT_DIFF_TOL) & (bz2ibz < 0))[0]:
+                        bz2ibz[j] = kibz
+                        bz_op[j] = op
+                        bz_tr[j] = tr
+        self.ibz_index = numpy.asarray(ibz_index)
+        self.bz2ibz = bz2ibz
+        self.bz_op = bz_op
+        self.bz_time_reversal = bz_tr
+        self.weights = numpy.bincount(bz2ibz) / float(nkpts)
+        self._ao_rot = {}
+
+    @property
+    def ibz_kpts(self):
+        return self.kpts[self.ibz_index]
+
+    @property
+    def nop(self):
+        return len(self.rots)
+
+    def dump_flags(self, verbose=None):
+        log = logger.new_logger(self.cell, verbose)
+        log.info('Number of space group operations = %d', self.nop)
+        log.info('Number of k-points in IBZ = %d  (full BZ = %d)',
+                 len(self.ibz_index), len(self.kpts))
+        log.debug('IBZ k-points %s  weights %s', self.ibz_kpts, self.weights)
+        return self
+
+    def transform_mat(self, mat_ibz, conj_tr=True):
+        '''Transform the AO matrices (density matrices, Fock matrices) or MO
+        coefficients from the IBZ k-points to all k-points.
+
+        Args:
+            mat_ibz : (..., nibz, nao, *) ndarray
+                AO matrices (conj_tr=True) or MO coefficients (conj_tr=False)
+                at IBZ k-points
+
+        Returns:
+            (..., nkpts, nao, *) ndarray
+        '''
+        mat_ibz = numpy.asarray(mat_ibz)
+        nibz = len(self.ibz_index)
+        if mat_ibz.shape[-3] != nibz:
+            raise ValueError('Shape %s of IBZ matrices does not match %d '
+                             'IBZ k-points' % (mat_ibz.shape, nibz))
+        if nibz == len(self.kpts):
+            return mat_ibz
+
+        nkpts = len(self.kpts)
+        shape = mat_ibz.shape[:-3] + (nkpts,) + mat_ibz.shape[-2:]
+        out = numpy.empty(shape, dtype=numpy.complex128)
+        for k in range(nkpts):
+            kibz = self.bz2ibz[k]
+            op = self.bz_op[k]
+            if op == 0:
+                v = mat_ibz[...,kibz,:,:]
+            else:
+                u = self.ao_rotation(op, self.kpts[self.ibz_index[kibz]])
+                v = lib.einsum('ij,...jk->...ik', u, mat_ibz[...,kibz,:,:])
+                if conj_tr:
+                    v = lib.einsum('...ij,kj->...ik', v, u.conj())
+            if self.bz_time_reversal[k]:
+                v = v.conj()
+            out[...,k,:,:] = v
+        return out
+
+    def transform_dm(self, dm_ibz):
+        '''Density matrices at all k-points from the density matrices at IBZ
+        k-points'''
+        return self.transform_mat(dm_ibz, True)
+
+    def transform_mo_coeff(self, mo_coeff_ibz):
+        '''MO coefficients at all k-points from the MO coefficients at IBZ
+        k-points'''
+        return self.transform_mat(mo_coeff_ibz, False)
+
+    def transform_mo_energy(self, mo_energy_ibz):
+        '''Orbital energies (or occupancies) at all k-points'''
+        return [mo_energy_ibz[k] for k in self.bz2ibz]
+
+    def ao_rotation(self, op, kpt):
+        '''The unitary transformation U of operation op which maps the Bloch
+        AOs at kpt to the AOs at rots[op] kpt'''
+        if op not in self._ao_rot:
+            mat = ao_rotation_mat(self.cell, self.rots[op], self.perms[op])
+            aoslices = self.cell.aoslice_by_atom()
+            ao_shifts = numpy.empty((mat.shape[0],3))
+            for ia, (p0, p1) in enumerate(aoslices[:,2:]):
+                ao_shifts[p0:p1] = self.shifts[op,ia]
+            self._ao_rot[op] = (mat, ao_shifts)
+        mat, ao_shifts = self._ao_rot[op]
+        rk = numpy.dot(self.rots[op], kpt)
+        return mat * numpy.exp(-1j * numpy.dot(ao_shifts, rk))
@@ -3,6 +3,7 @@ import numpy
 from pyscf.pbc import gto as pbcgto
 from pyscf.pbc import tools
 from pyscf.pbc.scf import khf
+from pyscf.pbc.lib import kpts_helper
 from pyscf import lib
 
 
@@ -18,6 +19,31 @@ class KnownValues(unittest.TestCase):
         kconserve = tools.get_kconserv(cell, kpts)
         self.assertAlmostEqual(lib.finger(kconserve), 84.88659638289468, 9)
 
+    def test_kblock_store(self):
+        numpy.random.seed(1)
+        ref = numpy.random.random((3,3,3,2,3,2,3))
+        ftmp = lib.H5TmpFile()
+        dset = kpts_helper.create_kblock_dataset(ftmp, 'a', ref.shape, ref.dtype)
+        self.assertEqual(dset.chunks, (1,1,1,2,3,2,3))
+        dset[:] = ref
+        # hold at most 2 blocks in the cache
+        store = kpts_helper.KptsBlockStore(dset, max_memory=ref[0,0,0].nbytes*2.5e-6)
+        kidx = numpy.array([2,0,1])
+        store.prefetch(1, kidx, 0)
+        for idx in [(1,2), (1,slice(None),0), (kidx,1,kidx), (1,kidx),
+                    (0,1,2,1,slice(0,2))]:
+            self.assertAlmostEqual(abs(store[idx] - ref[idx]).max(), 0, 14)
+        self.assertTrue(len(store._blocks) <= 2)
+        self.assertAlmostEqual(abs(kpts_helper.gather_kblocks(store, 1, kidx, 2) -
+                                   ref[1,kidx,2]).max(), 0, 14)
+        store[1,1,1] = ref[1,1,1] * 2
+        store[2,1,0,1] = 0
+        ref[1,1,1] *= 2
+        ref[2,1,0,1] = 0
+        self.assertAlmostEqual(abs(store[1,1,1] - ref[1,1,1]).max(), 0, 14)
+        self.assertAlmostEqual(abs(store[2,1] - ref[2,1]).max(), 0, 14)
+        self.assertAlmostEqual(abs(numpy.asarray(store) - ref).max(), 0, 14)
+
     def test_kconserve3(self):
         cell = pbcgto.Cell()
         cell.atom = 'He 0 0 0'
@@ -13,6 +13,7 @@ from pyscf.pbc.scf import khf
 krhf = khf
 from pyscf.pbc.scf import kuhf
 from pyscf.pbc.scf import kghf
+from pyscf.pbc.scf import khf_ksymm
 from pyscf.pbc.scf import newton_ah
 from pyscf.pbc.scf import addons
 
@@ -22,5 +23,6 @@ GHF = ghf.GHF
 
 KRHF = krhf.KRHF
 KUHF = kuhf.KUHF
+KsymAdaptedKRHF = khf_ksymm.KsymAdaptedKRHF
 
 newton = newton_ah.newton
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Restricted Hartree-Fock for periodic systems with k-point symmetry
+
+The SCF equations are solved for the k-points in the irreducible Brillouin
+zone (IBZ).  The density matrices of the other k-points are generated by
+the space group and time reversal symmetry when they are needed in the
+Coulomb and exchange matrices.  Energy and Fermi level are the weighted sums
+over the IBZ k-points.
+
+See Also:
+    pyscf.pbc.lib.kpts_symm
+'''
+
+import time
+import numpy as np
+import h5py
+from pyscf import lib
+from pyscf.lib import logger
+from pyscf.pbc.scf import khf
+from pyscf.pbc.lib import kpts_symm
+
+
+def energy_elec(mf, dm_kpts=None, h1e_kpts=None, vhf_kpts=None):
+    '''Following pyscf.pbc.scf.khf.energy_elec().  The matrices are the
+    matrices of the IBZ k-points.
+    '''
+    if dm_kpts is None: dm_kpts = mf.make_rdm1()
+    if h1e_kpts is None: h1e_kpts = mf.get_hcore()
+    if vhf_kpts is None: vhf_kpts = mf.get_veff(mf.cell, dm_kpts)
+
+    weights = mf.kpts_weights
+    e1 = np.einsum('k,kij,kji', weights, dm_kpts, h1e_kpts)
+    e_coul = np.einsum('k,kij,kji', weights, dm_kpts, vhf_kpts) * 0.5
+    if abs(e_coul.imag) > 1.e-7:
+        raise RuntimeError("Coulomb energy has imaginary part, "
+                           "something is wrong!", e_coul.imag)
+    e1 = e1.real
+    e_coul = e_coul.real
+    logger.debug(mf, 'E_coul = %.15g', e_coul)
+    return e1+e_coul, e_coul
+
+def get_occ(mf, mo_energy_kpts=None, mo_coeff_kpts=None):
+    '''Label the occupancies for each orbital for the IBZ k-points.  Each
+    IBZ k-point is counted as many times as the number of k-points it
+    represents.
+    '''
+    if mo_energy_kpts is None: mo_energy_kpts = mf.mo_energy
+    symm = mf.kpts_symm
+    mo_occ_kpts = khf.get_occ(mf, symm.transform_mo_energy(mo_energy_kpts))
+    return [mo_occ_kpts[k] for k in symm.ibz_index]
+
+def get_fermi(mf, mo_energy_kpts=None, mo_occ_kpts=None):
+    '''Fermi level
+    '''
+    if mo_energy_kpts is None: mo_energy_kpts = mf.mo_energy
+    if mo_occ_kpts is None: mo_occ_kpts = mf.mo_occ
+    bz2ibz = mf.kpts_symm.bz2ibz
+    return khf.get_fermi(mf, np.asarray(mo_energy_kpts)[bz2ibz],
+                         np.asarray(mo_occ_kpts)[bz2ibz])
+
+
+class KsymAdaptedKSCF(khf.KSCF):
+    '''KSCF with k-point symmetry.
+
+    mf.kpts are the k-points of the full Brillouin zone, as in KSCF.  The
+    orbitals, orbital energies, occupancies and the 1-particle matrices
+    (hcore, overlap, Fock, density matrix) are the quantities of the IBZ
+    k-points mf.kpts_ibz.  Post-SCF methods which need the full BZ should
+    use the object returned by :func:`to_khf`.
+
+    Attributes:
+        kpts_symm : :class:`KptsSymm`
+            Space group operations and the map between IBZ and full BZ
+        kpts_ibz : (nibz,3) ndarray
+            The IBZ k-points
+        kpts_weights : (nibz,) ndarray
+            The weights of the IBZ k-points
+    '''
+    _kpts_symm = None
+
+    @property
+    def kpts(self):
+        return self.with_df.kpts
+    @kpts.setter
+    def kpts(self, x):
+        self.with_df.kpts = np.reshape(x, (-1,3))
+        self._kpts_symm = None
+
+    @property
+    def kpts_symm(self):
+        kpts = self.kpts
+        if (self._kpts_symm is None or
+            self._kpts_symm.kpts.shape != kpts.shape or
+            abs(self._kpts_symm.kpts - kpts).max() > 1e-9):
+            self._kpts_symm = kpts_symm.KptsSymm(self.cell, kpts)
+        return self._kpts_symm
+
+    @property
+    def kpts_ibz(self):
+        return self.kpts_symm.ibz_kpts
+
+    @property
+    def kpts_weights(self):
+        return self.kpts_symm.weights
+
+    def dump_flags(self):
+        khf.KSCF.dump_flags(self)
+        self.kpts_symm.dump_flags(self.verbose)
+        return self
+
+    def get_hcore(self, cell=None, kpts=None):
+        if kpts is None: kpts = self.kpts_ibz
+        return khf.KSCF.get_hcore(self, cell, kpts)
+
+    def get_ovlp(self, cell=None, kpts=None):
+        if kpts is None: kpts = self.kpts_ibz
+        return khf.get_ovlp(self, cell, kpts)
+
+    def get_init_guess(self, cell=None, key='minao'):
+        '''Initial guess density matrices of the IBZ k-points'''
+        if cell is None:
+            cell = self.cell
+        dm_kpts = None
+        if key.lower() == '1e':
+            dm_kpts = self.init_guess_by_1e(cell)
+        elif getattr(cell, 'natm', 0) == 0:
+            logger.info(self, 'No atom found in cell. Use 1e initial guess')
+            dm_kpts = self.init_guess_by_1e(cell)
+        elif key.lower() == 'atom':
+            dm = self.init_guess_by_atom(cell)
+        elif key.lower().startswith('chk'):
+            try:
+                dm_kpts = self.from_chk()
+            except (IOError, KeyError):
+                logger.warn(self, 'Fail in reading %s. Use MINAO initial guess',
+                            self.chkfile)
+                dm = self.init_guess_by_minao(cell)
+        else:
+            dm = self.init_guess_by_minao(cell)
+
+        if dm_kpts is None:
+            dm_kpts = lib.asarray([dm]*len(self.kpts_ibz))
+
+        if cell.dimension < 3:
+            ne = np.einsum('kij,kji->k', dm_kpts, self.get_ovlp(cell)).real
+            if np.any(abs(ne - cell.nelectron) > 1e-7):
+                logger.warn(self, 'Big error detected in the electron number '
+                            'of initial guess density matrix (Ne/cell = %g)!\n'
+                            '  DM is normalized to correct number of electrons',
+                            np.dot(self.kpts_weights, ne))
+                dm_kpts *= cell.nelectron / ne.reshape(-1,1,1)
+        return dm_kpts
+
+    def init_guess_by_chkfile(self, chk=None, project=None, kpts=None):
+        if kpts is None: kpts = self.kpts_ibz
+        return khf.KSCF.init_guess_by_chkfile(self, chk, project, kpts)
+
+    def _dm_to_bz(self, dm_kpts, kpts):
+        '''Density matrices of the full BZ from the IBZ density matrices'''
+        symm = self.kpts_symm
+        dm_kpts = np.asarray(dm_kpts)
+        if (len(kpts) == len(symm.kpts) != len(symm.ibz_index) and
+            dm_kpts.shape[-3] == len(symm.ibz_index)):
+            dm_kpts = symm.transform_dm(dm_kpts)
+        return dm_kpts
+
+    def get_j(self, cell=None, dm_kpts=None, hermi=1, kpts=None, kpts_band=None):
+        if cell is None: cell = self.cell
+        if kpts is None: kpts = self.kpts
+        if kpts_band is None: kpts_band = self.kpts_ibz
+        if dm_kpts is None: dm_kpts = self.make_rdm1()
+        cpu0 = (time.clock(), time.time())
+        dm_kpts = self._dm_to_bz(dm_kpts, kpts)
+        vj = self.with_df.get_jk(dm_kpts, hermi, kpts, kpts_band, with_k=False)[0]
+        logger.timer(self, 'vj', *cpu0)
+        return vj
+
+    def get_jk(self, cell=None, dm_kpts=None, hermi=1, kpts=None, kpts_band=None):
+        if cell is None: cell = self.cell
+        if kpts is None: kpts = self.kpts
+        if kpts_band is None: kpts_band = self.kpts_ibz
+        if dm_kpts is None: dm_kpts = self.make_rdm1()
+        cpu0 = (time.clock(), time.time())
+        dm_kpts = self._dm_to_bz(dm_kpts, kpts)
+        vj, vk = self.with_df.get_jk(dm_kpts, hermi, kpts, kpts_band,
+                                     exxdiv=self.exxdiv)
+        logger.timer(self, 'vj and vk', *cpu0)
+        return vj, vk
+
+    def get_grad(self, mo_coeff_kpts, mo_occ_kpts, fock=None):
+        if fock is None:
+            dm1 = self.make_rdm1(mo_coeff_kpts, mo_occ_kpts)
+            fock = self.get_hcore(self.cell) + self.get_veff(self.cell, dm1)
+        return khf.get_grad(mo_coeff_kpts, mo_occ_kpts, fock)
+
+    energy_elec = energy_elec
+    get_occ = get_occ
+    get_fermi = get_fermi
+
+    def dump_chk(self, envs):
+        khf.KSCF.dump_chk(self, envs)
+        if self.chkfile:
+            with h5py.File(self.chkfile) as fh5:
+                del(fh5['scf/kpts'])
+                fh5['scf/kpts'] = self.kpts_ibz
+        return self
+
+    def to_khf(self):
+        '''Convert to the KSCF object of the full BZ.  Orbitals and orbital
+        energies are generated by symmetry operations.'''
+        symm = self.kpts_symm
+        mf = self._khf_class(self.cell, self.kpts)
+        mf.__dict__.update(dict((k, v) for k, v in self.__dict__.items()
+                                if k not in ('mo_energy', 'mo_coeff',
+                                             'mo_occ', '_kpts_symm')))
+        if self.mo_coeff is not None:
+            mf.mo_coeff = list(symm.transform_mo_coeff(self.mo_coeff))
+            mf.mo_energy = symm.transform_mo_energy(self.mo_energy)
+            mf.mo_occ = symm.transform_mo_energy(self.mo_occ)
+        return mf
+
+
+class KsymAdaptedKRHF(KsymAdaptedKSCF, khf.KRHF):
+    _khf_class = khf.KRHF
+
+
+if __name__ == '__main__':
+    from pyscf.pbc import gto
+    cell = gto.Cell()
+    cell.unit = 'A'
+    cell.atom = 'C 0.,  0.,  0.; C 0.8917,  0.8917,  0.8917'
+    cell.a = '''0.      1.7834  1.7834
+                1.7834  0.      1.7834
+                1.7834  1.7834  0.    '''
+    cell.basis = 'gth-szv'
+    cell.pseudo = 'gth-pade'
+    cell.verbose = 4
+    cell.build()
+    mf = KsymAdaptedKRHF(cell, cell.make_kpts([2,2,2]))
+    mf.kernel()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import unittest
+import numpy as np
+
+from pyscf.pbc import gto as pbcgto
+from pyscf.pbc.scf import khf
+from pyscf.pbc.scf import khf_ksymm
+
+cell = pbcgto.Cell()
+cell.unit = 'A'
+cell.atom = 'C 0.,  0.,  0.; C 0.8917,  0.8917,  0.8917'
+cell.a = '''0.      1.7834  1.7834
+            1.7834  0.      1.7834
+            1.7834  1.7834  0.    '''
+cell.basis = 'gth-szv'
+cell.pseudo = 'gth-pade'
+cell.mesh = [9]*3
+cell.verbose = 7
+cell.output = '/dev/null'
+cell.build()
+
+class KnowValues(unittest.TestCase):
+    def test_kpts_symm(self):
+        kpts = cell.make_kpts([3,3,3])
+        mf = khf_ksymm.KsymAdaptedKRHF(cell, kpts)
+        symm = mf.kpts_symm
+        self.assertEqual(symm.nop, 48)
+        self.assertEqual(len(mf.kpts_ibz), 4)
+        self.assertAlmostEqual(mf.kpts_weights.sum(), 1, 12)
+
+        s_ibz = mf.get_ovlp()
+        s_bz = khf.get_ovlp(mf, cell, kpts)
+        self.assertAlmostEqual(abs(symm.transform_dm(s_ibz) - s_bz).max(), 0, 9)
+
+    def test_init_guess(self):
+        kpts = cell.make_kpts([2,2,2])
+        mf = khf_ksymm.KsymAdaptedKRHF(cell, kpts)
+        nibz = len(mf.kpts_ibz)
+        nao = cell.nao_nr()
+        self.assertEqual(mf.init_guess_by_1e().shape, (nibz,nao,nao))
+        self.assertEqual(mf.get_init_guess(key='1e').shape, (nibz,nao,nao))
+        self.assertEqual(mf.get_init_guess(key='minao').shape, (nibz,nao,nao))
+
+        # The k-independent atomic guess of KRHF is invariant under the
+        # symmetry operations if the cell has only one atom
+        cell1 = pbcgto.M(atom='Ne 0 0 0', unit='A',
+                         a='''0.    2.215 2.215
+                              2.215 0.    2.215
+                              2.215 2.215 0.   ''',
+                         basis='gth-szv', pseudo='gth-pade', mesh=[9]*3,
+                         verbose=0)
+        kpts = cell1.make_kpts([2,2,2])
+        mf = khf_ksymm.KsymAdaptedKRHF(cell1, kpts)
+        dm = mf.get_init_guess(key='minao')
+        self.assertEqual(len(dm), len(mf.kpts_ibz))
+        dm0 = khf.KRHF(cell1, kpts).get_init_guess(key='minao')
+        self.assertAlmostEqual(abs(mf.kpts_symm.transform_dm(dm) - dm0).max(), 0, 9)
+
+    def test_krhf(self):
+        kpts = cell.make_kpts([2,2,2])
+        mf0 = khf.KRHF(cell, kpts)
+        e0 = mf0.kernel()
+        mf = khf_ksymm.KsymAdaptedKRHF(cell, kpts)
+        e1 = mf.kernel()
+        self.assertEqual(len(mf.mo_coeff), 3)
+        self.assertAlmostEqual(e1, e0, 8)
+        self.assertAlmostEqual(mf.get_fermi(), mf0.get_fermi(), 7)
+
+        mf1 = mf.to_khf()
+        dm = mf1.make_rdm1()
+        self.assertAlmostEqual(mf1.energy_tot(dm), e0, 8)
+
+
+if __name__ == '__main__':
+    print("Full Tests for KRHF with k-point symmetry")
+    unittest.main()
@@ -1,3 +1,4 @@
+import os
 import warnings
 import copy
 import numpy as np
@@ -12,12 +13,182 @@ try:
     ifftn_wrapper = pyfftw.interfaces.numpy_fft.ifftn
     nproc = lib.num_threads()
 except ImportError:
+    pyfftw = None
     def fftn_wrapper(a, s=None, axes=None, norm=None, **kwargs):
         return np.fft.fftn(a, s, axes)
     def ifftn_wrapper(a, s=None, axes=None, norm=None, **kwargs):
         return np.fft.ifftn(a, s, axes)
     nproc = 1
 
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
+# The FFT library used by FFTEngine, 'pyfftw', 'scipy' or 'numpy'.  By
+# default, it is the first one available in this list.
+if pyfftw is not None:
+    FFT_ENGINE = 'pyfftw'
+elif scipy_fft is not None:
+    FFT_ENGINE = 'scipy'
+else:
+    FFT_ENGINE = 'numpy'
+FFT_ENGINE = os.environ.get('PYSCF_FFT_ENGINE', FFT_ENGINE)
+
+
+class FFTEngine(object):
+    '''Batched 3D FFTs of the functions on the same mesh.
+
+    The functions are the rows of a 2D array (or a 1D array for one
+    function), in the index order of :func:`cartesian_prod`.  All functions
+    are transformed in one library call.  The FFT plans are reused through
+    the pyfftw plan cache or the scipy/numpy internal cache.  For real
+    functions, eg the densities at gamma point, rfft/irfft only compute half
+    of the reciprocal space.
+
+    Attributes:
+        mesh : (3,) ndarray of ints (= nx,ny,nz)
+            The number G-vectors along each direction.
+        engine : str
+            'pyfftw', 'scipy' or 'numpy'.  Default is FFT_ENGINE
+        nthreads : int
+            Number of threads for pyfftw and scipy.
+    '''
+    def __init__(self, mesh, engine=None, nthreads=None):
+        self.mesh = tuple([int(n) for n in mesh])
+        if engine is None:
+            engine = FFT_ENGINE
+        engine = engine.lower()
+        if ((engine == 'pyfftw' and pyfftw is None) or
+            (engine == 'scipy' and scipy_fft is None)):
+            raise RuntimeError('FFT library %s not found' % engine)
+        elif engine not in ('pyfftw', 'scipy', 'numpy'):
+            raise ValueError('Unknown FFT engine %s' % engine)
+        self.engine = engine
+        if nthreads is None:
+            nthreads = lib.num_threads()
+        self.nthreads = nthreads
+
+    @property
+    def ngrids(self):
+        return int(np.prod(self.mesh))
+
+    @property
+    def nhalf(self):
+        '''Size of the half reciprocal space of the real-to-complex FFT'''
+        nx, ny, nz = self.mesh
+        return nx * ny * (nz//2+1)
+
+    def _call(self, fname, a, s=None, overwrite_input=False):
+        axes = (1,2,3)
+        if self.engine == 'pyfftw':
+            fn = getattr(pyfftw.interfaces.numpy_fft, fname)
+            return fn(a, s, axes, overwrite_input=overwrite_input,
+                      threads=self.nthreads)
+        elif self.engine == 'scipy':
+            fn = getattr(scipy_fft, fname)
+            return fn(a, s, axes, overwrite_x=overwrite_input,
+                      workers=self.nthreads)
+        else:
+            fn = getattr(np.fft, fname)
+            return fn(a, s, axes)
+
+    def _input(self, f, n):
+        f = np.asarray(f)
+        f3d = f.reshape(-1, *self.mesh[:2]+(n,))
+        assert(f3d.shape[0] == 1 or f[0].size == f3d[0].size)
+        return f, f3d
+
+    def _output(self, v, ndim, out):
+        if ndim == 1:
+            v = v.ravel()
+        else:
+            v = v.reshape(v.shape[0], -1)
+        if out is None:
+            return v
+        else:
+            out = np.ndarray(v.shape, dtype=out.dtype, buffer=out)
+            out[:] = v
+            return out
+
+    def fft(self, f, out=None, overwrite_input=False):
+        '''3D FFT from real (R) to reciprocal (G) space, see :func:`fft`'''
+        f, f3d = self._input(f, self.mesh[2])
+        if f.size == 0:
+            return np.zeros_like(f)
+        g3d = self._call('fftn', f3d, overwrite_input=overwrite_input)
+        return self._output(g3d, f.ndim, out)
+
+    def ifft(self, g, out=None, overwrite_input=False):
+        '''3D inverse FFT from reciprocal (G) to real (R) space, see
+        :func:`ifft`'''
+        g, g3d = self._input(g, self.mesh[2])
+        if g.size == 0:
+            return np.zeros_like(g)
+        f3d = self._call('ifftn', g3d, overwrite_input=overwrite_input)
+        return self._output(f3d, g.ndim, out)
+
+    def rfft(self, f, out=None):
+        '''Real-to-complex FFT of real functions.  The output is the half
+        reciprocal space (nx,ny,nz//2+1) of each function, flattened to 1D.'''
+        f, f3d = self._input(f, self.mesh[2])
+        if f.size == 0:
+            return np.zeros_like(f, dtype=np.complex128)
+        g3d = self._call('rfftn', f3d)
+        return self._output(g3d, f.ndim, out)
+
+    def irfft(self, g, out=None):
+        '''The inverse of :func:`rfft`.  The input is the half reciprocal
+        space (nx,ny,nz//2+1) of each function.'''
+        g, g3d = self._input(g, self.mesh[2]//2+1)
+        if g.size == 0:
+            return np.zeros(g.shape[:-1]+(self.ngrids,))
+        f3d = self._call('irfftn', g3d, s=self.mesh)
+        return self._output(f3d, g.ndim, out)
+
+    def half(self, fG):
+        '''The elements of the reciprocal-space function fG in the half
+        reciprocal space of :func:`rfft`'''
+        nz = self.mesh[2]
+        fG = np.asarray(fG)
+        fh = fG.reshape(-1, *self.mesh)[:,:,:,:nz//2+1]
+        if fG.ndim == 1:
+            return fh.ravel()
+        else:
+            return fh.reshape(-1, self.nhalf)
+
+    def is_symmetric(self, fG):
+        '''Whether fG(-G) == fG(G) for the real reciprocal-space function fG'''
+        fG = np.asarray(fG)
+        if fG.dtype == np.complex128:
+            if abs(fG.imag).max() > 0:
+                return False
+            fG = fG.real
+        f3d = fG.reshape(self.mesh)
+        f3d_inv = f3d[::-1,::-1,::-1]
+        for axis in range(3):
+            f3d_inv = np.roll(f3d_inv, 1, axis)
+        return np.allclose(f3d, f3d_inv, rtol=1e-12, atol=0)
+
+    def convolve(self, f, coulG, out=None):
+        '''ifft(coulG * fft(f)) for each function in f, e.g. the potential
+        of a density.  If f is real and coulG is real and symmetric, the
+        real-to-complex FFTs are used and the result is real.  Otherwise the
+        result is complex, and a real buffer out is not used.
+        '''
+        f = np.asarray(f)
+        if f.dtype == np.double and self.is_symmetric(coulG):
+            gh = self.rfft(f)
+            gh *= self.half(coulG)
+            return self.irfft(gh, out)
+        else:
+            if out is not None and out.dtype != np.complex128:
+                out = None
+            g = self.fft(f)
+            g *= coulG
+            return self.ifft(g, out, overwrite_input=True)
+
+
 def fft(f, mesh):
     '''Perform the 3D FFT from real (R) to reciprocal (G) space.
 
@@ -39,16 +210,7 @@ def fft(f, mesh):
             numpy.fft).
 
     '''
-    if f.size == 0:
-        return np.zeros_like(f)
-
-    f3d = f.reshape(-1, *mesh)
-    assert(f3d.shape[0] == 1 or f[0].size == f3d[0].size)
-    g3d = fftn_wrapper(f3d, axes=(1,2,3), threads=nproc)
-    if f.ndim == 1:
-        return g3d.ravel()
-    else:
-        return g3d.reshape(f.shape[0], -1)
+    return FFTEngine(mesh).fft(f)
 
 def ifft(g, mesh):
     '''Perform the 3D inverse FFT from reciprocal (G) space to real (R) space.
@@ -69,16 +231,7 @@ def ifft(g, mesh):
             of numpy.fft).
 
     '''
-    if g.size == 0:
-        return np.zeros_like(g)
-
-    g3d = g.reshape(-1, *mesh)
-    assert(g3d.shape[0] == 1 or g[0].size == g3d[0].size)
-    f3d = ifftn_wrapper(g3d, axes=(1,2,3), threads=nproc)
-    if g.ndim == 1:
-        return f3d.ravel()
-    else:
-        return f3d.reshape(g.shape[0], -1)
+    return FFTEngine(mesh).ifft(g)
 
 
 def fftk(f, mesh, expmikr):
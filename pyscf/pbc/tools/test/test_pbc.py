@@ -68,6 +68,34 @@ class KnownValues(unittest.TestCase):
     #    self.assertAlmostEqual(lib.finger(coulG), -4.7118365257800496, 9)
 
 
+    def test_fft_engine(self):
+        cell = pbcgto.Cell()
+        cell.a = numpy.eye(3) * 3
+        cell.atom = 'He 0 0 0'
+        cell.mesh = [8,7,6]
+        cell.build()
+        numpy.random.seed(2)
+        ngrids = numpy.prod(cell.mesh)
+        f = numpy.random.random((3,ngrids))
+        coulG = tools.get_coulG(cell)
+        engine = tools.FFTEngine(cell.mesh)
+        self.assertTrue(engine.is_symmetric(coulG))
+        ref = tools.ifft(tools.fft(f, cell.mesh) * coulG, cell.mesh)
+        v = engine.convolve(f, coulG)
+        self.assertTrue(v.dtype == numpy.double)
+        self.assertAlmostEqual(abs(v - ref).max(), 0, 12)
+        self.assertAlmostEqual(abs(engine.irfft(engine.rfft(f[0])) - f[0]).max(), 0, 12)
+
+        coulG = tools.get_coulG(cell, k=numpy.array([.1,.2,.3]))
+        self.assertFalse(engine.is_symmetric(coulG))
+        ref = tools.ifft(tools.fft(f, cell.mesh) * coulG, cell.mesh)
+        v = engine.convolve(f, coulG)
+        self.assertAlmostEqual(abs(v - ref).max(), 0, 12)
+        # the complex result is not cast to the real buffer
+        v = engine.convolve(f, coulG, out=f.copy())
+        self.assertTrue(v.dtype == numpy.complex128)
+        self.assertAlmostEqual(abs(v - ref).max(), 0, 12)
+
     def test_get_lattice_Ls(self):
         numpy.random.seed(2)
         cl1 = pbcgto.M(a = numpy.random.random((3,3))*3,
@@ -21,6 +21,8 @@ class VHFOpt(object):
         self._intor = intor
         self._cintopt = pyscf.lib.c_null_ptr()
         self._dmcondname = dmcondname
+        self._prescreen = prescreen
+        self._qcondname = qcondname
         self.init_cvhf_direct(mol, intor, prescreen, qcondname)
 
     def init_cvhf_direct(self, mol, intor, prescreen, qcondname):
@@ -47,6 +49,31 @@ class VHFOpt(object):
                       c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
                       c_env.ctypes.data_as(ctypes.c_void_p))
 
+    def reset_geometry(self, mol):
+        '''Update the integral screening conditions for a molecule which has
+        the same atoms and shells (in the same order) as the molecule the
+        optimizer was created for, e.g. a displaced geometry in a PES scan.
+        The C optimizer object is reused.  The libcint optimizer holds the
+        geometry dependent pair data, so it is rebuilt for the new molecule.
+        '''
+        c_atm = numpy.asarray(mol._atm, dtype=numpy.int32, order='C')
+        c_bas = numpy.asarray(mol._bas, dtype=numpy.int32, order='C')
+        c_env = numpy.asarray(mol._env, dtype=numpy.double, order='C')
+        natm = ctypes.c_int(c_atm.shape[0])
+        nbas = ctypes.c_int(c_bas.shape[0])
+        self._cintopt = make_cintopt(c_atm, c_bas, c_env, self._intor)
+
+        if self._prescreen != 'CVHFnoscreen':
+            ao_loc = make_loc(c_bas, self._intor)
+            fsetqcond = getattr(libcvhf, self._qcondname)
+            fsetqcond(self._this,
+                      getattr(libcvhf, self._intor), self._cintopt,
+                      ao_loc.ctypes.data_as(ctypes.c_void_p),
+                      c_atm.ctypes.data_as(ctypes.c_void_p), natm,
+                      c_bas.ctypes.data_as(ctypes.c_void_p), nbas,
+                      c_env.ctypes.data_as(ctypes.c_void_p))
+        return self
+
     @property
     def direct_scf_tol(self):
         return self._this.contents.direct_scf_cutoff
@@ -67,6 +67,10 @@ class EDIIS(lib.diis.DIIS):
     '''SCF-EDIIS
     Ref: JCP 116, 8255
     '''
+    def __init__(self, mf=None, filename=None):
+        lib.diis.DIIS.__init__(self, mf, filename)
+        self._buffer = {}
+
     def update(self, s, d, f, mf, h1e, vhf):
         if self._head >= self.space:
             self._head = 0
@@ -127,6 +131,10 @@ class ADIIS(lib.diis.DIIS):
     '''
     Ref: JCP, 132, 054109
     '''
+    def __init__(self, mf=None, filename=None):
+        lib.diis.DIIS.__init__(self, mf, filename)
+        self._buffer = {}
+
     def update(self, s, d, f, mf, h1e, vhf):
         if self._head >= self.space:
             self._head = 0
@@ -21,6 +21,15 @@ from pyscf.scf import _vhf
 from pyscf.scf import chkfile
 
 
+# Adaptive screening of the incremental Fock builds (SCF.incremental_fock).
+# The screening threshold is INCREMENTAL_TOL_SCALE * max|ddm|, bounded by
+# INCREMENTAL_TOL_MAX and SCF.direct_scf_tol.  The Fock matrix is rebuilt from
+# the full density matrix when the accumulated error estimate is larger than
+# INCREMENTAL_REBUILD_RATIO times the current threshold.
+INCREMENTAL_TOL_MAX = 1e-8
+INCREMENTAL_TOL_SCALE = 1e-6
+INCREMENTAL_REBUILD_RATIO = 10
+
 def kernel(mf, conv_tol=1e-10, conv_tol_grad=None,
            dump_chk=True, dm0=None, callback=None, conv_check=True, **kwargs):
     '''kernel: the SCF driver.
@@ -1008,6 +1017,9 @@ def as_scanner(mf):
         -98.552190448277955
         >>> hf_scanner(gto.M(atom='H 0 0 0; F 0 0 1.5'))
         -98.414750424294368
+        >>> hf_scanner.scan([gto.M(atom='H 0 0 0; F 0 0 %g' % r)
+        ...                  for r in (1.1, 1.5)])
+        [-98.552190448277955, -98.414750424294368]
     '''
     import copy
     logger.info(mf, 'Create scanner for %s', mf.__class__)
@@ -1032,10 +1044,58 @@ def as_scanner(mf):
                     break
 
         def __call__(self, mol, **kwargs):
+            self._reset_mol(mol)
+
+            if self.mo_coeff is None:
+                dm0 = None
+            elif mol.natm > 0:
+                dm0 = self.from_chk(self.chkfile)
+            else:
+                dm0 = self.make_rdm1()
+            e_tot = self.kernel(dm0=dm0, **kwargs)
+            return e_tot
+
+        def scan(self, mols, **kwargs):
+            '''Compute the energies for a series of molecules (e.g. the
+            geometries of a PES scan) in one pass.
+
+            While the SCF of one geometry is iterating, the intermediates of
+            the next geometry which do not depend on the density matrix (the
+            incore 2e integrals, the DF tensor, the DFT grids) are generated
+            in a background thread.  The direct SCF screening optimizer is
+            reused if two geometries have the same atoms and shells.
+
+            Returns:
+                A list of total energies, one for each molecule.
+            '''
+            mols = list(mols)
+            e_tots = []
+            prebuild = None
+            for i, mol in enumerate(mols):
+                self._reset_mol(mol)
+                if self.mo_coeff is None:
+                    dm0 = None
+                elif mol.natm > 0:
+                    dm0 = self.from_chk(self.chkfile)
+                else:
+                    dm0 = self.make_rdm1()
+                if prebuild is not None:
+                    self._load_prebuild(mol, prebuild.get(), dm0)
+
+                if i+1 < len(mols):
+                    prebuild = lib.background_thread(self._prebuild, mols[i+1])
+                e_tots.append(self.kernel(dm0=dm0, **kwargs))
+            return e_tots
+
+        def _reset_mol(self, mol):
             mf_obj = self
             while mf_obj is not None:
+                if (isinstance(mf_obj.opt, _vhf.VHFOpt) and
+                    _same_shells(mf_obj.mol, mol)):
+                    mf_obj.opt.reset_geometry(mol)
+                else:
+                    mf_obj.opt = None
                 mf_obj.mol = mol
-                mf_obj.opt = None
                 mf_obj._eri = None
                 if hasattr(mf_obj, 'with_df') and mf_obj.with_df:
                     mf_obj.with_df.mol = mol
@@ -1050,21 +1110,149 @@ def as_scanner(mf):
                     mf_obj._dm_last = None
                 mf_obj = getattr(mf_obj, '_scf', None)
 
-            if self.mo_coeff is None:
-                dm0 = None
-            elif mol.natm > 0:
-                dm0 = self.from_chk(self.chkfile)
-            else:
-                dm0 = self.make_rdm1()
-            e_tot = self.kernel(dm0=dm0, **kwargs)
-            return e_tot
+        def _prebuild(self, mol):
+            '''Generate the geometry-only intermediates for mol.  It should
+            not modify the scanner which may be running SCF at the same time.
+            '''
+            prebuilds = []
+            eri = None
+            mf_obj = self
+            try:
+                while mf_obj is not None:
+                    data = {}
+                    with_df = getattr(mf_obj, 'with_df', None)
+                    if with_df:
+                        if (hasattr(with_df, '_cderi_to_save') and
+                            not isinstance(with_df._cderi_to_save, str)):
+                            with_df = copy.copy(with_df)
+                            with_df.mol = mol
+                            with_df.auxmol = None
+                            with_df._cderi = None
+                            with_df._cderi_to_save = \
+                                    tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+                            data['with_df'] = with_df.build()
+                    elif _use_incore_eri(mf_obj, mol):
+                        if eri is None:
+                            eri = mol.intor('int2e', aosym='s8')
+                        data['_eri'] = eri
+                    if hasattr(mf_obj, 'grids'):
+                        grids = copy.copy(mf_obj.grids)
+                        grids.mol = mol
+                        data['grids'] = grids.build(with_non0tab=True)
+                    prebuilds.append(data)
+                    mf_obj = getattr(mf_obj, '_scf', None)
+            except Exception as err:
+# Leave the intermediates to be generated in the SCF iterations
+                logger.warn(self, 'Failed to prepare the next geometry: %s', err)
+                prebuilds = []
+            return prebuilds
+
+        def _load_prebuild(self, mol, prebuilds, dm0):
+            mf_obj = self
+            for data in prebuilds:
+                if 'with_df' in data:
+                    mf_obj.with_df = data['with_df']
+                if '_eri' in data:
+                    mf_obj._eri = data['_eri']
+                if 'grids' in data:
+                    grids = data['grids']
+# Filter grids the same way as dft.rks.get_veff does for the initial guess
+                    if (isinstance(dm0, numpy.ndarray) and
+                        getattr(mf_obj, 'small_rho_cutoff', 0) > 1e-20):
+                        from pyscf.dft import rks
+                        if dm0.ndim == 2:
+                            grids = rks.prune_small_rho_grids_(mf_obj, mol, dm0, grids)
+                        elif dm0.ndim == 3 and len(dm0) == 2:
+                            grids = rks.prune_small_rho_grids_(mf_obj, mol,
+                                                               dm0[0]+dm0[1], grids)
+                    mf_obj.grids = grids
+                mf_obj = getattr(mf_obj, '_scf', None)
 
     return SCF_Scanner(mf)
 
+def _use_incore_eri(mf, mol):
+    '''Whether the incore 2e integrals of mol will be used by mf.get_jk'''
+    from pyscf.scf import uhf, ghf
+    if not isinstance(mf, (RHF, uhf.UHF, ghf.GHF)):
+        return False
+    nao = mol.nao_nr()
+# Two copies of the integrals coexist when the next geometry is prepared
+    return (mol.incore_anyway or
+            nao**4/1e6*2+lib.current_memory()[0] < mf.max_memory*.95)
+
+def _same_shells(mol1, mol2):
+    '''Whether two molecules have the same atoms and basis shells (up to the
+    coordinates of atoms)'''
+    return (mol1._atm.shape == mol2._atm.shape and
+            mol1._bas.shape == mol2._bas.shape and
+            mol1._env.size == mol2._env.size and
+            numpy.array_equal(mol1._atm, mol2._atm) and
+            numpy.array_equal(mol1._bas, mol2._bas) and
+            mol1.cart == mol2.cart)
+
 ############
 
 
 
+def _incremental_fock(mf, dm, dm_last=0, vhf_last=0):
+    '''Prepare the incremental Fock build for SCF.incremental_fock.
+
+    The integral screening threshold follows the size of the density matrix
+    change, between INCREMENTAL_TOL_MAX and mf.direct_scf_tol.  The error of
+    every incremental build is estimated by its threshold.  The accumulated
+    error is carried by the attribute fock_err of the potential matrix.  When
+    it is larger than INCREMENTAL_REBUILD_RATIO times the current threshold,
+    the potential is rebuilt from the full density matrix.
+
+    Returns:
+        ddm, vhf_last, tol, err.  ddm and vhf_last are dm and 0 for a full
+        build.  err is the error estimate of the new potential matrix.
+    '''
+    dm = numpy.asarray(dm)
+    err_last = getattr(vhf_last, 'fock_err', None)
+    if err_last is None or dm_last is None or isinstance(dm_last, int):
+        ddm = dm
+        vhf_last = err_last = 0
+    else:
+        ddm = dm - numpy.asarray(dm_last)
+    tol = min(INCREMENTAL_TOL_MAX, INCREMENTAL_TOL_SCALE * abs(ddm).max())
+    tol = max(tol, mf.direct_scf_tol)
+    if err_last > INCREMENTAL_REBUILD_RATIO * tol:
+        logger.debug(mf, 'Rebuild Fock matrix. Error estimate of the '
+                     'incremental builds %g', err_last)
+        ddm = dm
+        vhf_last = err_last = 0
+    return ddm, vhf_last, tol, err_last + tol
+
+def _incremental_jk(mf, mol, ddm, hermi=1, tol=None, with_k=True):
+    '''J and K matrices of the density matrix change ddm.  tol is the
+    screening threshold for direct SCF.  For density fitting, the eigenvalues
+    of ddm which are smaller than tol are dropped in the K build.'''
+    ddm = numpy.asarray(ddm)
+    if tol is not None and getattr(mf, 'with_df', None):
+        if ddm.dtype == numpy.double:
+            nao = ddm.shape[-1]
+            e, c = numpy.linalg.eigh(ddm.reshape(-1,nao,nao))
+            e[abs(e) < tol] = 0
+            ddm = lib.tag_array(ddm, mo_coeff=c.reshape(ddm.shape),
+                                mo_occ=e.reshape(ddm.shape[:-1]))
+
+    opt = None
+    if tol is not None and mf.direct_scf:
+        opt = getattr(mf, 'opt', None)
+    if opt is not None:
+        tol_bak, opt.direct_scf_tol = opt.direct_scf_tol, tol
+    try:
+        if with_k:
+            vj, vk = mf.get_jk(mol, ddm, hermi)
+        else:
+            vj, vk = mf.get_j(mol, ddm, hermi), None
+    finally:
+        if opt is not None:
+            opt.direct_scf_tol = tol_bak
+    return vj, vk
+
+
 class SCF(lib.StreamObject):
     '''SCF base class.   non-relativistic RHF.
 
@@ -1098,6 +1286,12 @@ class SCF(lib.StreamObject):
             Direct SCF is used by default.
         direct_scf_tol : float
             Direct SCF cutoff threshold.  Default is 1e-13.
+        incremental_fock : bool
+            Build the Fock matrix from the change of the density matrix with
+            a screening threshold adapted to the size of the change.  The
+            Fock matrix is periodically rebuilt from the full density matrix
+            to remove the accumulated error.  It also works with density
+            fitting and RKS.  Default is False.
         callback : function(envs_dict) => None
             callback function takes one dict as the argument which is
             generated by the builtin function :func:`locals`, so that the
@@ -1157,6 +1351,7 @@ class SCF(lib.StreamObject):
         self.level_shift = 0
         self.direct_scf = True
         self.direct_scf_tol = 1e-13
+        self.incremental_fock = False
         self.conv_check = True
 ##################################################
 # don't modify the following attributes, they are not input options
@@ -1209,6 +1404,8 @@ class SCF(lib.StreamObject):
         logger.info(self, 'direct_scf = %s', self.direct_scf)
         if self.direct_scf:
             logger.info(self, 'direct_scf_tol = %g', self.direct_scf_tol)
+        if self.incremental_fock:
+            logger.info(self, 'incremental Fock build with adaptive screening')
         if self.chkfile:
             logger.info(self, 'chkfile to save SCF result = %s', self.chkfile)
         logger.info(self, 'max_memory %d MB (current use %d MB)',
@@ -1412,7 +1609,13 @@ class SCF(lib.StreamObject):
 # Be carefule with the effects of :attr:`SCF.direct_scf` on this function
         if mol is None: mol = self.mol
         if dm is None: dm = self.make_rdm1()
-        if self.direct_scf:
+        if self.incremental_fock:
+            ddm, vhf_last, tol, err = _incremental_fock(self, dm, dm_last,
+                                                        vhf_last)
+            vj, vk = _incremental_jk(self, mol, ddm, hermi, tol)
+            vhf = numpy.asarray(vhf_last) + vj - vk * .5
+            return lib.tag_array(vhf, fock_err=err)
+        elif self.direct_scf:
             ddm = numpy.asarray(dm) - numpy.asarray(dm_last)
             vj, vk = self.get_jk(mol, ddm, hermi=hermi)
             return numpy.asarray(vhf_last) + vj - vk * .5
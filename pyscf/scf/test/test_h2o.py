@@ -95,6 +95,24 @@ class KnowValues(unittest.TestCase):
         uhf.max_memory = 0
         self.assertAlmostEqual(uhf.scf(), -75.98394849812, 9)
 
+    def test_nr_incremental_fock(self):
+        rhf = scf.RHF(mol)
+        rhf.conv_tol = 1e-11
+        rhf.max_memory = 0
+        rhf.incremental_fock = True
+        self.assertAlmostEqual(rhf.scf(), -75.98394849812, 9)
+
+        uhf = scf.UHF(mol)
+        uhf.conv_tol = 1e-11
+        uhf.max_memory = 0
+        uhf.incremental_fock = True
+        self.assertAlmostEqual(uhf.scf(), -75.98394849812, 9)
+
+        rhf = scf.density_fit(scf.RHF(mol), 'weigend')
+        rhf.conv_tol = 1e-11
+        rhf.incremental_fock = True
+        self.assertAlmostEqual(rhf.scf(), -75.983210886950, 9)
+
     def test_nr_rhf_no_direct(self):
         rhf = scf.RHF(mol)
         rhf.conv_tol = 1e-11
@@ -301,6 +319,31 @@ class KnowValues(unittest.TestCase):
         mol1.build(0,0)
         self.assertAlmostEqual(mf_scanner(mol1), -76.273052274103648, 8)
 
+    def test_scanner_scan(self):
+        from pyscf import dft
+        mol1 = molsym.copy()
+        mol1.set_geom_('''
+        O   0.   0.       .1
+        H   0.   -0.757   0.587
+        H   0.   0.757    0.587''')
+        mf_scanner = scf.UHF(molsym).density_fit('weigend').as_scanner()
+        e = mf_scanner.scan([molsym, mol1])
+        self.assertAlmostEqual(e[0], -75.98321088694874, 8)
+        self.assertAlmostEqual(e[1], -75.97901175977492, 8)
+
+        mf_scanner = scf.RHF(mol).as_scanner()
+        mf_scanner.direct_scf = True
+        mf_scanner.max_memory = 0  # to enforce direct SCF
+        e = mf_scanner.scan([mol, mol1, mol])
+        self.assertAlmostEqual(e[0], -75.98394849812, 8)
+        self.assertAlmostEqual(e[1], scf.RHF(mol1).kernel(), 8)
+        self.assertAlmostEqual(e[2], -75.98394849812, 8)
+
+        mf_scanner = dft.RKS(molsym).set(xc='bp86').as_scanner()
+        e = mf_scanner.scan([molsym, mol1])
+        self.assertAlmostEqual(e[0], -76.385043416002361, 8)
+        self.assertAlmostEqual(e[1], -76.372784697245777, 8)
+
 
 
 if __name__ == "__main__":
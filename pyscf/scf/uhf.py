@@ -752,6 +752,13 @@ class UHF(hf.SCF):
         if dm is None: dm = self.make_rdm1()
         if isinstance(dm, numpy.ndarray) and dm.ndim == 2:
             dm = numpy.asarray((dm*.5,dm*.5))
+        if self.incremental_fock:
+            ddm, vhf_last, tol, err = hf._incremental_fock(self, dm, dm_last,
+                                                           vhf_last)
+            vj, vk = hf._incremental_jk(self, mol, ddm, hermi, tol)
+            vhf = vj[0] + vj[1] - vk
+            vhf += numpy.asarray(vhf_last)
+            return lib.tag_array(vhf, fock_err=err)
         if (self._eri is not None or not self.direct_scf or
             mol.incore_anyway or self._is_mem_enough()):
             vj, vk = self.get_jk(mol, dm, hermi)
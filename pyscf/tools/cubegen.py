@@ -13,10 +13,16 @@ import numpy
 import time
 import pyscf
 from pyscf import lib
+from pyscf import gto
+from pyscf import df
 from pyscf.dft import numint
 
+# Number of grid points evaluated by one thread.  It needs to be the integer
+# multiplier of numint.BLKSIZE, the block size of the AO screening
+BLKSIZE = numint.BLKSIZE * 64
 
-def density(mol, outfile, dm, nx=80, ny=80, nz=80):
+
+def density(mol, outfile, dm, nx=80, ny=80, nz=80, max_memory=None):
     """Calculates electron density and write out in cube format.
 
     Args:
@@ -37,33 +43,36 @@ def density(mol, outfile, dm, nx=80, ny=80, nz=80):
             Number of grid point divisions in y direction.
         nz : int
             Number of grid point divisions in z direction.
+        max_memory : float
+            Memory (in MB) to hold the slices of the cube before they are
+            written.  Default is mol.max_memory
     """
-
     cc = Cube(mol, nx=nx, ny=ny, nz=nz)
 
-    # Compute density on the .cube grid
-    coords = cc.get_coords()
-    ngrids = cc.get_ngrids()
-    blksize = min(8000, ngrids)
-    rho = numpy.empty(ngrids)
-    for ip0, ip1 in lib.prange(0, ngrids, blksize):
-        ao = numint.eval_ao(mol, coords[ip0:ip1])
-        rho[ip0:ip1] = numint.eval_rho(mol, ao, dm)
-    rho = rho.reshape(cc.nx,cc.ny,cc.nz)
+    def eval_rho(coords):
+        rho = numpy.zeros((1,len(coords)))
+        idx, ao, non0tab = _eval_ao_screened(mol, coords)
+        if ao is not None:
+            rho[0,idx] = numint.eval_rho(mol, ao, dm, non0tab)
+        return rho
 
-    # Write out density to the .cube file
-    cc.write(rho, outfile, comment='Electron density in real space (e/Bohr^3)')
+    # Compute density on the .cube grid and write out the .cube file
+    cc.write_stream(eval_rho, [outfile],
+                    ['Electron density in real space (e/Bohr^3)'], max_memory)
 
-def orbital(mol, outfile, coeff, nx=80, ny=80, nz=80):
+def orbital(mol, outfile, coeff, nx=80, ny=80, nz=80, max_memory=None):
     """Calculate orbital value on real space grid and write out in cube format.
 
     Args:
         mol : Mole
             Molecule to calculate the electron density for.
-        outfile : str
-            Name of Cube file to be written.
-        coeff : 1D array
-            coeff coefficient.
+        outfile : str or list of str
+            Name of Cube file to be written.  If coeff is a 2D array, outfile
+            is a list of file names, one for each orbital, or a string
+            template like 'mo_%d.cube' to be formatted with the orbital index.
+        coeff : 1D or 2D array
+            coeff coefficient.  For 2D array, each column is an orbital.  All
+            orbitals are evaluated in one pass of AO evaluation.
 
     Kwargs:
         nx : int
@@ -75,24 +84,34 @@ def orbital(mol, outfile, coeff, nx=80, ny=80, nz=80):
             Number of grid point divisions in y direction.
         nz : int
             Number of grid point divisions in z direction.
+        max_memory : float
+            Memory (in MB) to hold the slices of the cube before they are
+            written.  Default is mol.max_memory
     """
     cc = Cube(mol, nx=nx, ny=ny, nz=nz)
 
-    # Compute density on the .cube grid
-    coords = cc.get_coords()
-    ngrids = cc.get_ngrids()
-    blksize = min(8000, ngrids)
-    orb_on_grid = numpy.empty(ngrids)
-    for ip0, ip1 in lib.prange(0, ngrids, blksize):
-        ao = numint.eval_ao(mol, coords[ip0:ip1])
-        orb_on_grid[ip0:ip1] = numpy.dot(ao, coeff)
-    orb_on_grid = orb_on_grid.reshape(cc.nx,cc.ny,cc.nz)
+    coeff = numpy.asarray(coeff)
+    if coeff.ndim == 1:
+        coeff = coeff.reshape(-1,1)
+        outfile = [outfile]
+    elif isinstance(outfile, str):
+        outfile = [outfile % i for i in range(coeff.shape[1])]
+    assert(len(outfile) == coeff.shape[1])
 
-    # Write out orbital to the .cube file
-    cc.write(orb_on_grid, outfile, comment='Orbital value in real space (1/Bohr^3)')
+    def eval_orb(coords):
+        orb = numpy.zeros((coeff.shape[1],len(coords)))
+        idx, ao, non0tab = _eval_ao_screened(mol, coords)
+        if ao is not None:
+            orb[:,idx] = numpy.dot(ao, coeff).T
+        return orb
 
+    # Compute orbitals on the .cube grid and write out the .cube files
+    cc.write_stream(eval_orb, outfile,
+                    ['Orbital value in real space (1/Bohr^3)']*len(outfile),
+                    max_memory)
 
-def mep(mol, outfile, dm, nx=80, ny=80, nz=80):
+
+def mep(mol, outfile, dm, nx=80, ny=80, nz=80, max_memory=None):
     """Calculates the molecular electrostatic potential (MEP) and write out in
     cube format.
 
@@ -114,32 +133,91 @@ def mep(mol, outfile, dm, nx=80, ny=80, nz=80):
             Number of grid point divisions in y direction.
         nz : int
             Number of grid point divisions in z direction.
+        max_memory : float
+            Memory (in MB) to hold the slices of the cube before they are
+            written.  Default is mol.max_memory
     """
     cc = Cube(mol, nx=nx, ny=ny, nz=nz)
 
-    coords = cc.get_coords()
-
-    # Nuclear potential at given points
-    Vnuc = 0
-    for i in range(mol.natm):
-        r = mol.atom_coord(i)
-        Z = mol.atom_charge(i)
-        rp = r - coords
-        Vnuc += Z / numpy.einsum('xi,xi->x', rp, rp)**.5
-
-    # Potential of electron density
-    Vele = []
-    for p in coords:
-        mol.set_rinv_orig_(p)
-        Vele.append(numpy.einsum('ij,ij', mol.intor('int1e_rinv'), dm))
-
-    MEP = Vnuc - Vele     # MEP at each point
-
-    MEP = numpy.asarray(MEP)
-    MEP = MEP.reshape(nx,ny,nz)
+    atom_coords = mol.atom_coords()
+    atom_charges = mol.atom_charges()
+    nao = mol.nao_nr()
+    dm = dm + dm.T
+    dm[numpy.diag_indices(nao)] *= .5
+    tril_dm = lib.pack_tril(dm)
+    # The integrals (ij|r) of all threads are limited to ~ mol.max_memory/2
+    blksize = mol.max_memory*.5e6/8/(nao*(nao+1)//2)/lib.num_threads()
+    blksize = int(min(BLKSIZE, max(16, blksize)))
+
+    def eval_mep(coords):
+        # Nuclear potential at given points
+        rp = coords.reshape(-1,1,3) - atom_coords
+        Vnuc = numpy.einsum('z,pz->p', atom_charges, 1./lib.norm(rp,axis=2))
+
+        # Potential of electron density
+        Vele = numpy.empty(len(coords))
+        for p0, p1 in lib.prange(0, len(coords), blksize):
+            fakemol = _make_fakemol(coords[p0:p1])
+            v_nj = df.incore.aux_e2(mol, fakemol, intor='int3c2e', aosym='s2ij')
+            Vele[p0:p1] = numpy.dot(tril_dm, v_nj)
+
+        return (Vnuc - Vele).reshape(1,-1)   # MEP at each point
 
     # Write the potential
-    cc.write(MEP, outfile, 'Molecular electrostatic potential in real space')
+    cc.write_stream(eval_mep, [outfile],
+                    ['Molecular electrostatic potential in real space'],
+                    max_memory)
+
+def _eval_ao_screened(mol, coords):
+    '''AO values on the blocks of grid points (numint.BLKSIZE points in each
+    block) which are not far from all atoms.
+
+    Returns:
+        idx : the indices of the grid points which are evaluated
+        ao : AO values on coords[idx].  None if all blocks are screened out.
+        non0tab : the mask of the nonzero shells on the evaluated blocks
+    '''
+    ngrids = len(coords)
+    non0tab = numint.make_mask(mol, coords)
+    blk_idx = numpy.where(non0tab.any(axis=1))[0]
+    if len(blk_idx) == non0tab.shape[0]:
+        return numpy.arange(ngrids), numint.eval_ao(mol, coords, non0tab=non0tab), non0tab
+    elif len(blk_idx) == 0:
+        return None, None, None
+
+    idx = blk_idx.reshape(-1,1) * numint.BLKSIZE + numpy.arange(numint.BLKSIZE)
+    idx = idx.ravel()
+    idx = idx[idx < ngrids]
+    non0tab = non0tab[blk_idx]
+    ao = numint.eval_ao(mol, numpy.asarray(coords[idx], order='C'),
+                        non0tab=non0tab)
+    return idx, ao, non0tab
+
+def _make_fakemol(coords):
+    '''Point charges as steep s-type functions'''
+    nbas = coords.shape[0]
+    fakeatm = numpy.zeros((nbas,gto.ATM_SLOTS), dtype=numpy.int32)
+    fakebas = numpy.zeros((nbas,gto.BAS_SLOTS), dtype=numpy.int32)
+    fakeenv = [0] * gto.PTR_ENV_START
+    ptr = gto.PTR_ENV_START
+    fakeatm[:,gto.PTR_COORD] = numpy.arange(ptr, ptr+nbas*3, 3)
+    fakeenv.append(coords.ravel())
+    ptr += nbas*3
+    fakebas[:,gto.ATOM_OF] = numpy.arange(nbas)
+    fakebas[:,gto.NPRIM_OF] = 1
+    fakebas[:,gto.NCTR_OF] = 1
+# approximate point charge with gaussian distribution exp(-1e16*r^2)
+    fakebas[:,gto.PTR_EXP] = ptr
+    fakebas[:,gto.PTR_COEFF] = ptr+1
+    expnt = 1e16
+    fakeenv.append([expnt, 1/(2*numpy.sqrt(numpy.pi)*gto.gaussian_int(2,expnt))])
+    ptr += 2
+    fakemol = gto.Mole()
+    fakemol._atm = fakeatm
+    fakemol._bas = fakebas
+    fakemol._env = numpy.hstack(fakeenv)
+    fakemol._built = True
+    return fakemol
 
 
 class Cube():
@@ -156,11 +234,12 @@ class Cube():
         self.ys = numpy.arange(ny) * (self.box[1]/ny)
         self.zs = numpy.arange(nz) * (self.box[2]/nz)
 
-    def get_coords(self) :
+    def get_coords(self, x0=0, x1=None):
         """  Result: set of coordinates to compute a field which is to be stored
-        in the file.
+        in the file.  If x0, x1 are given, only the coordinates of the planes
+        xs[x0:x1] are generated.
         """
-        coords = lib.cartesian_prod([self.xs,self.ys,self.zs])
+        coords = lib.cartesian_prod([self.xs[x0:x1],self.ys,self.zs])
         coords = numpy.asarray(coords, order='C') - (-self.boxorig)
         return coords
 
@@ -174,29 +253,94 @@ class Cube():
         """  Result: .cube file with the field in the file fname.  """
         assert(field.ndim == 3)
         assert(field.shape == (self.nx, self.ny, self.nz))
+        with open(fname, 'w') as f:
+            self.write_head(f, comment)
+            self.write_field(f, field)
+
+    def write_head(self, f, comment=None):
+        """  Write the header of the .cube file to the opened file f.  """
         if comment is None:
             comment = 'Generic field? Supply the optional argument "comment" to define this line'
 
         mol = self.mol
         coord = mol.atom_coords()
-        with open(fname, 'w') as f:
-            f.write(comment+'\n')
-            f.write('PySCF Version: %s  Date: %s\n' % (pyscf.__version__, time.ctime()))
-            f.write('%5d' % mol.natm)
-            f.write('%12.6f%12.6f%12.6f\n' % tuple(self.boxorig.tolist()))
-            f.write('%5d%12.6f%12.6f%12.6f\n' % (self.nx, self.xs[1], 0, 0))
-            f.write('%5d%12.6f%12.6f%12.6f\n' % (self.ny, 0, self.ys[1], 0))
-            f.write('%5d%12.6f%12.6f%12.6f\n' % (self.nz, 0, 0, self.zs[1]))
-            for ia in range(mol.natm):
-                chg = mol.atom_charge(ia)
-                f.write('%5d%12.6f'% (chg, chg))
-                f.write('%12.6f%12.6f%12.6f\n' % tuple(coord[ia]))
-
-            for ix in range(self.nx):
-                for iy in range(self.ny):
-                    for iz0, iz1 in lib.prange(0, self.nz, 6):
-                        fmt = '%13.5E' * (iz1-iz0) + '\n'
-                        f.write(fmt % tuple(field[ix,iy,iz0:iz1].tolist()))
+        f.write(comment+'\n')
+        f.write('PySCF Version: %s  Date: %s\n' % (pyscf.__version__, time.ctime()))
+        f.write('%5d' % mol.natm)
+        f.write('%12.6f%12.6f%12.6f\n' % tuple(self.boxorig.tolist()))
+        f.write('%5d%12.6f%12.6f%12.6f\n' % (self.nx, self.xs[1], 0, 0))
+        f.write('%5d%12.6f%12.6f%12.6f\n' % (self.ny, 0, self.ys[1], 0))
+        f.write('%5d%12.6f%12.6f%12.6f\n' % (self.nz, 0, 0, self.zs[1]))
+        for ia in range(mol.natm):
+            chg = mol.atom_charge(ia)
+            f.write('%5d%12.6f'% (chg, chg))
+            f.write('%12.6f%12.6f%12.6f\n' % tuple(coord[ia]))
+
+    def write_field(self, f, field):
+        """  Write the planes field[:,:ny,:nz] of the field to the opened file
+        f.  The planes need to be written in the order of x.
+        """
+        field = field.reshape(-1,self.ny,self.nz)
+        nz = self.nz
+        # All lines of one (x,y) column have the same format
+        fmt = ''.join(['%13.5E' * (iz1-iz0) + '\n'
+                       for iz0, iz1 in lib.prange(0, nz, 6)])
+        fmt = fmt * self.ny
+        for ix in range(field.shape[0]):
+            f.write(fmt % tuple(field[ix].ravel().tolist()))
+
+    def write_stream(self, eval_fn, fnames, comments=None, max_memory=None):
+        """  Evaluate the fields slice by slice and write them to the files
+        fnames.  Only a few slices of the cube are held in memory.
+
+        Args:
+            eval_fn : function
+                eval_fn(coords) returns an array of shape (nfield, len(coords))
+                for the fields on the given coordinates.  It is called on
+                blocks of BLKSIZE grid points in a pool of threads.
+            fnames : list of str
+                One file for each field.
+        """
+        if comments is None:
+            comments = [None] * len(fnames)
+        if max_memory is None:
+            max_memory = self.mol.max_memory
+        nfield = len(fnames)
+        plane_size = self.ny * self.nz
+        # two slices may be held in memory, the one being written and the one
+        # being evaluated
+        nplanes = int(max_memory*1e6/8/(plane_size*nfield*2))
+        nplanes = max(1, min(self.nx, nplanes))
+
+        files = [open(fname, 'w') for fname in fnames]
+        try:
+            for f, comment in zip(files, comments):
+                self.write_head(f, comment)
+
+            # Exceptions of the background thread are raised in this thread
+            errors = []
+            def write_slice(fields):
+                try:
+                    for f, field in zip(files, fields):
+                        self.write_field(f, field)
+                except Exception as e:
+                    errors.append(e)
+
+            with lib.call_in_background(write_slice) as async_write:
+                for x0, x1 in lib.prange(0, self.nx, nplanes):
+                    if errors:
+                        break
+                    coords = self.get_coords(x0, x1)
+                    blocks = lib.prange(0, len(coords), BLKSIZE)
+                    fields = lib.map_with_threads(lambda blk:
+                                                  eval_fn(coords[blk[0]:blk[1]]),
+                                                  blocks)
+                    async_write(numpy.hstack(fields))
+            if errors:
+                raise errors[0]
+        finally:
+            for f in files:
+                f.close()
 
 if __name__ == '__main__':
     from pyscf import gto, scf
@@ -208,4 +352,5 @@ if __name__ == '__main__':
     cubegen.density(mol, 'h2o_den.cube', mf.make_rdm1()) #makes total density
     cubegen.mep(mol, 'h2o_pot.cube', mf.make_rdm1())
     cubegen.orbital(mol, 'h2o_mo1.cube', mf.mo_coeff[:,0])
+    cubegen.orbital(mol, 'h2o_mo%d.cube', mf.mo_coeff[:,:5]) # the first 5 orbitals
 
@@ -4,6 +4,8 @@ from functools import reduce
 import numpy
 
 DEFAULT_FLOAT_FORMAT = ' %.16g'
+# Number of integrals to format (write_eri) or parse (read) in one batch
+BLOCK_SIZE = int(1e6)
 
 def write_head(fout, nmo, nelec, ms=0, orbsym=None):
     if not isinstance(nelec, (int, numpy.number)):
@@ -21,42 +23,58 @@ def write_head(fout, nmo, nelec, ms=0, orbsym=None):
 def write_eri(fout, eri, nmo, tol=1e-15, float_format=DEFAULT_FLOAT_FORMAT):
     npair = nmo*(nmo+1)//2
     output_format = float_format + ' %4d %4d %4d %4d\n'
+    idx, jdx = numpy.tril_indices(nmo)
     if eri.ndim == 2: # 4-fold symmetry
         assert(eri.size == npair**2)
-        ij = 0
-        for i in range(nmo):
-            for j in range(0, i+1):
-                kl = 0
-                for k in range(0, nmo):
-                    for l in range(0, k+1):
-                        if abs(eri[ij,kl]) > tol:
-                            fout.write(output_format % (eri[ij,kl], i+1, j+1, k+1, l+1))
-                        kl += 1
-                ij += 1
+        eri = eri.reshape(npair,npair)
+        blksize = max(1, BLOCK_SIZE // npair)
+        for ij0 in range(0, npair, blksize):
+            ij1 = min(npair, ij0+blksize)
+            ij, kl = numpy.nonzero(abs(eri[ij0:ij1]) > tol)
+            ij += ij0
+            _write_rows(fout, output_format, eri[ij,kl],
+                        idx[ij], jdx[ij], idx[kl], jdx[kl])
     else:  # 8-fold symmetry
         assert(eri.size == npair*(npair+1)//2)
-        ij = 0
-        ijkl = 0
-        for i in range(nmo):
-            for j in range(0, i+1):
-                kl = 0
-                for k in range(0, i+1):
-                    for l in range(0, k+1):
-                        if ij >= kl:
-                            if abs(eri[ijkl]) > tol:
-                                fout.write(output_format % (eri[ijkl], i+1, j+1, k+1, l+1))
-                            ijkl += 1
-                        kl += 1
-                ij += 1
+        eri = eri.ravel()
+        ij0 = 0
+        while ij0 < npair:
+            # rows ij0:ij1 of the packed lower triangle, ~BLOCK_SIZE elements
+            ij1 = int(numpy.sqrt(ij0*(ij0+1) + 2*BLOCK_SIZE)) + 1
+            ij1 = min(npair, max(ij0+1, ij1))
+            p0 = ij0*(ij0+1)//2
+            seg = eri[p0:ij1*(ij1+1)//2]
+            ijkl = numpy.nonzero(abs(seg) > tol)[0]
+            ij = _tril_row(ijkl + p0)
+            kl = ijkl + p0 - ij*(ij+1)//2
+            _write_rows(fout, output_format, seg[ijkl],
+                        idx[ij], jdx[ij], idx[kl], jdx[kl])
+            ij0 = ij1
 
 def write_hcore(fout, h, nmo, tol=1e-15, float_format=DEFAULT_FLOAT_FORMAT):
     h = h.reshape(nmo,nmo)
     output_format = float_format + ' %4d %4d  0  0\n'
-    for i in range(nmo):
-        for j in range(0, i+1):
-            if abs(h[i,j]) > tol:
-                fout.write(output_format % (h[i,j], i+1, j+1))
-
+    idx, jdx = numpy.tril_indices(nmo)
+    val = h[idx,jdx]
+    mask = abs(val) > tol
+    _write_rows(fout, output_format, val[mask], idx[mask], jdx[mask])
+
+def _tril_row(ijkl):
+    '''Row index ij of the element ijkl in a packed lower triangle'''
+    ij = ((numpy.sqrt(8*ijkl.astype(numpy.double)+1) - 1) * .5).astype(int)
+    # correct the round-off error of sqrt
+    ij[ij*(ij+1)//2 > ijkl] -= 1
+    ij[(ij+1)*(ij+2)//2 <= ijkl] += 1
+    return ij
+
+def _write_rows(fout, output_format, val, *orb_idx):
+    '''Format the integrals and the 0-based orbital indices in bulk'''
+    n = len(val)
+    if n == 0:
+        return
+    rows = [val.tolist()] + [(x+1).tolist() for x in orb_idx]
+    rows = [x for row in zip(*rows) for x in row]
+    fout.write((output_format * n) % tuple(rows))
 
 def from_chkfile(output, chkfile, tol=1e-15, float_format=DEFAULT_FLOAT_FORMAT):
     '''Read SCF results from PySCF chkfile and transform 1-electron,
@@ -94,11 +112,39 @@ def from_integrals(output, h1e, h2e, nmo, nelec, nuc=0, ms=0, orbsym=[],
         output_format = float_format + '  0  0  0  0\n'
         fout.write(output_format % nuc)
 
+def from_integrals_h5(output, h1e, h2e, nmo, nelec, nuc=0, ms=0, orbsym=[]):
+    '''Save the given 1-electron and 2-electron integrals in the HDF5 variant
+    of FCIDUMP.  The 2-electron integrals are stored in the 8-fold packed
+    lower triangular form.  The file can be parsed by :func:`read`.
+    '''
+    import h5py
+    from pyscf import ao2mo
+    if not isinstance(nelec, (int, numpy.number)):
+        ms = abs(nelec[0] - nelec[1])
+        nelec = nelec[0] + nelec[1]
+    if orbsym is None or len(orbsym) == 0:
+        orbsym = [1] * nmo
+    with h5py.File(output, 'w') as f:
+        f['NORB'] = nmo
+        f['NELEC'] = nelec
+        f['MS2'] = ms
+        f['ISYM'] = 1
+        f['ORBSYM'] = numpy.asarray(orbsym, dtype=int)
+        f['ECORE'] = nuc
+        f['H1'] = numpy.asarray(h1e).reshape(nmo,nmo)
+        f['H2'] = ao2mo.restore(8, h2e, nmo)
+
 def read(filename):
     '''Parse FCIDUMP.  Return a dictionary to hold the integrals and
     parameters with keys:  H1, H2, ECORE, NORB, NELEC, MS, ORBSYM, ISYM
+
+    The HDF5 variant generated by :func:`from_integrals_h5` is also supported.
     '''
     import re
+    import h5py
+    if h5py.is_hdf5(filename):
+        return read_h5(filename)
+
     dic = {}
     print('Parsing %s' % filename)
     finp = open(filename, 'r')
@@ -125,34 +171,61 @@ def read(filename):
     norb_pair = norb * (norb+1) // 2
     h1e = numpy.zeros((norb,norb))
     h2e = numpy.zeros(norb_pair*(norb_pair+1)//2)
-    dat = finp.readline().split()
-    while dat:
-        i, j, k, l = [int(x) for x in dat[1:5]]
-        if k != 0:
-            if i >= j:
-                ij = i * (i-1) // 2 + j-1
-            else:
-                ij = j * (j-1) // 2 + i-1
-            if k >= l:
-                kl = k * (k-1) // 2 + l-1
-            else:
-                kl = l * (l-1) // 2 + k-1
-            if ij >= kl:
-                h2e[ij*(ij+1)//2+kl] = float(dat[0])
-            else:
-                h2e[kl*(kl+1)//2+ij] = float(dat[0])
-        elif k == 0:
-            if j != 0:
-                h1e[i-1,j-1] = float(dat[0])
-            else:
-                dic['ECORE'] = float(dat[0])
-        dat = finp.readline().split()
+    # Parse the integrals chunk by chunk
+    chunk_bytes = BLOCK_SIZE * 40
+    lines = finp.readlines(chunk_bytes)
+    while lines:
+        # Each line is "value i j k l".  Fields after the 5th are ignored
+        dat = []
+        for line in lines:
+            fields = line.split()
+            if len(fields) >= 5:
+                dat.append(fields[:5])
+            elif len(fields) > 0:
+                finp.close()
+                raise ValueError('Invalid integral line in %s: %s' %
+                                 (filename, line.strip()))
+        dat = numpy.array(dat, dtype=float).reshape(-1,5)
+        val = dat[:,0]
+        i, j, k, l = dat[:,1:].T.astype(int)
+
+        mask = k != 0
+        if mask.any():
+            ij = _pair_id(i[mask], j[mask])
+            kl = _pair_id(k[mask], l[mask])
+            ijkl = numpy.where(ij >= kl, ij*(ij+1)//2+kl, kl*(kl+1)//2+ij)
+            h2e[ijkl] = val[mask]
+
+        mask = (k == 0) & (j != 0)
+        h1e[i[mask]-1,j[mask]-1] = val[mask]
+
+        mask = (k == 0) & (j == 0)
+        if mask.any():
+            dic['ECORE'] = val[mask][-1]
+        lines = finp.readlines(chunk_bytes)
 
     dic['H1'] = h1e
     dic['H2'] = h2e
     finp.close()
     return dic
 
+def _pair_id(i, j):
+    '''Compound index of the 1-based orbital pair (i,j)'''
+    return numpy.where(i >= j, i*(i-1)//2+j-1, j*(j-1)//2+i-1)
+
+def read_h5(filename):
+    '''Read the HDF5 variant of FCIDUMP generated by :func:`from_integrals_h5`'''
+    import h5py
+    dic = {}
+    with h5py.File(filename, 'r') as f:
+        for key in ('NORB', 'NELEC', 'MS2', 'ISYM'):
+            dic[key] = int(f[key][()])
+        dic['ORBSYM'] = [int(x) for x in f['ORBSYM'][:]]
+        dic['ECORE'] = float(f['ECORE'][()])
+        dic['H1'] = f['H1'][:]
+        dic['H2'] = f['H2'][:]
+    return dic
+
 if __name__ == '__main__':
     import sys
     # fcidump.py chkfile output
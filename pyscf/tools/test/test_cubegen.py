@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import numpy
+from pyscf import lib
+from pyscf import gto, scf
+from pyscf.tools import cubegen
+
+mol = gto.Mole()
+mol.atom = '''
+O    0.00000000,  0.000000,  0.000000
+H    0.761561, 0.478993, 0.00000000
+H   -0.761561, 0.478993, 0.00000000'''
+mol.basis = '6-31g'
+mol.verbose = 0
+mol.build()
+mf = scf.RHF(mol).run()
+
+def read_field(fname):
+    with open(fname, 'r') as f:
+        lines = f.readlines()
+    natm = int(lines[2].split()[0])
+    return numpy.array(' '.join(lines[6+natm:]).split(), dtype=float)
+
+class KnowValues(unittest.TestCase):
+    def test_orbital_batch(self):
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        cubegen.orbital(mol, ftmp.name, mf.mo_coeff[:,2], nx=10, ny=11, nz=12)
+        ref = read_field(ftmp.name)
+        self.assertEqual(ref.size, 10*11*12)
+
+        fnames = [tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR) for i in range(3)]
+        cubegen.orbital(mol, [f.name for f in fnames], mf.mo_coeff[:,:3],
+                        nx=10, ny=11, nz=12, max_memory=.01)
+        self.assertAlmostEqual(abs(read_field(fnames[2].name) - ref).max(), 0, 9)
+
+    def test_write_stream_error(self):
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        cc = cubegen.Cube(mol, nx=10, ny=11, nz=12)
+        def write_field(f, field):
+            raise IOError('disk full')
+        cc.write_field = write_field
+        eval_fn = lambda coords: numpy.ones((1,len(coords)))
+        self.assertRaises(IOError, cc.write_stream, eval_fn, [ftmp.name],
+                          max_memory=.01)
+
+    def test_density(self):
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        dm = mf.make_rdm1()
+        cc = cubegen.Cube(mol, nx=10, ny=11, nz=12)
+        cubegen.density(mol, ftmp.name, dm, nx=10, ny=11, nz=12, max_memory=.01)
+        ao = mf._numint.eval_ao(mol, cc.get_coords())
+        ref = numpy.einsum('pi,ij,pj->p', ao, dm, ao)
+        self.assertAlmostEqual(abs(read_field(ftmp.name) - ref).max(), 0, 5)
+
+    def test_mep(self):
+        ftmp = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        dm = mf.make_rdm1()
+        cubegen.mep(mol, ftmp.name, dm, nx=4, ny=4, nz=4)
+        coords = cubegen.Cube(mol, nx=4, ny=4, nz=4).get_coords()
+        ref = []
+        for p in coords:
+            mol.set_rinv_orig_(p)
+            vnuc = sum([mol.atom_charge(i)/numpy.linalg.norm(p-mol.atom_coord(i))
+                        for i in range(mol.natm)])
+            ref.append(vnuc - numpy.einsum('ij,ij', mol.intor('int1e_rinv'), dm))
+        mol.set_rinv_orig_((0,0,0))
+        self.assertAlmostEqual(abs(read_field(ftmp.name) - ref).max(), 0, 5)
+
+if __name__ == "__main__":
+    print("Full Tests for cubegen")
+    unittest.main()
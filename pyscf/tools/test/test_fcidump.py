@@ -36,6 +36,36 @@ class KnowValues(unittest.TestCase):
         fcidump.from_integrals(tmpfcidump.name, h1, h2, h1.shape[0],
                                mol.nelectron, tol=1e-15)
 
+    def test_read(self):
+        h1 = reduce(numpy.dot, (mf.mo_coeff.T, mf.get_hcore(), mf.mo_coeff))
+        h2 = ao2mo.full(mf._eri, mf.mo_coeff)
+        norb = h1.shape[0]
+        for writer in (fcidump.from_integrals, fcidump.from_integrals_h5):
+            tmpfcidump = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+            writer(tmpfcidump.name, h1, h2, norb, mol.nelectron, nuc=1.5)
+            result = fcidump.read(tmpfcidump.name)
+            self.assertEqual(result['NORB'], norb)
+            self.assertEqual(result['NELEC'], mol.nelectron)
+            self.assertAlmostEqual(result['ECORE'], 1.5, 12)
+            self.assertAlmostEqual(abs(numpy.tril(result['H1'] - h1)).max(), 0, 12)
+            self.assertAlmostEqual(abs(result['H2'] - ao2mo.restore(8, h2, norb)).max(), 0, 12)
+    def test_read_irregular_lines(self):
+        head = ' &FCI NORB=2,NELEC=2,MS2=0,\n ORBSYM=1,1,\n ISYM=1,\n &END\n'
+        tmpfcidump = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+        with open(tmpfcidump.name, 'w') as f:
+            f.write(head)
+            f.write(' 0.5 1 1 1 1\n 0.2 2 1 1 1 0\n\n -1.0 1 1 0 0\n'
+                    ' -0.4 2 2 0 0\n 1.5 0 0 0 0\n')
+        result = fcidump.read(tmpfcidump.name)
+        self.assertAlmostEqual(abs(result['H2'] - [.5, .2, 0, 0, 0, 0]).max(), 0, 12)
+        self.assertAlmostEqual(abs(result['H1'] - numpy.diag([-1., -.4])).max(), 0, 12)
+        self.assertAlmostEqual(result['ECORE'], 1.5, 12)
+
+        with open(tmpfcidump.name, 'w') as f:
+            f.write(head)
+            f.write(' 0.5 1 1 1 1\n 0.2 2 1 1\n 1.5 0 0 0 0\n')
+        self.assertRaises(ValueError, fcidump.read, tmpfcidump.name)
+
 if __name__ == "__main__":
     print("Full Tests for fcidump")
     unittest.main()